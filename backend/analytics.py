@@ -0,0 +1,213 @@
+import numpy as np
+
+# Pickup grid used by the per-cell rollups (about 1 km)
+ANALYTICS_CELL_DEGREES = 0.01
+
+MEASURES = ['trips', 'duration_sum', 'distance_sum', 'fare_sum', 'fare_distance_sum']
+
+# Trip columns the rollups are computed from (fare_amount only when the source has it)
+ROLLUP_COLUMNS = ['pickup_datetime', 'pickup_latitude', 'pickup_longitude', 'trip_duration', 'distance_km']
+
+# Small batches (one per trip store partition, say) are held until this many
+# rows are waiting and rolled up together, since each rollup has a fixed cost
+FOLD_ROWS = 250000
+
+# Most cells one /api/analytics/cells request returns
+MAX_CELL_LIMIT = 5000
+
+HOURLY_KEYS = ['pickup_date', 'hour']
+CELL_KEYS = ['hour_of_week', 'month', 'cell_row', 'cell_col']
+
+# Rows are added onto what is stored, so rollups of separate batches combine
+UPSERT_HOURLY_SQL = '''
+    INSERT INTO trip_rollup_hourly
+    (pickup_date, hour, trips, duration_sum, distance_sum, fare_sum, fare_distance_sum)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(pickup_date, hour) DO UPDATE SET
+        trips = trips + excluded.trips,
+        duration_sum = duration_sum + excluded.duration_sum,
+        distance_sum = distance_sum + excluded.distance_sum,
+        fare_sum = fare_sum + excluded.fare_sum,
+        fare_distance_sum = fare_distance_sum + excluded.fare_distance_sum
+'''
+
+UPSERT_CELLS_SQL = '''
+    INSERT INTO trip_rollup_cells
+    (hour_of_week, month, cell_row, cell_col, trips, duration_sum, distance_sum, fare_sum, fare_distance_sum)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(hour_of_week, month, cell_row, cell_col) DO UPDATE SET
+        trips = trips + excluded.trips,
+        duration_sum = duration_sum + excluded.duration_sum,
+        distance_sum = distance_sum + excluded.distance_sum,
+        fare_sum = fare_sum + excluded.fare_sum,
+        fare_distance_sum = fare_distance_sum + excluded.fare_distance_sum
+'''
+
+# Averages from the stored sums; speed is total distance over total time
+METRICS_SQL = '''
+    SUM(trips) AS trips,
+    SUM(distance_sum) * 3600.0 / NULLIF(SUM(duration_sum), 0) AS avg_speed_kmh,
+    SUM(duration_sum) / NULLIF(SUM(trips), 0) AS avg_duration_s,
+    SUM(distance_sum) / NULLIF(SUM(trips), 0) AS avg_distance_km,
+    SUM(fare_sum) / NULLIF(SUM(fare_distance_sum), 0) AS fare_per_km
+'''
+
+# Monday 00:00 is hour_of_week 0, like pandas' dayofweek
+HOUR_OF_WEEK_SQL = "((CAST(strftime('%w', pickup_date) AS INTEGER) + 6) % 7) * 24 + hour"
+
+def rollup_trips(df):
+    """Hourly and per-cell sums for a frame of cleaned trips with derived features"""
+    # Only the ingest builds rollups; the API reads them without loading pandas
+    import pandas as pd
+    pickup = pd.to_datetime(df['pickup_datetime'])
+    distance = df['distance_km'].to_numpy()
+    if 'fare_amount' in df.columns:
+        fare = df['fare_amount'].to_numpy(dtype=np.float64)
+        has_fare = ~np.isnan(fare)
+    else:
+        fare = np.zeros(len(df))
+        has_fare = np.zeros(len(df), dtype=bool)
+
+    trips = pd.DataFrame({
+        'pickup_date': pickup.dt.strftime('%Y-%m-%d'),
+        'month': pickup.dt.strftime('%Y-%m'),
+        'hour': pickup.dt.hour.astype('int16'),
+        'hour_of_week': (pickup.dt.dayofweek * 24 + pickup.dt.hour).astype('int16'),
+        'cell_row': np.floor(df['pickup_latitude'].to_numpy() / ANALYTICS_CELL_DEGREES).astype('int32'),
+        'cell_col': np.floor(df['pickup_longitude'].to_numpy() / ANALYTICS_CELL_DEGREES).astype('int32'),
+        'trips': 1,
+        'duration_sum': df['trip_duration'].to_numpy(dtype=np.float64),
+        'distance_sum': distance,
+        'fare_sum': np.where(has_fare, fare, 0.0),
+        'fare_distance_sum': np.where(has_fare, distance, 0.0)
+    })
+    hourly = trips.groupby(HOURLY_KEYS, sort=False)[MEASURES].sum().reset_index()
+    cells = trips.groupby(CELL_KEYS, sort=False)[MEASURES].sum().reset_index()
+    return hourly, cells
+
+class TripRollups:
+    """Rollup sums accumulated across ingest chunks"""
+    def __init__(self):
+        self.hourly = []
+        self.cells = []
+        self.pending = []  # batches not rolled up yet
+        self.pending_rows = 0
+
+    def add(self, df):
+        if len(df) == 0:
+            return
+        columns = [column for column in ROLLUP_COLUMNS + ['fare_amount'] if column in df.columns]
+        self.pending.append(df[columns])
+        self.pending_rows += len(df)
+        if self.pending_rows >= FOLD_ROWS:
+            self.fold()
+
+    def fold(self):
+        """Roll up the waiting batches in one pass"""
+        import pandas as pd
+        if not self.pending:
+            return
+        batch = self.pending[0] if len(self.pending) == 1 else pd.concat(self.pending, ignore_index=True)
+        self.pending, self.pending_rows = [], 0
+        hourly, cells = rollup_trips(batch)
+        self.hourly.append(hourly)
+        self.cells.append(cells)
+        # Fold chunk results together before they outgrow the rollups themselves
+        if len(self.cells) > 16:
+            self.compact()
+
+    def compact(self):
+        import pandas as pd
+        self.fold()
+        if self.hourly:
+            self.hourly = [pd.concat(self.hourly).groupby(HOURLY_KEYS, sort=False)[MEASURES].sum().reset_index()]
+            self.cells = [pd.concat(self.cells).groupby(CELL_KEYS, sort=False)[MEASURES].sum().reset_index()]
+
+    def rows(self):
+        """(hourly rows, cell rows) ready for the upsert statements"""
+        self.compact()
+        if not self.hourly:
+            return [], []
+        hourly = self.hourly[0][HOURLY_KEYS + MEASURES]
+        cells = self.cells[0][CELL_KEYS + MEASURES]
+        return list(hourly.itertuples(index=False, name=None)), list(cells.itertuples(index=False, name=None))
+
+    def statements(self, replace=True):
+        """bulk_write statements storing the rollups, replacing what is stored unless replace=False"""
+        hourly, cells = self.rows()
+        statements = []
+        if replace:
+            statements += [('DELETE FROM trip_rollup_hourly', [()]), ('DELETE FROM trip_rollup_cells', [()])]
+        return statements + [(UPSERT_HOURLY_SQL, hourly), (UPSERT_CELLS_SQL, cells)]
+
+    def store(self, db, replace=True):
+        """Write the accumulated rollups in one transaction and return the number of rows"""
+        statements = self.statements(replace)
+        db.bulk_write(statements)
+        return len(statements[-2][1]) + len(statements[-1][1])
+
+def date_conditions(column, start, end):
+    conditions, params = [], []
+    if start:
+        conditions.append(f'{column} >= ?')
+        params.append(start)
+    if end:
+        conditions.append(f'{column} <= ?')
+        params.append(end)
+    return conditions, params
+
+def metrics_row(row):
+    return {
+        'trips': row['trips'],
+        'avg_speed_kmh': round(row['avg_speed_kmh'], 2) if row['avg_speed_kmh'] is not None else None,
+        'avg_duration_s': round(row['avg_duration_s'], 1) if row['avg_duration_s'] is not None else None,
+        'avg_distance_km': round(row['avg_distance_km'], 3) if row['avg_distance_km'] is not None else None,
+        'fare_per_km': round(row['fare_per_km'], 2) if row['fare_per_km'] is not None else None
+    }
+
+def hourly_profile(db, start_date=None, end_date=None, by='hour'):
+    """Trip metrics per hour of day (by='hour') or hour of week for an inclusive date range"""
+    bucket = 'hour' if by == 'hour' else HOUR_OF_WEEK_SQL
+    conditions, params = date_conditions('pickup_date', start_date, end_date)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    rows = db.execute_query(f'''
+        SELECT {bucket} AS bucket, {METRICS_SQL}
+        FROM trip_rollup_hourly
+        {where}
+        GROUP BY bucket
+        ORDER BY bucket
+    ''', params)
+    return [dict({by: row['bucket']}, **metrics_row(row)) for row in rows]
+
+def cell_profile(db, hour_of_week=None, hour=None, start_date=None, end_date=None, min_trips=1, limit=500):
+    """Trip metrics per pickup cell, optionally for one hour of week or hour of day.
+
+    Cell rollups are kept per month, so date ranges apply at month granularity.
+    """
+    conditions, params = date_conditions(
+        'month', start_date[:7] if start_date else None, end_date[:7] if end_date else None)
+    if hour_of_week is not None:
+        conditions.append('hour_of_week = ?')
+        params.append(hour_of_week)
+    elif hour is not None:
+        conditions.append('hour_of_week % 24 = ?')
+        params.append(hour)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    rows = db.execute_query(f'''
+        SELECT cell_row, cell_col, {METRICS_SQL}
+        FROM trip_rollup_cells
+        {where}
+        GROUP BY cell_row, cell_col
+        HAVING SUM(trips) >= ?
+        ORDER BY SUM(trips) DESC
+        LIMIT ?
+    ''', params + [min_trips, limit])
+    return [
+        dict({
+            'cell': [row['cell_row'], row['cell_col']],
+            'lat': round((row['cell_row'] + 0.5) * ANALYTICS_CELL_DEGREES, 5),
+            'lng': round((row['cell_col'] + 0.5) * ANALYTICS_CELL_DEGREES, 5)
+        }, **metrics_row(row))
+        for row in rows
+    ]
@@ -1,103 +1,277 @@
-from flask import Flask, jsonify, request
+import time
+
+# Taken before anything else is imported so the import stage is measured
+IMPORT_START = time.perf_counter()
+
+from flask import Blueprint, Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
+from Backend import metrics
+from Backend.analytics import hourly_profile, cell_profile, MAX_CELL_LIMIT
+from Backend.availability_batch import BatchQuery, batch_nearest
+from Backend.availability_cache import AvailabilityCache, DEFAULT_MAX_ENTRIES, DEFAULT_TTL_SECONDS
+from Backend.availability_stream import AvailabilityHub, DEFAULT_POLL_INTERVAL
 from Backend.database import Database
-from Backend.data_processor import DataProcessor
+from Backend.eta import EtaModel, DEFAULT_ETA_DIR
+from Backend.fleet_store import FleetStore, FleetSnapshot, FLEET_QUERY
+from Backend.geo import bounding_box, NYC_BOUNDS
+from Backend.heatmap import tile_level, cell_box, level_degrees, pickup_counts, driver_counts, tile_cells, TILE_LEVELS
+from Backend.jobs import JobRunner, JobConflict
+from Backend.responses import check_format, compress, decode_cursor, dumps, packb, page, snapshot_etag
+from Backend.location_buffer import LocationBuffer, DEFAULT_MAX_PENDING, DEFAULT_FLUSH_INTERVAL
+from Backend.stats import StatsAggregator, DEFAULT_MAX_STALENESS, time_slot
+from datetime import datetime
+import cProfile
+import json
 import math
+import numpy as np
 import os
 
-app = Flask(__name__)
-CORS(app)
+IMPORT_SECONDS = time.perf_counter() - IMPORT_START
+
+STARTUP_SECONDS = metrics.gauge(
+    'app_startup_seconds', 'Time this worker spent starting up, by stage', ['stage'])
+
+api = Blueprint('api', __name__)
+
+# Shared services, built by create_app()
+db = None
+eta_path = None
+eta_model = None
+job_runner = None
+location_buffer = None
+fleet_store = None
+availability_cache = None
+availability_hub = None
+stats_aggregator = None
+
+def create_app():
+    """Build the Flask app and its services.
+    
+    Workers start with the read path only: pandas and the ingest pipeline are
+    imported by the first POST /api/data/process. Schema migrations run here
+    once per database version rather than on every import. Each stage is
+    timed into app_startup_seconds.
+    """
+    global db, eta_path, eta_model, job_runner, location_buffer
+    global fleet_store, availability_cache, availability_hub, stats_aggregator
+    
+    start = time.perf_counter()
+    db = Database(migrate=False)
+    migrated = db.migrate()
+    migrate_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    eta_path = os.environ.get('ETA_MODEL_DIR', DEFAULT_ETA_DIR)
+    
+    # Travel times learned from the trips, rebuilt by every ingest
+    eta_model = EtaModel(eta_path)
+    
+    # Ingests run in the background, one at a time across all server processes
+    job_runner = JobRunner(load_data_processor, lock_path=os.environ.get('INGEST_LOCK_FILE', 'ingest.lock'))
+    
+    # Live GPS pings are coalesced per driver and written in group commits
+    location_buffer = LocationBuffer(
+        db,
+        max_pending=int(os.environ.get('LOCATION_MAX_PENDING', DEFAULT_MAX_PENDING)),
+        flush_interval=float(os.environ.get('LOCATION_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL))
+    )
+    
+    # Current driver positions in NumPy columns, kept in step with driver_locations
+    fleet_store = FleetStore(db)
+    
+    # Availability candidates cached per grid cell, invalidated as drivers move
+    availability_cache = AvailabilityCache(
+        db,
+        fleet_store,
+        max_entries=int(os.environ.get('AVAILABILITY_CACHE_SIZE', DEFAULT_MAX_ENTRIES)),
+        ttl=float(os.environ.get('AVAILABILITY_CACHE_TTL', DEFAULT_TTL_SECONDS))
+    )
+    
+    # Open availability streams share one change poller
+    availability_hub = AvailabilityHub(
+        db, poll_interval=float(os.environ.get('STREAM_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)))
+    
+    # Dashboard stats are served from memory, at most this many seconds stale
+    stats_aggregator = StatsAggregator(
+        db, max_staleness=float(os.environ.get('STATS_MAX_STALENESS', DEFAULT_MAX_STALENESS))
+    )
+    
+    app = Flask(__name__)
+    CORS(app)
+    app.register_blueprint(api)
+    services_seconds = time.perf_counter() - start
+    
+    STARTUP_SECONDS.set(IMPORT_SECONDS, stage='import')
+    STARTUP_SECONDS.set(migrate_seconds, stage='migrate')
+    STARTUP_SECONDS.set(services_seconds, stage='services')
+    STARTUP_SECONDS.set(time.perf_counter() - IMPORT_START, stage='total')
+    print(f"Worker {os.getpid()} started in {time.perf_counter() - IMPORT_START:.3f}s "
+          f"(imports {IMPORT_SECONDS:.3f}s, {migrated} migrations in {migrate_seconds:.3f}s)")
+    return app
+
+def load_data_processor():
+    """Import and build the ingest pipeline (pandas, pyarrow) on first use"""
+    start = time.perf_counter()
+    from Backend.data_processor import DataProcessor
+    from Backend.trip_store import TripStore
+    
+    processor = DataProcessor(
+        db, TripStore(os.environ.get('TRIP_STORE_DIR', 'trip_store')),
+        driver_key=os.environ.get('DRIVER_KEY', 'vendor_id').split(','),
+        workers=int(os.environ.get('PROFILE_WORKERS', 0)) or None,
+        seed=int(os.environ['PROFILE_SEED']) if 'PROFILE_SEED' in os.environ else None,
+        max_drivers=int(os.environ['MAX_DRIVERS']) if 'MAX_DRIVERS' in os.environ else None,
+        eta_path=eta_path
+    )
+    STARTUP_SECONDS.set(time.perf_counter() - start, stage='ingest_load')
+    return processor
+
+def __getattr__(name):
+    # "from Backend.app import app" and gunicorn's "Backend.app:app" still work,
+    # building the app on first access
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+REQUEST_SECONDS = metrics.histogram(
+    'http_request_duration_seconds', 'HTTP request latency', ['method', 'endpoint', 'status'])
 
-# Initialize database and data processor
-db = Database()
-data_processor = DataProcessor(db)
+# Per-request cProfile dumps, opt-in: set ENABLE_PROFILING=1 and send "X-Profile: 1"
+PROFILING_ENABLED = os.environ.get('ENABLE_PROFILING') == '1'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
 
-@app.route('/')
+@api.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if PROFILING_ENABLED and request.headers.get('X-Profile') == '1':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@api.after_app_request
+def record_request_metrics(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_path = os.path.join(PROFILE_DIR, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{request.endpoint}.prof")
+        profiler.dump_stats(profile_path)
+        response.headers['X-Profile-File'] = profile_path
+    
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - g.request_start,
+        method=request.method,
+        endpoint=request.url_rule.rule if request.url_rule else 'unmatched',
+        status=response.status_code
+    )
+    return response
+
+@api.after_app_request
+def compress_response(response):
+    return compress(response, request.accept_encodings)
+
+@api.route('/')
 def hello():
     return jsonify({
         'message': 'NYC Taxi Driver Availability API - Real Data',
         'status': 'running',
         'endpoints': {
-            '/api/drivers/availability': 'GET - Get available drivers with real NYC data',
+            '/api/drivers/availability': 'GET - Get available drivers with real NYC data, nearest first (?limit=k, ?date=YYYY-MM-DD, ?time_range=morning|afternoon|evening|night, ?format=json|columns|msgpack, ?page_size=&cursor=, If-None-Match)',
+            '/api/drivers/availability/batch': 'POST - Nearest available drivers for many origins at once ({"origins": [{"id", "lat", "lng", "radius", "vehicle_type"}], "limit": k, "assign": true for no driver offered twice})',
+            '/api/drivers/availability/stream': 'GET - Server-Sent Events: snapshot, then enter/leave/update deltas',
+            '/api/drivers/locations': 'POST - Bulk live location pings (driver_id, lat, lng, available, eta)',
             '/api/stats/summary': 'GET - Get dashboard statistics',
-            '/api/data/process': 'POST - Process real NYC taxi data',
-            '/api/data/status': 'GET - Get data processing status'
+            '/api/analytics/hourly': 'GET - Average speed, duration, distance and fare per km by hour (?by=hour_of_week, ?start_date=&end_date=)',
+            '/api/analytics/cells': 'GET - The same metrics per pickup grid cell (?hour= or ?hour_of_week=, ?start_date=&end_date=)',
+            '/api/heatmap/tiles': 'GET - Pickup counts and available drivers per grid cell in a bounding box (?min_lat=&max_lat=&min_lng=&max_lng=, ?zoom=, ?layers=pickups,drivers)',
+            '/api/data/process': 'POST - Start a background ingest of real NYC taxi data (?mode=streaming for chunked ingest, ?mode=incremental for new rows only, ?wait=1 to block)',
+            '/api/data/status': 'GET - Get data processing status, the latest ingest job and source watermarks',
+            '/api/data/jobs/<job_id>': 'GET - Get ingest job progress',
+            '/api/data/jobs/<job_id>/cancel': 'POST - Cancel a running ingest job',
+            '/api/metrics': 'GET - Prometheus metrics'
         }
     })
 
-@app.route('/api/drivers/availability', methods=['GET'])
+@api.route('/api/drivers/availability', methods=['GET'])
 def get_driver_availability():
     try:
         # Get query parameters
         date = request.args.get('date', '')
         time_range = request.args.get('time_range', 'all')
-        location_lat = float(request.args.get('lat', '40.7128'))
-        location_lng = float(request.args.get('lng', '-74.0060'))
-        radius_km = float(request.args.get('radius', 5))
         vehicle_type = request.args.get('vehicle_type', 'all')
+        cursor = request.args.get('cursor') or None
         
-        # Build base query
-        query = """
-        SELECT d.driver_id, d.name, d.vehicle_type, d.license_plate, d.rating, d.total_trips,
-               dl.latitude, dl.longitude, dl.last_update,
-               CASE 
-                   WHEN dl.is_available = 1 THEN 'available'
-                   ELSE 'unavailable'
-               END as status,
-               dl.eta_minutes
-        FROM drivers d
-        JOIN driver_locations dl ON d.driver_id = dl.driver_id
-        WHERE dl.last_update >= datetime('now', '-30 minutes')
-        """
-        
-        params = []
-        
-        # Add vehicle type filter
-        if vehicle_type != 'all':
-            query += " AND d.vehicle_type = ?"
-            params.append(vehicle_type)
-        
-        query += " ORDER BY dl.last_update DESC"
-        
-        # Execute query
-        drivers_data = db.execute_query(query, params)
-        
-        # Process results and calculate distances
-        drivers = []
-        for driver in drivers_data:
-            distance = data_processor.calculate_distance(
-                location_lat, location_lng,
-                driver['latitude'], driver['longitude']
-            )
-            
-            # Only include drivers within the search radius
-            if distance <= radius_km:
-                drivers.append({
-                    'id': driver['driver_id'],
-                    'name': driver['name'],
-                    'vehicle_type': driver['vehicle_type'],
-                    'vehicle_name': get_vehicle_name(driver['vehicle_type']),
-                    'license_plate': driver['license_plate'],
-                    'rating': driver['rating'],
-                    'total_trips': driver['total_trips'],
-                    'latitude': driver['latitude'],
-                    'longitude': driver['longitude'],
-                    'last_update': driver['last_update'],
-                    'status': driver['status'],
-                    'eta_minutes': driver['eta_minutes'],
-                    'distance_km': round(distance, 2)
-                })
+        try:
+            location_lat, location_lng, radius_km = search_point()
+            limit = number_arg('limit', kind=int, minimum=1)
+            page_size = number_arg('page_size', kind=int, minimum=1)
+            slot = time_slot(date, time_range)
+            output_format = check_format(request.args.get('format', 'json'))
+            if cursor is not None:
+                decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
-        return jsonify({
-            'success': True,
-            'drivers': drivers,
-            'count': len(drivers),
-            'search_location': {
-                'lat': location_lat,
-                'lng': location_lng,
-                'radius_km': radius_km
+        # Unchanged polls get a 304: the ETag covers the fleet snapshot (the last
+        # location row applied and the drivers version), the ETA model, the ETA hour and the query
+        snapshot = fleet_store.sync()
+        etag = snapshot_etag(snapshot.version, eta_model.version(), eta_hour(slot), sorted(request.args.items(multi=True)))
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+        
+        # Nearby searches share candidates cached per grid cell
+        key = availability_cache.key(location_lat, location_lng, radius_km, vehicle_type, slot)
+        found = availability_cache.get(key)
+        if found is None:
+            found = availability_cache.put(key, *find_drivers(*availability_cache.area(key), vehicle_type, slot, snapshot))
+        store, candidates = found
+        
+        # Exact distances for this point in one vectorized pass, nearest first (k-nearest with limit)
+        rows, distances = store.nearest(location_lat, location_lng, radius_km, candidates, limit)
+        rows, distances, next_cursor = page(store, rows, distances, cursor, page_size)
+        
+        # Trip-time ETAs for the hour of the search; stored ETAs until a model is built
+        eta = eta_model.estimate_minutes(
+            location_lat, location_lng, store.latitude[rows], store.longitude[rows],
+            distances, eta_hour(slot), store.eta_minutes[rows])
+        
+        search_location = {
+            'lat': location_lat,
+            'lng': location_lng,
+            'radius_km': radius_km,
+            'limit': limit,
+            'date': slot[0][:10],
+            'time_range': time_range
+        }
+        if output_format == 'json':
+            # Drivers are written straight from the fleet store columns
+            response = Response(
+                f'{{"success":true,"count":{len(rows)},"search_location":{dumps(search_location)},'
+                f'"next_cursor":{dumps(next_cursor)},"drivers":{store.to_json(rows, distances, eta)}}}',
+                mimetype='application/json'
+            )
+        else:
+            # One array per field, so key names aren't repeated for every driver
+            body = {
+                'success': True,
+                'count': len(rows),
+                'search_location': search_location,
+                'next_cursor': next_cursor,
+                'drivers': store.columns(rows, distances, eta)
             }
-        })
+            if output_format == 'msgpack':
+                response = Response(packb(body), mimetype='application/x-msgpack')
+            else:
+                response = Response(dumps(body), mimetype='application/json')
+        
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     
     except Exception as e:
         return jsonify({
@@ -105,40 +279,225 @@ def get_driver_availability():
             'error': str(e)
         }), 500
 
-@app.route('/api/stats/summary', methods=['GET'])
-def get_stats_summary():
+def eta_hour(slot):
+    """Hour of day to estimate travel times for: now for a live slot, else the slot's start"""
+    now = datetime.now()
+    if slot[0] <= now.isoformat() < slot[1]:
+        return now.hour
+    return datetime.fromisoformat(slot[0]).hour
+
+def find_drivers(location_lat, location_lng, radius_km, vehicle_type, slot, live):
+    """Fleet snapshot and rows of the drivers inside the bounding box of a search, as of a time slot"""
+    return find_drivers_in_box(bounding_box(location_lat, location_lng, radius_km), vehicle_type, slot, live)
+
+def find_drivers_in_box(box, vehicle_type, slot, live):
+    """Fleet snapshot and rows of the drivers inside a bounding box, as of a time slot.
+    
+    A slot that contains the current time gets the live view from the fleet
+    store's snapshot: current positions reported in the last 30 minutes (and
+    since the slot began). A past slot gets each driver's last position
+    reported within it, loaded from the location history into a snapshot of
+    its own. Nobody has reported for a future slot yet.
+    """
+    now = datetime.now().isoformat()
+    if slot[0] > now:
+        return FleetSnapshot(), np.zeros(0, dtype=np.int64)
+    
+    if slot[1] > now:
+        return live, live.search_box(box, vehicle_type, since=slot[0])
+    
+    # is_available IN (0, 1) lets idx_locations_availability serve the time range
+    query = FLEET_QUERY.format(table='driver_locations') + """
+    WHERE dl.id IN (
+            SELECT MAX(id) FROM driver_locations
+            WHERE is_available IN (0, 1) AND last_update >= ? AND last_update < ?
+            GROUP BY driver_id
+        )
+      AND dl.latitude BETWEEN ? AND ?
+      AND dl.longitude BETWEEN ? AND ?
+    """
+    
+    # Bounding-box prefilter so the coordinate indexes narrow the scan
+    params = [slot[0], slot[1], box['min_lat'], box['max_lat'], box['min_lng'], box['max_lng']]
+    
+    # Add vehicle type filter
+    if vehicle_type != 'all':
+        query += " AND d.vehicle_type = ?"
+        params.append(vehicle_type)
+    
+    store = FleetSnapshot.from_rows(db.execute_query(query, params))
+    return store, np.arange(store.size)
+
+@api.route('/api/drivers/availability/batch', methods=['POST'])
+def get_batch_availability():
+    try:
+        payload = request.get_json(force=True, silent=True)
+        query = BatchQuery(payload)
+        time_range = payload.get('time_range', 'all')
+        slot = time_slot(payload.get('date', ''), time_range)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
     try:
-        # Get total drivers
-        total_result = db.execute_query("SELECT COUNT(*) as count FROM drivers")
-        total_drivers = total_result[0][0] if total_result else 0
+        # One snapshot of the fleet around every origin, available drivers only
+        store, rows = find_drivers_in_box(query.box(), query.vehicle_type(), slot, fleet_store.sync())
+        rows = rows[store.is_available[rows]]
+        
+        hour = eta_hour(slot)
+        results = []
+        for i, (origin_rows, distances) in enumerate(batch_nearest(store, rows, query)):
+            lat, lng = float(query.lats[i]), float(query.lngs[i])
+            eta = eta_model.estimate_minutes(lat, lng, store.latitude[origin_rows], store.longitude[origin_rows],
+                                             distances, hour, store.eta_minutes[origin_rows])
+            results.append(
+                f'{{"id":{json.dumps(query.ids[i])},"lat":{lat!r},"lng":{lng!r},"count":{len(origin_rows)},'
+                f'"drivers":{store.to_json(origin_rows, distances, eta)}}}'
+            )
         
-        # Get available drivers
-        available_result = db.execute_query("""
-            SELECT COUNT(DISTINCT driver_id) as count 
-            FROM driver_locations 
-            WHERE is_available = 1 AND last_update >= datetime('now', '-30 minutes')
-        """)
-        available_drivers = available_result[0][0] if available_result else 0
+        return Response(
+            f'{{"success":true,"count":{len(results)},"limit":{query.limit},'
+            f'"assigned":{json.dumps(query.assign)},"date":"{slot[0][:10]}","time_range":{json.dumps(time_range)},'
+            f'"candidates":{len(rows)},"origins":[{",".join(results)}]}}',
+            mimetype='application/json'
+        )
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@api.route('/api/drivers/availability/stream', methods=['GET'])
+def stream_driver_availability():
+    try:
+        location_lat, location_lng, radius_km = search_point()
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    try:
+        vehicle_type = request.args.get('vehicle_type', 'all')
+        subscription = availability_hub.subscribe(location_lat, location_lng, radius_km, vehicle_type)
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    
+    def events():
+        try:
+            yield from subscription.events()
+        finally:
+            availability_hub.unsubscribe(subscription)
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # let nginx pass events through unbuffered
+    })
+
+@api.route('/api/drivers/locations', methods=['POST'])
+def update_driver_locations():
+    try:
+        payload = request.get_json(force=True, silent=True)
+        pings = payload.get('pings') if isinstance(payload, dict) else payload
+        if not isinstance(pings, list):
+            return jsonify({
+                'success': False,
+                'error': 'Expected a JSON list of pings or {"pings": [...]}'
+            }), 400
         
-        # Get average ETA
-        avg_eta_result = db.execute_query("""
-            SELECT AVG(eta_minutes) as avg_eta 
-            FROM driver_locations 
-            WHERE last_update >= datetime('now', '-30 minutes')
-        """)
-        avg_eta = round(avg_eta_result[0][0] or 6.5, 1) if avg_eta_result else 6.5
+        accepted, rejected = location_buffer.add(pings)
         
-        # Calculate coverage percentage
-        coverage = round((available_drivers / total_drivers * 100) if total_drivers > 0 else 0, 1)
+        # ?flush=1 waits for the write instead of leaving it to the flusher
+        if request.args.get('flush') == '1':
+            location_buffer.flush()
         
         return jsonify({
             'success': True,
-            'stats': {
-                'total_drivers': total_drivers,
-                'available_drivers': available_drivers,
-                'avg_eta_minutes': avg_eta,
-                'coverage_percentage': coverage
-            }
+            'accepted': accepted,
+            'rejected': rejected,
+            'buffer': location_buffer.status()
+        }), 202
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@api.route('/api/stats/summary', methods=['GET'])
+def get_stats_summary():
+    try:
+        return jsonify({
+            'success': True,
+            'stats': stats_aggregator.summary()
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@api.route('/api/analytics/hourly', methods=['GET'])
+def get_hourly_analytics():
+    try:
+        start_date, end_date = analytics_date_range()
+        by = request.args.get('by', 'hour')
+        if by not in ('hour', 'hour_of_week'):
+            raise ValueError("by must be 'hour' or 'hour_of_week'")
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    try:
+        buckets = hourly_profile(db, start_date, end_date, by)
+        return jsonify({
+            'success': True,
+            'by': by,
+            'start_date': start_date,
+            'end_date': end_date,
+            'buckets': buckets
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@api.route('/api/analytics/cells', methods=['GET'])
+def get_cell_analytics():
+    try:
+        start_date, end_date = analytics_date_range()
+        hour = number_arg('hour', kind=int, minimum=0, maximum=23)
+        hour_of_week = number_arg('hour_of_week', kind=int, minimum=0, maximum=167)
+        min_trips = number_arg('min_trips', 1, kind=int, minimum=1)
+        limit = number_arg('limit', 500, kind=int, minimum=1, maximum=MAX_CELL_LIMIT)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    try:
+        cells = cell_profile(db, hour_of_week, hour, start_date, end_date, min_trips, limit)
+        return jsonify({
+            'success': True,
+            'start_date': start_date,
+            'end_date': end_date,
+            'hour': hour,
+            'hour_of_week': hour_of_week,
+            'cells': cells,
+            'count': len(cells)
         })
     
     except Exception as e:
@@ -147,25 +506,143 @@ def get_stats_summary():
             'error': str(e)
         }), 500
 
-@app.route('/api/data/process', methods=['POST'])
+@api.route('/api/heatmap/tiles', methods=['GET'])
+def get_heatmap_tiles():
+    try:
+        box = {
+            name: number_arg(name, NYC_BOUNDS[name], minimum=-90 if 'lat' in name else -180,
+                             maximum=90 if 'lat' in name else 180)
+            for name in NYC_BOUNDS
+        }
+        zoom = number_arg('zoom', 11, kind=int, minimum=0, maximum=22)
+        layers = set(request.args.get('layers', 'pickups,drivers').split(','))
+        if box['min_lat'] >= box['max_lat'] or box['min_lng'] >= box['max_lng']:
+            raise ValueError('min_lat and min_lng must be below max_lat and max_lng')
+        if not layers <= {'pickups', 'drivers'}:
+            raise ValueError('layers must be pickups, drivers or both')
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    try:
+        # Pick the precomputed level matching the zoom, coarser if the box would have too many cells
+        level = tile_level(zoom, box)
+        pickups = pickup_counts(db, level, box) if 'pickups' in layers else {}
+        drivers = {}
+        if 'drivers' in layers:
+            snapshot = fleet_store.sync()
+            rows = snapshot.available(cell_box(box, level))
+            drivers = driver_counts(snapshot, rows, level, box)
+        cells = tile_cells(level, pickups, drivers)
+        return jsonify({
+            'success': True,
+            'zoom': zoom,
+            'level': level,
+            'levels': TILE_LEVELS,
+            'cell_degrees': level_degrees(level),
+            'bbox': box,
+            'cells': cells,
+            'count': len(cells)
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def number_arg(name, default=None, kind=float, minimum=None, maximum=None):
+    """A numeric query parameter (default when absent), raising ValueError when it doesn't parse or is out of range"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = kind(value)
+    except ValueError:
+        raise ValueError(f"{name} must be {'an integer' if kind is int else 'a number'}, got '{value}'")
+    if not math.isfinite(number):
+        raise ValueError(f"{name} must be a finite number, got '{value}'")
+    if minimum is not None and number < minimum:
+        raise ValueError(f"{name} must be at least {minimum}, got {value}")
+    if maximum is not None and number > maximum:
+        raise ValueError(f"{name} must be at most {maximum}, got {value}")
+    return number
+
+def search_point():
+    """Validated lat, lng and radius (km) query parameters of a driver search"""
+    lat = number_arg('lat', 40.7128, minimum=-90, maximum=90)
+    lng = number_arg('lng', -74.0060, minimum=-180, maximum=180)
+    radius_km = number_arg('radius', 5.0)
+    if not radius_km > 0:
+        raise ValueError(f'radius must be positive, got {radius_km}')
+    return lat, lng, radius_km
+
+def analytics_date_range():
+    """Validated start_date/end_date (YYYY-MM-DD) query parameters, either may be None.
+    
+    Dates are compared as text against the rollups' pickup_date, so they are
+    re-formatted zero-padded (2024-1-5 becomes 2024-01-05).
+    """
+    dates = []
+    for name in ('start_date', 'end_date'):
+        value = request.args.get(name) or None
+        if value is not None:
+            try:
+                value = datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f"{name} must be a date in YYYY-MM-DD format, got '{value}'")
+        dates.append(value)
+    return dates
+
+@api.route('/api/data/process', methods=['POST'])
 def process_data():
     try:
-        csv_path = 'train.csv'
+        # A CSV file, or for incremental ingests also a directory of CSV files
+        csv_path = os.environ.get('INGEST_SOURCE', 'train.csv')
         if not os.path.exists(csv_path):
             return jsonify({
                 'success': False,
                 'error': f'NYC taxi dataset not found: {csv_path}. Please ensure train.csv is in the backend directory.'
             }), 400
         
-        print("Starting NYC taxi data processing...")
-        result = data_processor.process_nyc_data(csv_path)
+        mode = request.args.get('mode', 'full')
+        if mode not in ('full', 'streaming', 'incremental'):
+            mode = 'full'
+        if mode != 'incremental' and os.path.isdir(csv_path):
+            return jsonify({
+                'success': False,
+                'error': f'{csv_path} is a directory, which only ?mode=incremental can ingest'
+            }), 400
         
-        if result['success']:
-            print(f"Successfully processed {result['processed_records']} records into {result['drivers_created']} drivers")
-        else:
-            print(f"Data processing failed: {result['error']}")
-            
-        return jsonify(result)
+        params = {}
+        if mode != 'full' and 'chunksize' in request.args:
+            params['chunksize'] = int(request.args['chunksize'])
+        
+        try:
+            job = job_runner.submit(mode, csv_path, **params)
+        except JobConflict as e:
+            running = job_runner.latest()
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'job': running.to_dict() if running else None
+            }), 409
+        print(f"Started NYC taxi data processing job {job.id}")
+        
+        # ?wait=1 keeps the old blocking behaviour for scripts
+        if request.args.get('wait') == '1':
+            while job.active:
+                time.sleep(0.1)
+            return jsonify(dict(job.result or {'success': False, 'error': job.error}, job_id=job.id))
+        
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status_url': f'/api/data/jobs/{job.id}',
+            'job': job.to_dict()
+        }), 202
         
     except Exception as e:
         return jsonify({
@@ -173,20 +650,28 @@ def process_data():
             'error': str(e)
         }), 500
 
-@app.route('/api/data/status', methods=['GET'])
+@api.route('/api/data/status', methods=['GET'])
 def get_data_status():
     try:
         # Check if we have any data
         driver_count = db.execute_query("SELECT COUNT(*) as count FROM drivers")[0][0]
         location_count = db.execute_query("SELECT COUNT(*) as count FROM driver_locations")[0][0]
+        current_count = db.execute_query("SELECT COUNT(*) as count FROM driver_current_locations")[0][0]
+        latest_job = job_runner.latest()
         
         return jsonify({
             'success': True,
             'data_status': {
                 'drivers_in_database': driver_count,
                 'locations_in_database': location_count,
+                'current_locations_in_database': current_count,
                 'has_data': driver_count > 0
-            }
+            },
+            'ingest_progress': job_runner.processor.progress if job_runner.processor else None,
+            'location_buffer': location_buffer.status(),
+            'availability_cache': availability_cache.status(),
+            'ingest_job': latest_job.to_dict() if latest_job else None,
+            'ingest_sources': db.ingest_sources()
         })
         
     except Exception as e:
@@ -195,21 +680,54 @@ def get_data_status():
             'error': str(e)
         }), 500
 
-def get_vehicle_name(vehicle_type):
-    names = {
-        'standard': 'Standard Taxi',
-        'premium': 'Premium Sedan',
-        'suv': 'SUV',
-        'accessible': 'Accessible Vehicle'
-    }
-    return names.get(vehicle_type, vehicle_type)
+@api.route('/api/data/jobs/<job_id>', methods=['GET'])
+def get_ingest_job(job_id):
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': f'Unknown job: {job_id}'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job.to_dict()
+    })
+
+@api.route('/api/data/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_ingest_job(job_id):
+    if not job_runner.cancel(job_id):
+        return jsonify({
+            'success': False,
+            'error': f'No running job: {job_id}'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job_runner.get(job_id).to_dict()
+    }), 202
+
+@api.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
+    app = create_app()
     print("🚕 NYC Taxi Driver Availability API Starting...")
     print("📍 Endpoints:")
     print("   GET  /api/drivers/availability - Find available drivers")
+    print("   POST /api/drivers/availability/batch - Nearest drivers for many origins")
+    print("   GET  /api/drivers/availability/stream - Stream availability deltas (SSE)")
+    print("   POST /api/drivers/locations - Bulk live location pings")
     print("   GET  /api/stats/summary - Get dashboard statistics") 
-    print("   POST /api/data/process - Process real NYC taxi data")
+    print("   GET  /api/analytics/hourly - Speed/duration/distance/fare by hour")
+    print("   GET  /api/analytics/cells - The same metrics per pickup grid cell")
+    print("   GET  /api/heatmap/tiles - Pickup and driver density per grid cell")
+    print("   POST /api/data/process - Start a background ingest of real NYC taxi data")
     print("   GET  /api/data/status - Check data status")
+    print("   GET  /api/data/jobs/<job_id> - Ingest job progress")
+    print("   POST /api/data/jobs/<job_id>/cancel - Cancel an ingest job")
+    print("   GET  /api/metrics - Prometheus metrics")
     print("\n💡 First, run: POST /api/data/process to load your NYC taxi data")
+    print("💡 For high-concurrency read traffic: uvicorn Backend.asgi:app --workers 4")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
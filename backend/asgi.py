@@ -0,0 +1,208 @@
+import asyncio
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from Backend import metrics
+from Backend.database import POOL_SIZE
+
+# Requests run at most this many at a time, one per database pool connection
+DEFAULT_MAX_CONCURRENCY = POOL_SIZE
+
+# Requests waiting for a slot beyond this many are turned away with a 503
+DEFAULT_MAX_QUEUE = 512
+
+# Waiting longer than this for a slot also gets a 503
+DEFAULT_QUEUE_TIMEOUT = 2.0
+
+# The read endpoints served here; writes, ingest and SSE streams stay on the Flask app
+READ_PATHS = ('/api/drivers/availability', '/api/stats/summary', '/api/data/status', '/api/metrics')
+
+IN_FLIGHT = metrics.gauge('asgi_requests_in_flight', 'Requests running in the ASGI database pool')
+QUEUED = metrics.gauge('asgi_requests_queued', 'Requests waiting for a slot in the ASGI database pool')
+REJECTED = metrics.counter('asgi_requests_rejected_total', 'Requests turned away under load', ['reason'])
+QUEUE_SECONDS = metrics.histogram('asgi_queue_wait_seconds', 'Time requests waited for a pool slot')
+
+class Overloaded(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+class ConcurrencyLimiter:
+    """Admits max_concurrency requests at once with a bounded, time-limited queue behind them.
+
+    Waiting happens on the event loop, so queued requests cost a coroutine
+    rather than a thread. Past max_queue waiters, or after queue_timeout,
+    requests fail fast so clients back off instead of piling up.
+    """
+    def __init__(self, max_concurrency, max_queue, queue_timeout):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self.running = 0
+
+    async def acquire(self):
+        if self.semaphore.locked() and self.waiting >= self.max_queue:
+            raise Overloaded('queue_full')
+        start = time.perf_counter()
+        self.waiting += 1
+        QUEUED.set(self.waiting)
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded('queue_timeout')
+        finally:
+            self.waiting -= 1
+            QUEUED.set(self.waiting)
+        QUEUE_SECONDS.observe(time.perf_counter() - start)
+        self.running += 1
+        IN_FLIGHT.set(self.running)
+
+    def release(self):
+        self.running -= 1
+        IN_FLIGHT.set(self.running)
+        self.semaphore.release()
+
+def wsgi_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope, so the Flask views and hooks see the usual request"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+class AsgiApp:
+    """ASGI server for the read endpoints, over the same services as the Flask app.
+
+    The event loop holds the connections; each request's SQLite and NumPy
+    work runs on a bounded thread pool sized to the database connection
+    pool, through the Flask views themselves (with their ETags, compression
+    and metrics), so both modes return the same responses. A request only
+    takes a thread once admitted by the ConcurrencyLimiter, so thousands of
+    open connections cost coroutines rather than threads, and overload turns
+    into quick 503s with Retry-After instead of timeouts.
+
+        uvicorn Backend.asgi:app --workers 4
+    """
+    def __init__(self, flask_app, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 max_queue=DEFAULT_MAX_QUEUE, queue_timeout=DEFAULT_QUEUE_TIMEOUT):
+        self.flask_app = flask_app
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_concurrency, thread_name_prefix='asgi-db')
+        self.limiter = None  # made on the server's event loop
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.handle(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.limiter = ConcurrencyLimiter(self.max_concurrency, self.max_queue, self.queue_timeout)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle(self, scope, receive, send):
+        if self.limiter is None:
+            self.limiter = ConcurrencyLimiter(self.max_concurrency, self.max_queue, self.queue_timeout)
+        body = await read_body(receive)
+        if scope['method'] not in ('GET', 'HEAD', 'OPTIONS') or scope['path'] not in READ_PATHS:
+            await send_json(send, 404, {
+                'success': False,
+                'error': f"{scope['method']} {scope['path']} is not served in ASGI mode; "
+                         f"writes, ingest and streams are on the Flask app"
+            })
+            return
+
+        try:
+            await self.limiter.acquire()
+        except Overloaded as e:
+            REJECTED.inc(reason=e.reason)
+            await send_json(send, 503, {'success': False, 'error': 'Server busy, retry shortly'},
+                            [(b'retry-after', b'1')])
+            return
+        # The slot is freed when the thread finishes, even if the client has gone by then
+        future = asyncio.get_running_loop().run_in_executor(self.executor, self.dispatch, wsgi_environ(scope, body))
+        future.add_done_callback(lambda _: self.limiter.release())
+        status, headers, content = await asyncio.shield(future)
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else content})
+
+    def dispatch(self, environ):
+        """Run a request through the Flask app on a pool thread: (status, headers, body)"""
+        with self.flask_app.request_context(environ):
+            try:
+                response = self.flask_app.full_dispatch_request()
+            except Exception as e:
+                response = self.flask_app.handle_exception(e)
+            content = response.get_data()
+            headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                       for name, value in response.headers.items()]
+            response.close()
+        return response.status_code, headers, content
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode()
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), *headers
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
+
+def create_asgi_app():
+    """Build the Flask services and wrap them for an ASGI server"""
+    from Backend.app import create_app
+    return AsgiApp(
+        create_app(),
+        max_concurrency=int(os.environ.get('ASGI_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY)),
+        max_queue=int(os.environ.get('ASGI_MAX_QUEUE', DEFAULT_MAX_QUEUE)),
+        queue_timeout=float(os.environ.get('ASGI_QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT))
+    )
+
+def __getattr__(name):
+    # "uvicorn Backend.asgi:app" builds the app on first access, once per worker
+    if name == 'app':
+        globals()['app'] = create_asgi_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,191 @@
+import numpy as np
+from Backend.geo import EARTH_RADIUS_KM, haversine, bounding_box, unit_vectors
+
+MAX_ORIGINS = 1000
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 100
+
+# The origin x driver matrix is built this many origins, and at most cells, at a time (32 MB of float64)
+BLOCK_ORIGINS = 64
+BLOCK_CELLS = 4000000
+
+# Vehicle codes of an origin: any vehicle, or a type no driver has
+ANY_VEHICLE = -1
+NO_VEHICLE = -2
+
+class BatchQuery:
+    """Validated origins of a batch availability request, as arrays"""
+    def __init__(self, payload):
+        if not isinstance(payload, dict) or not isinstance(payload.get('origins'), list):
+            raise ValueError('Expected a JSON object with an "origins" list')
+        origins = payload['origins']
+        if not 0 < len(origins) <= MAX_ORIGINS:
+            raise ValueError(f'origins must hold between 1 and {MAX_ORIGINS} entries')
+
+        try:
+            self.limit = int(payload.get('limit', DEFAULT_LIMIT))
+            radius = float(payload.get('radius', 5))
+        except (TypeError, ValueError):
+            raise ValueError('limit and radius must be numbers')
+        if not 0 < self.limit <= MAX_LIMIT:
+            raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+        self.assign = bool(payload.get('assign', False))
+        vehicle_type = payload.get('vehicle_type', 'all')
+
+        self.ids = []
+        self.lats = np.zeros(len(origins), dtype=np.float64)
+        self.lngs = np.zeros(len(origins), dtype=np.float64)
+        self.radii = np.zeros(len(origins), dtype=np.float64)
+        self.vehicle_types = []
+        for i, origin in enumerate(origins):
+            try:
+                self.lats[i] = float(origin['lat'])
+                self.lngs[i] = float(origin['lng'])
+                self.radii[i] = float(origin.get('radius', radius))
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f'Origin {i} needs numeric lat and lng')
+            if not (-90 <= self.lats[i] <= 90 and -180 <= self.lngs[i] <= 180) or not self.radii[i] > 0:
+                raise ValueError(f'Origin {i} is out of range')
+            self.ids.append(origin.get('id', i))
+            self.vehicle_types.append(origin.get('vehicle_type', vehicle_type))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def box(self):
+        """Bounding box around every origin's search radius"""
+        boxes = [bounding_box(lat, lng, radius) for lat, lng, radius in
+                 zip(self.lats.tolist(), self.lngs.tolist(), self.radii.tolist())]
+        return {
+            'min_lat': min(box['min_lat'] for box in boxes), 'max_lat': max(box['max_lat'] for box in boxes),
+            'min_lng': min(box['min_lng'] for box in boxes), 'max_lng': max(box['max_lng'] for box in boxes)
+        }
+
+    def vehicle_type(self):
+        """The vehicle type every origin asks for, or 'all' when they differ"""
+        types = set(self.vehicle_types)
+        return types.pop() if len(types) == 1 else 'all'
+
+    def vehicle_codes(self, store):
+        return np.array([
+            ANY_VEHICLE if name == 'all' else store.vehicle_codes.get(name, NO_VEHICLE)
+            for name in self.vehicle_types
+        ], dtype=np.int64)
+
+def nearest_candidates(store, rows, query, width, origins=None):
+    """Each origin's (or the given origins') nearest rows within its radius and of its vehicle type.
+
+    Returns rows and distances of shape [origins, width], nearest first and
+    padded with -1 and inf, plus whether each origin had more than width
+    matching drivers. Origins go in blocks of neighbours by latitude, each
+    against just the drivers inside the block's bounding box. A block ranks
+    them by 1 - cos(central angle), one matrix product of unit vectors, and
+    Haversine distances are computed for the picked pairs only.
+    """
+    origins = np.arange(len(query)) if origins is None else origins
+    width = min(width, len(rows))
+    nearest_rows = np.full((len(origins), width), -1, dtype=np.int64)
+    nearest_distances = np.full((len(origins), width), np.inf, dtype=np.float64)
+    more = np.zeros(len(origins), dtype=np.bool_)
+    if width == 0:
+        return nearest_rows, nearest_distances, more
+
+    driver_lats = store.latitude[rows]
+    driver_lngs = store.longitude[rows]
+    driver_vectors = unit_vectors(driver_lats, driver_lngs)
+    driver_codes = store.vehicle_type[rows].astype(np.int64)
+    codes = query.vehicle_codes(store)
+    block_size = max(1, min(BLOCK_ORIGINS, BLOCK_CELLS // len(rows)))
+    by_latitude = np.argsort(query.lats[origins], kind='stable')
+    for start in range(0, len(origins), block_size):
+        block = by_latitude[start:start + block_size]
+        lats, lngs = query.lats[origins[block]], query.lngs[origins[block]]
+        radii = query.radii[origins[block]]
+        dlat = np.degrees(radii / EARTH_RADIUS_KM)
+        dlng = dlat / np.maximum(np.cos(np.radians(lats)), 1e-6)
+        near = np.flatnonzero(
+            (driver_lats >= (lats - dlat).min()) & (driver_lats <= (lats + dlat).max())
+            & (driver_lngs >= (lngs - dlng).min()) & (driver_lngs <= (lngs + dlng).max())
+        )
+        if len(near) == 0:
+            continue
+
+        gaps = 1 - unit_vectors(lats, lngs) @ driver_vectors[near].T
+        excluded = gaps > (1 - np.cos(radii / EARTH_RADIUS_KM))[:, np.newaxis]
+        origin_codes = codes[origins[block], np.newaxis]
+        excluded |= (origin_codes != ANY_VEHICLE) & (origin_codes != driver_codes[near])
+        gaps[excluded] = np.inf
+
+        # Partial selection of the nearest, then a sort of just those
+        picks = min(width, len(near))
+        if picks < len(near):
+            picked = np.argpartition(gaps, picks - 1, axis=1)[:, :picks]
+        else:
+            picked = np.broadcast_to(np.arange(picks), gaps.shape)
+        order = np.argsort(np.take_along_axis(gaps, picked, axis=1), axis=1, kind='stable')
+        picked = np.take_along_axis(picked, order, axis=1)
+        found = np.isfinite(np.take_along_axis(gaps, picked, axis=1))
+
+        picked = near[picked]
+        distances = haversine(lats[:, np.newaxis], lngs[:, np.newaxis], driver_lats[picked], driver_lngs[picked])
+        nearest_rows[block, :picks] = np.where(found, rows[picked], -1)
+        nearest_distances[block, :picks] = np.where(found, distances, np.inf)
+        more[block] = np.isfinite(gaps).sum(axis=1) > width
+    return nearest_rows, nearest_distances, more
+
+def greedy_assign(candidates, limit):
+    """Offer each driver to at most one origin, closest pairs first, up to limit per origin.
+
+    candidates holds each origin's (rows, distances). Returns the rows and
+    distances offered to each origin, nearest first, and which origins got
+    fewer than limit.
+    """
+    counts = [len(rows) for rows, _ in candidates]
+    origins = np.repeat(np.arange(len(candidates)), counts)
+    rows = np.concatenate([rows for rows, _ in candidates])
+    distances = np.concatenate([distances for _, distances in candidates])
+    order = np.argsort(distances, kind='stable')
+
+    offered = [[] for _ in candidates]
+    open_slots = [limit] * len(candidates)
+    remaining = limit * len(candidates)
+    taken = set()
+    for position, origin, row in zip(order.tolist(), origins[order].tolist(), rows[order].tolist()):
+        if open_slots[origin] and row not in taken:
+            taken.add(row)
+            offered[origin].append(position)
+            open_slots[origin] -= 1
+            remaining -= 1
+            if remaining == 0:
+                break
+
+    result = [(rows[positions], distances[positions]) for positions in offered]
+    return result, np.array(open_slots, dtype=np.int64) > 0
+
+def batch_nearest(store, rows, query):
+    """Per origin (rows, distances) of its nearest drivers, disjoint across origins when query.assign.
+
+    Plain top-k reads limit candidates per origin. Assignment starts from a
+    few times that and quadruples the candidates of the origins that came up
+    short with matching drivers beyond their candidates, until none do. An
+    origin only reaches past its candidates once all of them are taken, so
+    the result is the same as a greedy pass over the whole origin x driver
+    matrix.
+    """
+    width = query.limit if not query.assign else query.limit * 4
+    origins = np.arange(len(query))
+    candidates = [None] * len(query)
+    more = np.zeros(len(query), dtype=np.bool_)
+    while True:
+        nearest_rows, nearest_distances, more[origins] = nearest_candidates(store, rows, query, width, origins)
+        found = np.isfinite(nearest_distances)
+        for i, origin in enumerate(origins.tolist()):
+            candidates[origin] = (nearest_rows[i, found[i]], nearest_distances[i, found[i]])
+        if not query.assign:
+            return candidates
+
+        result, short = greedy_assign(candidates, query.limit)
+        origins = np.flatnonzero(short & more)
+        if len(origins) == 0:
+            return result
+        width *= 4
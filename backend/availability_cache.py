@@ -0,0 +1,175 @@
+import math
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from Backend import metrics
+from Backend.geo import bounding_box, grid_cell, cells_covering
+
+# Searches whose point falls in the same cell share one cache entry
+CACHE_CELL_DEGREES = 0.002
+
+# Cells used to find the entries a location update can affect
+INVALIDATION_CELL_DEGREES = 0.01
+
+DEFAULT_MAX_ENTRIES = 1024
+
+# Entries also age out so drivers leaving the 30 minute window drop off
+DEFAULT_TTL_SECONDS = 30.0
+
+# Catching up on more changed rows than this clears the cache instead
+MAX_INVALIDATION_ROWS = 50000
+
+CACHE_REQUESTS = metrics.counter(
+    'availability_cache_requests_total', 'Availability cache lookups by result', ['result'])
+CACHE_INVALIDATIONS = metrics.counter(
+    'availability_cache_invalidations_total', 'Availability cache entries dropped', ['reason'])
+
+class CachedArea:
+    """Candidate rows of a fleet snapshot around one grid cell, ready for exact per-request distances"""
+    def __init__(self, store, rows, cells, created_at):
+        # Rows of a live snapshot stay valid for every later snapshot of its
+        # generation, so only standalone snapshots are kept with the entry
+        self.store = store if store.generation is None else None
+        self.generation = store.generation
+        self.rows = rows
+        self.driver_ids = set(store.ids(rows))
+        self.cells = cells
+        self.created_at = created_at
+
+class AvailabilityCache:
+    """LRU cache of availability candidates keyed on a quantized search point.
+
+    A key covers every search whose point falls in the same CACHE_CELL_DEGREES
+    cell with the same radius, vehicle_type and time slot. The entry holds all
+    drivers within radius of any point in that cell, so callers still compute
+    exact distances for their own point and results match an uncached query.
+
+    Before each lookup the cache reads the driver_locations rows appended since
+    it last looked (from any process) and drops the entries whose area contains
+    a moved driver's new position or that hold the driver already. Entries
+    hold row numbers into fleet snapshots, so live entries are only valid
+    for the store generation they were built from: when the shared store
+    reloads, the whole cache goes, and lookups resolve live entries against
+    its latest snapshot, which holds every row the entry was built from.
+    """
+    def __init__(self, db, store=None, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL_SECONDS):
+        self.db = db
+        self.store = store
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.by_cell = defaultdict(set)  # invalidation cell -> keys whose area overlaps it
+        self.by_driver = defaultdict(set)  # driver_id -> keys holding it
+        self.cursor = None
+        self.generation = None if store is None else store.generation
+
+    def key(self, lat, lng, radius_km, vehicle_type, slot):
+        return (grid_cell(lat, lng, CACHE_CELL_DEGREES), radius_km, vehicle_type, slot)
+
+    def area(self, key):
+        """Center and radius of a query that covers every search point in the key's cell"""
+        (row, col), radius_km = key[0], key[1]
+        lat = (row + 0.5) * CACHE_CELL_DEGREES
+        lng = (col + 0.5) * CACHE_CELL_DEGREES
+        # Half the cell diagonal in km, with longitude degrees shrunk by latitude
+        half_lat_km = CACHE_CELL_DEGREES / 2 * 111.2
+        half_lng_km = half_lat_km * math.cos(math.radians(lat))
+        return lat, lng, radius_km + math.hypot(half_lat_km, half_lng_km) * 1.01
+
+    def get(self, key):
+        """(snapshot, rows) cached for a key, or None"""
+        with self.lock:
+            self.sync()
+            entry = self.entries.get(key)
+            live = self.store.snapshot if self.store is not None else None
+            if entry is not None and entry.store is None and (live is None or entry.generation != live.generation):
+                self.discard(key)
+                CACHE_INVALIDATIONS.inc(reason='reload')
+                entry = None
+            elif entry is not None and time.monotonic() - entry.created_at > self.ttl:
+                self.discard(key)
+                CACHE_INVALIDATIONS.inc(reason='expired')
+                entry = None
+            if entry is None:
+                CACHE_REQUESTS.inc(result='miss')
+                return None
+            self.entries.move_to_end(key)
+            CACHE_REQUESTS.inc(result='hit')
+            return entry.store or live, entry.rows
+
+    def put(self, key, store, rows):
+        """Cache the candidate rows of a fleet snapshot for a key; returns (store, rows)"""
+        lat, lng, radius_km = self.area(key)
+        cells = cells_covering(bounding_box(lat, lng, radius_km), INVALIDATION_CELL_DEGREES)
+        entry = CachedArea(store, rows, cells, time.monotonic())
+
+        with self.lock:
+            self.discard(key)
+            self.entries[key] = entry
+            for cell in cells:
+                self.by_cell[cell].add(key)
+            for driver_id in entry.driver_ids:
+                self.by_driver[driver_id].add(key)
+            while len(self.entries) > self.max_entries:
+                self.discard(next(iter(self.entries)))
+                CACHE_INVALIDATIONS.inc(reason='evicted')
+        return store, rows
+
+    def discard(self, key):
+        """Remove one entry and its index references (caller holds self.lock)"""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for cell in entry.cells:
+            keys = self.by_cell.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_cell[cell]
+        for driver_id in entry.driver_ids:
+            keys = self.by_driver.get(driver_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_driver[driver_id]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.by_cell.clear()
+            self.by_driver.clear()
+
+    def sync(self):
+        """Invalidate entries touched by location rows written since the last lookup"""
+        if self.store is not None and self.store.generation != self.generation:
+            CACHE_INVALIDATIONS.inc(len(self.entries), reason='reload')
+            self.entries.clear()
+            self.by_cell.clear()
+            self.by_driver.clear()
+            self.generation = self.store.generation
+
+        last_id = self.db.execute_query('SELECT COALESCE(MAX(id), 0) FROM driver_locations')[0][0]
+        if self.cursor is None or last_id < self.cursor or last_id - self.cursor > MAX_INVALIDATION_ROWS:
+            CACHE_INVALIDATIONS.inc(len(self.entries), reason='reset')
+            self.entries.clear()
+            self.by_cell.clear()
+            self.by_driver.clear()
+        elif last_id > self.cursor and self.entries:
+            rows = self.db.execute_query(
+                'SELECT driver_id, latitude, longitude FROM driver_locations WHERE id > ? AND id <= ?',
+                [self.cursor, last_id]
+            )
+            stale = set()
+            for row in rows:
+                cell = grid_cell(row['latitude'], row['longitude'], INVALIDATION_CELL_DEGREES)
+                stale.update(self.by_cell.get(cell, ()))
+                stale.update(self.by_driver.get(row['driver_id'], ()))
+            for key in stale:
+                self.discard(key)
+            CACHE_INVALIDATIONS.inc(len(stale), reason='location_update')
+        self.cursor = last_id
+
+    def status(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'max_entries': self.max_entries, 'ttl_seconds': self.ttl}
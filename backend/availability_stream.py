@@ -0,0 +1,253 @@
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+from Backend import metrics
+from Backend.fleet import VEHICLE_NAMES
+from Backend.geo import haversine, bounding_box, grid_cell, cells_covering
+from Backend.stats import window_cutoff
+
+# Grid used to route a location change to the subscribers whose area it falls in
+STREAM_CELL_DEGREES = 0.01
+
+# How often the hub reads new rows from driver_locations
+DEFAULT_POLL_INTERVAL = 0.5
+
+# Idle streams send a comment this often so proxies keep the connection open
+HEARTBEAT_SECONDS = 15
+
+# Undelivered messages a slow subscriber may accumulate before it is reset
+SUBSCRIBER_QUEUE_SIZE = 100
+
+SUBSCRIBERS = metrics.gauge('availability_stream_subscribers', 'Open availability streams')
+DELTAS_SENT = metrics.counter(
+    'availability_stream_deltas_total', 'Driver changes pushed to subscribers', ['kind'])
+
+DRIVER_COLUMNS = '''
+    d.driver_id, d.name, d.vehicle_type, d.license_plate, d.rating, d.total_trips,
+    dl.latitude, dl.longitude, dl.last_update, dl.is_available, dl.eta_minutes
+'''
+
+def driver_payload(driver, distance):
+    """The driver dict /api/drivers/availability returns, from a joined drivers/locations row"""
+    return {
+        'id': driver['driver_id'],
+        'name': driver['name'],
+        'vehicle_type': driver['vehicle_type'],
+        'vehicle_name': VEHICLE_NAMES.get(driver['vehicle_type'], driver['vehicle_type']),
+        'license_plate': driver['license_plate'],
+        'rating': driver['rating'],
+        'total_trips': driver['total_trips'],
+        'latitude': driver['latitude'],
+        'longitude': driver['longitude'],
+        'last_update': driver['last_update'],
+        'status': 'available' if driver['is_available'] == 1 else 'unavailable',
+        'eta_minutes': driver['eta_minutes'],
+        'distance_km': round(float(distance), 2)
+    }
+
+def sse_message(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+class Subscription:
+    """One client's view: the drivers currently inside its search circle"""
+    def __init__(self, lat, lng, radius_km, vehicle_type='all'):
+        self.lat = lat
+        self.lng = lng
+        self.radius_km = radius_km
+        self.vehicle_type = vehicle_type
+        self.box = bounding_box(lat, lng, radius_km)
+        self.cells = cells_covering(self.box, STREAM_CELL_DEGREES)
+        self.members = {}  # driver_id -> (latitude, longitude, is_available, eta_minutes, last_update)
+        self.queue = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.closed = False
+
+    def distance(self, driver):
+        """Distance to a driver row, or None if it falls outside this subscription"""
+        if self.vehicle_type != 'all' and driver['vehicle_type'] != self.vehicle_type:
+            return None
+        if not (self.box['min_lat'] <= driver['latitude'] <= self.box['max_lat']
+                and self.box['min_lng'] <= driver['longitude'] <= self.box['max_lng']):
+            return None
+        distance = float(haversine(self.lat, self.lng, driver['latitude'], driver['longitude']))
+        return distance if distance <= self.radius_km else None
+
+    def apply(self, driver, delta):
+        """Fold one driver change in, recording what the client needs to hear in delta"""
+        driver_id = driver['driver_id']
+        current = self.members.get(driver_id)
+        if current is not None and driver['last_update'] < current[4]:
+            return
+
+        distance = self.distance(driver)
+        if distance is None:
+            if current is not None:
+                del self.members[driver_id]
+                delta['leave'].append(driver_id)
+            return
+
+        state = (driver['latitude'], driver['longitude'], driver['is_available'],
+                 driver['eta_minutes'], driver['last_update'])
+        if current == state:
+            return
+        self.members[driver_id] = state
+        delta['enter' if current is None else 'update'].append(driver_payload(driver, distance))
+
+    def expire(self, cutoff, delta):
+        """Drop members whose last position fell out of the availability window"""
+        for driver_id, state in list(self.members.items()):
+            if state[4] < cutoff:
+                del self.members[driver_id]
+                delta['leave'].append(driver_id)
+
+    def push(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            # The client can't keep up; it reconnects and gets a fresh snapshot
+            self.closed = True
+
+    def events(self):
+        """SSE text for the client, ending when the subscription is closed"""
+        while not self.closed:
+            try:
+                yield self.queue.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+        yield sse_message('reset', {'reason': 'subscriber fell behind'})
+
+class AvailabilityHub:
+    """Pushes driver availability deltas to every open stream.
+
+    One background thread reads the driver_locations rows appended since its
+    last poll (the same change log the stats aggregator follows, so updates
+    from every process are seen) and routes each changed driver only to the
+    subscriptions whose grid cells cover its new position, or which currently
+    contain it. Each subscriber then gets one message listing the drivers that
+    entered, left or changed inside its radius, instead of the whole list.
+    """
+    def __init__(self, db, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+        self.by_cell = defaultdict(set)  # grid cell -> subscriptions covering it
+        self.by_driver = defaultdict(set)  # driver_id -> subscriptions containing it
+        self.cursor = None
+        self.thread = None
+
+    def subscribe(self, lat, lng, radius_km, vehicle_type='all'):
+        """Register a subscription and queue its initial snapshot"""
+        subscription = Subscription(lat, lng, radius_km, vehicle_type)
+        box = subscription.box
+        query = f'''
+            SELECT {DRIVER_COLUMNS}
+            FROM drivers d
+            JOIN driver_current_locations dl ON d.driver_id = dl.driver_id
+            WHERE dl.last_update >= datetime('now', '-30 minutes')
+              AND dl.latitude BETWEEN ? AND ?
+              AND dl.longitude BETWEEN ? AND ?
+        '''
+
+        with self.lock:
+            if self.cursor is None:
+                self.cursor = self.last_location_id()
+            # Rows appended after this snapshot are replayed by the next poll;
+            # apply() ignores the ones the snapshot already reflects
+            delta = {'enter': [], 'leave': [], 'update': []}
+            for driver in self.db.execute_query(query, [box['min_lat'], box['max_lat'], box['min_lng'], box['max_lng']]):
+                subscription.apply(driver, delta)
+            delta['enter'].sort(key=lambda driver: driver['distance_km'])
+            subscription.push(sse_message('snapshot', {'drivers': delta['enter'], 'count': len(delta['enter'])}))
+
+            self.subscriptions.add(subscription)
+            for cell in subscription.cells:
+                self.by_cell[cell].add(subscription)
+            for driver_id in subscription.members:
+                self.by_driver[driver_id].add(subscription)
+            SUBSCRIBERS.set(len(self.subscriptions))
+            self.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscription.closed = True
+            self.subscriptions.discard(subscription)
+            for cell in subscription.cells:
+                self.by_cell[cell].discard(subscription)
+                if not self.by_cell[cell]:
+                    del self.by_cell[cell]
+            for driver_id in subscription.members:
+                self.untrack(driver_id, subscription)
+            SUBSCRIBERS.set(len(self.subscriptions))
+
+    def untrack(self, driver_id, subscription):
+        subscriptions = self.by_driver.get(driver_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.by_driver[driver_id]
+
+    def last_location_id(self):
+        return self.db.execute_query('SELECT COALESCE(MAX(id), 0) FROM driver_locations')[0][0]
+
+    def start(self):
+        """Start the poller on the first subscription (caller holds self.lock)"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='availability-stream', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error streaming availability updates: {e}")
+
+    def poll(self):
+        """Read new location rows and push one delta message to each affected subscriber"""
+        with self.lock:
+            if not self.subscriptions:
+                self.cursor = None  # resnapshot from scratch when someone subscribes again
+                return
+            last_id = self.last_location_id()
+            rows = self.db.execute_query(f'''
+                SELECT {DRIVER_COLUMNS}
+                FROM driver_locations dl
+                JOIN drivers d ON d.driver_id = dl.driver_id
+                WHERE dl.id > ? AND dl.id <= ?
+                ORDER BY dl.id
+            ''', [self.cursor, last_id])
+            self.cursor = last_id
+            self.dispatch(rows)
+
+    def dispatch(self, rows):
+        # Only a driver's newest row in this batch matters
+        latest = {}
+        for row in rows:
+            latest[row['driver_id']] = row
+
+        deltas = {}
+        for driver_id, driver in latest.items():
+            cell = grid_cell(driver['latitude'], driver['longitude'], STREAM_CELL_DEGREES)
+            for subscription in self.by_cell.get(cell, set()) | self.by_driver.get(driver_id, set()):
+                delta = deltas.setdefault(subscription, {'enter': [], 'leave': [], 'update': []})
+                subscription.apply(driver, delta)
+                if driver_id in subscription.members:
+                    self.by_driver[driver_id].add(subscription)
+                else:
+                    self.untrack(driver_id, subscription)
+
+        cutoff = window_cutoff()
+        for subscription in list(self.subscriptions):
+            delta = deltas.setdefault(subscription, {'enter': [], 'leave': [], 'update': []})
+            subscription.expire(cutoff, delta)
+            if not any(delta.values()):
+                continue
+            for driver_id in delta['leave']:
+                self.untrack(driver_id, subscription)
+            for kind, changes in delta.items():
+                DELTAS_SENT.inc(len(changes), kind=kind)
+            subscription.push(sse_message('delta', delta))
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Load Test for the Flask and ASGI Serving Modes
+Starts each server on a synthetic fleet, drives the read endpoints with many
+concurrent keep-alive clients from an asyncio load generator and writes
+throughput, latency percentiles and error counts as JSON.
+
+    python -m Backend.benchmarks.load_test --concurrency 50,500,2000 --duration 20
+
+The flask mode is the threaded server app.py runs (a thread per connection);
+asgi is uvicorn over Backend.asgi:app. Both get one process so the numbers
+compare the request handling, not the worker count. The generator shares the
+machine with the server, so run it on a box with spare cores for absolute
+numbers. Results from a reference run are in benchmarks/README.md.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime
+import numpy as np
+
+API_ENDPOINTS = ['/api/drivers/availability', '/api/stats/summary', '/api/data/status']
+
+SERVERS = {
+    'flask': [sys.executable, '-c',
+              'import sys; from Backend.app import create_app; '
+              'create_app().run(host="127.0.0.1", port=int(sys.argv[1]), threaded=True)'],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'Backend.asgi:app', '--host', '127.0.0.1',
+             '--log-level', 'warning', '--no-access-log', '--port']
+}
+
+# Slower responses count as timeouts
+REQUEST_TIMEOUT = 10.0
+
+# The directory holding the Backend package this script was imported from
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def prepare_fleet(workdir, drivers, seed):
+    """A working directory holding nyc_taxi.db with a synthetic fleet reporting now"""
+    case_dir = os.path.join(workdir, f'load_{drivers}')
+    shutil.rmtree(case_dir, ignore_errors=True)
+    os.makedirs(case_dir)
+    from Backend.database import Database
+    from Backend.fleet import generate_fleet, store_fleet
+    db = Database(os.path.join(case_dir, 'nyc_taxi.db'))
+    store_fleet(db, generate_fleet(drivers, seed=seed, jitter=0.05))
+    db.close()
+    return case_dir
+
+def request_bytes(path):
+    return (f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept-Encoding: gzip\r\n'
+            f'Connection: keep-alive\r\n\r\n').encode()
+
+async def fetch(port, connection, path):
+    """One request over a kept-alive connection (reopened when needed): (status, headers, connection)"""
+    if connection is None:
+        connection = await asyncio.open_connection('127.0.0.1', port)
+    reader, writer = connection
+    writer.write(request_bytes(path))
+    await writer.drain()
+
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    version, status = lines[0].split(' ')[:2]
+    headers = dict(line.split(':', 1) for line in lines[1:] if ':' in line)
+    headers = {name.strip().lower(): value.strip().lower() for name, value in headers.items()}
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+    if version == 'HTTP/1.0' or headers.get('connection') == 'close' or 'content-length' not in headers:
+        writer.close()
+        connection = None
+    return int(status), headers, connection
+
+async def client(port, deadline, rng, results):
+    connection = None
+    while time.perf_counter() < deadline:
+        path = API_ENDPOINTS[rng.integers(len(API_ENDPOINTS))]
+        if path == '/api/drivers/availability':
+            path += f'?lat={rng.uniform(40.70, 40.80):.5f}&lng={rng.uniform(-74.02, -73.93):.5f}&radius=2&limit=20'
+        start = time.perf_counter()
+        try:
+            status, headers, connection = await asyncio.wait_for(fetch(port, connection, path), REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            results['timeouts'] += 1
+            status = None
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            results['connection_errors'] += 1
+            status = None
+            await asyncio.sleep(0.05)
+        if status is None:
+            if connection is not None:
+                connection[1].close()
+            connection = None
+            continue
+
+        if status == 200:
+            results['latencies'].append(time.perf_counter() - start)
+        elif status == 503:
+            results['rejected'] += 1
+            await asyncio.sleep(float(headers.get('retry-after', 1)))
+        else:
+            results['errors'] += 1
+    if connection is not None:
+        connection[1].close()
+
+async def generate_load(port, concurrency, duration, seed):
+    results = {'latencies': [], 'timeouts': 0, 'connection_errors': 0, 'rejected': 0, 'errors': 0}
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(
+        client(port, deadline, np.random.default_rng([seed, i]), results) for i in range(concurrency)
+    ))
+    latencies = np.array(results.pop('latencies')) * 1000
+    results['ok'] = len(latencies)
+    results['requests_per_s'] = round(len(latencies) / duration, 1)
+    for percentile in (50, 95, 99):
+        results[f'p{percentile}_ms'] = round(float(np.percentile(latencies, percentile)), 1) if len(latencies) else None
+    return results
+
+async def probe(port):
+    status, _, connection = await fetch(port, None, '/api/data/status')
+    if connection is not None:
+        connection[1].close()
+    return status
+
+def wait_until_up(port, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with {process.returncode}')
+        try:
+            if asyncio.run(probe(port)) == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('Server did not come up')
+
+def server_env():
+    """Environment for a server subprocess, importing the same Backend package as this script"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [PACKAGE_ROOT, env.get('PYTHONPATH')]))
+    return env
+
+def run_server(mode, case_dir, port, levels, duration, seed):
+    process = subprocess.Popen(SERVERS[mode] + [str(port)], cwd=case_dir, env=server_env(),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port, process)
+        asyncio.run(generate_load(port, 20, 2, seed))  # warm caches and pools
+        results = {}
+        for concurrency in levels:
+            print(f"🔥 {mode}: {concurrency} concurrent clients for {duration}s")
+            results[str(concurrency)] = asyncio.run(generate_load(port, concurrency, duration, seed))
+            print(f"   {results[str(concurrency)]}")
+        return results
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the read endpoints in both serving modes')
+    parser.add_argument('--servers', default='flask,asgi', help='Comma-separated serving modes')
+    parser.add_argument('--concurrency', default='50,500,2000', help='Comma-separated concurrent client counts')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per concurrency level')
+    parser.add_argument('--drivers', type=int, default=10000)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default='benchmark_data', help='Where the synthetic fleet is written')
+    parser.add_argument('--output', default='load_test_results.json')
+    args = parser.parse_args()
+
+    levels = [int(n) for n in args.concurrency.split(',')]
+    case_dir = prepare_fleet(os.path.abspath(args.workdir), args.drivers, args.seed)
+
+    results = {}
+    for mode in args.servers.split(','):
+        results[mode] = run_server(mode, case_dir, args.port, levels, args.duration, args.seed)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'drivers': args.drivers,
+            'duration_s': args.duration,
+            'seed': args.seed
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"📊 Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite for NYC Taxi Driver Availability
+Times the ingest stages and the API hot paths on synthetic data and writes
+machine-readable JSON. Pass --baseline to fail on regressions against an
+earlier run.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import time
+from datetime import datetime
+import numpy as np
+
+PRESETS = {
+    'quick': {'rows': [10000], 'drivers': [100, 10000]},
+    'full': {'rows': [10000, 1000000, 10000000], 'drivers': [100, 10000, 100000, 1000000]}
+}
+
+API_ENDPOINTS = ['/api/drivers/availability', '/api/stats/summary', '/api/data/status']
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def bench_ingest(csv_path, workdir, chunksize, rows):
+    """Time each streaming ingest stage on one synthetic CSV"""
+    from Backend.database import Database
+    from Backend.data_processor import DataProcessor
+
+    db_path = os.path.join(workdir, f'ingest_{rows}.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    processor = DataProcessor(Database(db_path), seed=0)
+
+    result = {}
+    start = time.perf_counter()
+    coord_stats = processor.scan_coordinate_stats(csv_path, chunksize)
+    result['scan_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    driver_stats = {}
+    for _ in processor.clean_chunks(csv_path, chunksize, coord_stats, driver_stats):
+        pass
+    result['clean_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    drivers = processor.build_driver_profiles(driver_stats)
+    result['profile_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    processor.store_drivers(drivers)
+    result['store_s'] = time.perf_counter() - start
+
+    result['total_s'] = sum(result.values())
+    result['rows_per_s'] = round(rows / result['total_s'])
+    result['rows_cleaned'] = processor.progress['rows_cleaned']
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+def bench_distance(points, seed):
+    """Vectorized vs scalar Haversine throughput"""
+    from Backend.geo import haversine_one_to_many
+    from Backend.data_processor import DataProcessor
+
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(40.6, 40.9, points)
+    lngs = rng.uniform(-74.1, -73.8, points)
+
+    start = time.perf_counter()
+    haversine_one_to_many(40.7128, -74.0060, lats, lngs)
+    vectorized = time.perf_counter() - start
+
+    scalar_points = min(points, 10000)
+    processor = DataProcessor(None)
+    start = time.perf_counter()
+    for lat, lng in zip(lats[:scalar_points].tolist(), lngs[:scalar_points].tolist()):
+        processor.calculate_distance(40.7128, -74.0060, lat, lng)
+    scalar = (time.perf_counter() - start) * points / scalar_points
+
+    return {'vectorized_s': vectorized, 'scalar_s': scalar}
+
+def bench_api(drivers, workdir, requests, seed):
+    """Endpoint latency percentiles through Flask's test client on a synthetic fleet"""
+    case_dir = os.path.join(workdir, f'api_{drivers}')
+    shutil.rmtree(case_dir, ignore_errors=True)
+    os.makedirs(case_dir)
+    os.chdir(case_dir)
+
+    from Backend.database import Database
+    from Backend.fleet import generate_fleet, store_fleet
+    store_fleet(Database(), generate_fleet(drivers, seed=seed, jitter=0.05))
+
+    # The app opens nyc_taxi.db in the working directory on import
+    from Backend.app import app
+    client = app.test_client()
+    rng = np.random.default_rng(seed)
+
+    result = {}
+    for endpoint in API_ENDPOINTS:
+        latencies = []
+        for i in range(requests + 10):
+            url = endpoint
+            if endpoint == '/api/drivers/availability':
+                url += f'?lat={rng.uniform(40.70, 40.80):.5f}&lng={rng.uniform(-74.02, -73.93):.5f}&radius=2'
+            start = time.perf_counter()
+            response = client.get(url)
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} returned {response.status_code}')
+            if i >= 10:  # first requests warm caches and pools
+                latencies.append(elapsed * 1000)
+
+        result[endpoint] = {
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'mean_ms': float(np.mean(latencies))
+        }
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+def run_isolated(function, *args):
+    """Run one benchmark case in a fresh process so peak RSS is per case"""
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(function, args)
+
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        path = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        else:
+            flat[path] = value
+    return flat
+
+def find_regressions(results, baseline, tolerance):
+    """Lower-is-better metrics that got worse than baseline by more than tolerance"""
+    current = flatten(results)
+    regressions = []
+    for path, before in flatten(baseline).items():
+        lower_is_better = path.endswith(('_s', '_ms', '_mb'))
+        if not lower_is_better or path not in current or not before:
+            continue
+        after = current[path]
+        if after > before * (1 + tolerance):
+            regressions.append({'metric': path, 'baseline': before, 'current': after,
+                                'change': round(after / before - 1, 3)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ingest and API hot paths')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='full')
+    parser.add_argument('--rows', help='Comma-separated CSV sizes (overrides the preset)')
+    parser.add_argument('--drivers', help='Comma-separated fleet sizes (overrides the preset)')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    parser.add_argument('--chunksize', type=int, default=250000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default='benchmark_data', help='Where synthetic data is cached')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='Earlier results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative slowdown before a metric counts as a regression')
+    args = parser.parse_args()
+
+    rows = [int(n) for n in args.rows.split(',')] if args.rows else PRESETS[args.preset]['rows']
+    drivers = [int(n) for n in args.drivers.split(',')] if args.drivers else PRESETS[args.preset]['drivers']
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+
+    from Backend.benchmarks.synthetic import write_trip_csv
+
+    results = {'ingest': {}, 'distance': {}, 'api': {}}
+    for count in rows:
+        print(f"📦 Ingest benchmark: {count} rows")
+        csv_path = write_trip_csv(os.path.join(workdir, f'trips_{count}_{args.seed}.csv'), count, args.seed)
+        results['ingest'][str(count)] = run_isolated(bench_ingest, csv_path, workdir, args.chunksize, count)
+        results['distance'][str(count)] = run_isolated(bench_distance, count, args.seed)
+
+    for count in drivers:
+        print(f"🚕 API benchmark: {count} drivers")
+        results['api'][str(count)] = run_isolated(bench_api, count, workdir, args.requests, args.seed)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'requests_per_endpoint': args.requests,
+            'chunksize': args.chunksize,
+            'seed': args.seed
+        },
+        'results': results
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report['regressions'] = find_regressions(results, baseline['results'], args.tolerance)
+        for regression in report['regressions']:
+            print(f"❌ {regression['metric']}: {regression['baseline']:.4g} -> {regression['current']:.4g}")
+        exit_code = 1 if report['regressions'] else 0
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"📊 Results written to {args.output}")
+    sys.exit(exit_code)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Trip generation is done in slices so even 10M-row files use bounded memory
+SLICE_ROWS = 1000000
+
+def trip_frame(rows, rng, first_id=0, start='2016-01-01', days=182):
+    """One slice of synthetic trips with the train.csv schema.
+
+    Most trips fall in Manhattan; a few percent are outside NYC or have
+    unrealistic durations so the cleaning filters have work to do.
+    """
+    pickup = pd.Timestamp(start) + pd.to_timedelta(np.sort(rng.integers(0, days * 86400, rows)), unit='s')
+    duration = np.where(rng.random(rows) < 0.02, rng.integers(1, 30000, rows), rng.integers(120, 3600, rows))
+
+    pickup_lat = rng.normal(40.75, 0.04, rows)
+    pickup_lng = rng.normal(-73.97, 0.04, rows)
+    outside = rng.random(rows) < 0.01
+    pickup_lat[outside] = 0.0
+
+    return pd.DataFrame({
+        'id': np.char.add('id', (np.arange(rows) + first_id).astype(str)),
+        'vendor_id': rng.integers(1, 3, rows),
+        'pickup_datetime': pickup.strftime('%Y-%m-%d %H:%M:%S'),
+        'dropoff_datetime': (pickup + pd.to_timedelta(duration, unit='s')).strftime('%Y-%m-%d %H:%M:%S'),
+        'passenger_count': rng.choice([1, 1, 1, 1, 2, 2, 3, 4, 5, 6], rows),
+        'pickup_longitude': pickup_lng,
+        'pickup_latitude': pickup_lat,
+        'dropoff_longitude': pickup_lng + rng.normal(0, 0.03, rows),
+        'dropoff_latitude': pickup_lat + rng.normal(0, 0.03, rows),
+        'store_and_fwd_flag': np.where(rng.random(rows) < 0.005, 'Y', 'N'),
+        'trip_duration': duration
+    })
+
+def write_trip_csv(path, rows, seed=0):
+    """Write a synthetic train.csv with rows trips, reusing it if it already exists"""
+    if os.path.exists(path):
+        return path
+
+    rng = np.random.default_rng(seed)
+    partial = path + '.partial'
+    written = 0
+    while written < rows:
+        count = min(SLICE_ROWS, rows - written)
+        trip_frame(count, rng, first_id=written).to_csv(
+            partial, mode='w' if written == 0 else 'a', header=written == 0, index=False
+        )
+        written += count
+    os.replace(partial, path)
+    return path
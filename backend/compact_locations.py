@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Location History Compaction for NYC Taxi Driver Availability
+Run this periodically (e.g. from cron) to keep driver_locations bounded
+"""
+
+import argparse
+from Backend.database import Database, DEFAULT_RETENTION_HOURS
+
+def compact_locations():
+    """Prune (and optionally archive) location history outside the retention window"""
+    parser = argparse.ArgumentParser(description='Prune old driver location history')
+    parser.add_argument('--db', default='nyc_taxi.db', help='SQLite database path')
+    parser.add_argument('--hours', type=float, default=DEFAULT_RETENTION_HOURS,
+                        help='Keep this many hours of location history')
+    parser.add_argument('--archive', action='store_true',
+                        help='Copy pruned rows to driver_locations_archive first')
+    args = parser.parse_args()
+    
+    db = Database(args.db)
+    deleted = db.compact_locations(retention_hours=args.hours, archive=args.archive)
+    
+    action = "Archived and pruned" if args.archive else "Pruned"
+    print(f"🧹 {action} {deleted} location records older than {args.hours} hours")
+    print("📍 Current driver positions are unaffected")
+
+if __name__ == '__main__':
+    compact_locations()
@@ -1,48 +1,569 @@
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import repeat
 import math
+import multiprocessing
+import os
+import time
+from Backend import metrics
+from Backend.analytics import TripRollups, ROLLUP_COLUMNS
+from Backend.eta import EtaModelBuilder, DEFAULT_ETA_DIR
+from Backend.database import INSERT_DRIVER_SQL, INSERT_LOCATION_SQL, DEFAULT_BATCH_SIZE
+from Backend.fleet import generate_fleet, fleet_records, classify_vehicles, rating_base, experience_ratings
+from Backend.geo import haversine, NYC_BOUNDS
+from Backend.heatmap import PickupTiles
+from Backend.incremental import (
+    IngestState, TRIP_ID_COLUMN, complete_size, open_range, read_header, trip_key_text
+)
+
+# Only the train.csv columns the ingest pipeline uses, with compact dtypes
+TRIP_COLUMNS = {
+    'vendor_id': 'int8',
+    'passenger_count': 'int8',
+    'pickup_longitude': 'float64',
+    'pickup_latitude': 'float64',
+    'dropoff_longitude': 'float64',
+    'dropoff_latitude': 'float64',
+    'trip_duration': 'int32'
+}
+DATE_COLUMNS = ['pickup_datetime']
+
+# Read when the source has them (train.csv itself has no fares)
+OPTIONAL_TRIP_COLUMNS = {
+    'fare_amount': 'float32'
+}
+
+# Columns driver profiling needs from the cleaned trip store
+PROFILE_COLUMNS = [
+    'vendor_id', 'passenger_count', 'trip_duration',
+    'pickup_latitude', 'pickup_longitude', 'dropoff_latitude', 'dropoff_longitude'
+]
+
+DEFAULT_CHUNKSIZE = 250000
+
+# Profile fields an incremental ingest recomputes for existing drivers
+UPDATE_DRIVER_SQL = 'UPDATE drivers SET total_trips = ?, rating = ?, vehicle_type = ? WHERE driver_id = ?'
+
+STAGE_SECONDS = metrics.histogram(
+    'ingest_stage_duration_seconds', 'Time spent in each ingest stage', ['stage'])
+STAGE_ROWS = metrics.gauge(
+    'ingest_stage_rows', 'Rows produced by each ingest stage in the latest run', ['stage'])
+
+# Below this many trips profile statistics are computed in-process
+PARALLEL_MIN_ROWS = 2000000
+
+# Ingests run on a thread of the API server; forking a threaded process can
+# copy locks other threads hold, so workers start from a clean process
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+def aggregate_trip_stats(df, driver_key):
+    """Per-driver trip count and passenger/duration/distance sums, one row per driver key"""
+    if 'distance_km' in df.columns:
+        distance = df['distance_km'].to_numpy()
+    else:
+        distance = haversine(
+            df['pickup_latitude'].to_numpy(), df['pickup_longitude'].to_numpy(),
+            df['dropoff_latitude'].to_numpy(), df['dropoff_longitude'].to_numpy()
+        )
+    
+    frame = df[driver_key].assign(
+        passengers=df['passenger_count'].astype('int64'),
+        duration=df['trip_duration'].astype('int64'),
+        distance=distance
+    )
+    grouped = frame.groupby(driver_key, sort=True)
+    stats = grouped[['passengers', 'duration', 'distance']].sum()
+    stats['total_trips'] = grouped.size()
+    return stats
+
+def parallel_trip_stats(df, driver_key, workers):
+    """aggregate_trip_stats sharded by driver key across a process pool.
+    
+    Every driver key lands in exactly one shard with its rows in their original
+    order, so the result is identical whatever the number of workers.
+    """
+    group_ids = df.groupby(driver_key, sort=True).ngroup().to_numpy()
+    groups = int(group_ids.max()) + 1 if len(group_ids) else 0
+    shards = min(groups, workers * 4)
+    if workers <= 1 or shards <= 1 or len(df) < PARALLEL_MIN_ROWS:
+        return aggregate_trip_stats(df, driver_key)
+    
+    order = np.argsort(group_ids, kind='stable')
+    columns = driver_key + [column for column in PROFILE_COLUMNS if column not in driver_key]
+    if 'distance_km' in df.columns:
+        columns.append('distance_km')
+    ordered = df[columns].iloc[order]
+    
+    # Contiguous, group-aligned row ranges of roughly equal group counts
+    first_group = [groups * shard // shards for shard in range(shards + 1)]
+    bounds = np.searchsorted(group_ids[order], first_group)
+    parts = [ordered.iloc[bounds[i]:bounds[i + 1]] for i in range(shards)]
+    
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(POOL_START_METHOD)) as pool:
+        return pd.concat(pool.map(aggregate_trip_stats, parts, repeat(driver_key)))
+
+class IngestCancelled(Exception):
+    """Raised between chunks when a running ingest has been asked to stop"""
+
+class RunningStats:
+    """Running count, mean and variance merged chunk by chunk (Chan et al.)"""
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+    
+    def update(self, values):
+        n = len(values)
+        if n == 0:
+            return
+        chunk_mean = float(values.mean())
+        chunk_m2 = float(((values - chunk_mean) ** 2).sum())
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += chunk_m2 + delta ** 2 * self.count * n / total
+        self.count = total
+    
+    @classmethod
+    def from_list(cls, values=None):
+        """Resume from to_list() output"""
+        stats = cls()
+        if values:
+            stats.count, stats.mean, stats.m2 = values
+        return stats
+    
+    def to_list(self):
+        return [self.count, self.mean, self.m2]
+    
+    def std(self):
+        # Sample standard deviation, matching pandas' Series.std()
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else float('nan')
 
 class DataProcessor:
-    def __init__(self, db):
+    def __init__(self, db, trip_store=None, driver_key='vendor_id', workers=None, seed=None, max_drivers=None,
+                 eta_path=DEFAULT_ETA_DIR):
         self.db = db
+        self.trip_store = trip_store
+        # Trip columns identifying one driver; finer keys (e.g. vendor_id and
+        # trip_hour) produce more drivers
+        self.driver_key = [driver_key] if isinstance(driver_key, str) else list(driver_key)
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed
+        self.max_drivers = max_drivers
+        self.eta_path = eta_path
+        self.progress = self.new_progress()
+        self.cancel_event = None
+    
+    def profile_columns(self):
+        return PROFILE_COLUMNS + [column for column in self.driver_key if column not in PROFILE_COLUMNS]
+    
+    def store_columns(self):
+        """Trip store columns read back for profiling, analytics rollups and the trip index"""
+        columns = self.profile_columns() + [column for column in ROLLUP_COLUMNS if column not in PROFILE_COLUMNS]
+        stored = self.trip_store.columns()
+        return [column for column in columns + list(OPTIONAL_TRIP_COLUMNS) + ['trip_hash'] if column in stored]
+    
+    def new_progress(self, stage='idle'):
+        return {
+            'stage': stage,
+            'chunks_processed': 0,
+            'rows_scanned': 0,
+            'rows_read': 0,
+            'rows_cleaned': 0,
+            'duplicates_skipped': 0,
+            'drivers_created': 0,
+            'drivers_updated': 0,
+            'drivers_stored': 0,
+            'rollup_rows': 0,
+            'started_at': None
+        }
+    
+    def trip_store_current(self, csv_path):
+        """True if the trip store holds this exact source, with the trip hashes dedupe needs"""
+        return (self.trip_store is not None and self.trip_store.is_current(csv_path)
+                and 'trip_hash' in self.trip_store.columns())
+    
+    def check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise IngestCancelled('Ingest cancelled')
+    
+    def failure(self, e):
+        """Result dict for a failed or cancelled run"""
+        cancelled = isinstance(e, IngestCancelled)
+        self.progress['stage'] = 'cancelled' if cancelled else 'failed'
+        print(f"Error processing data: {e}")
+        return {
+            'success': False,
+            'cancelled': cancelled,
+            'error': str(e)
+        }
+    
+    @contextmanager
+    def stage(self, name):
+        """Time one ingest stage; set 'rows' on the yielded dict to record its row count"""
+        counts = {'rows': 0}
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+            STAGE_ROWS.set(counts['rows'], stage=name)
     
-    def process_nyc_data(self, csv_path):
+    def process_nyc_data(self, csv_path, cancel_event=None):
         """Process the actual NYC taxi dataset"""
+        self.cancel_event = cancel_event
+        self.progress = self.new_progress('loading')
+        self.progress['started_at'] = datetime.now().isoformat()
         try:
-            print("Loading NYC taxi dataset...")
-            df = pd.read_csv(csv_path)
-            print(f"Original dataset size: {len(df)} records")
+            # A full run replaces what incremental runs continue from
+            state = IngestState(self.db, replace=True)
+            running = self.new_coordinate_stats()
+            end = complete_size(csv_path)
             
-            # Clean the data
-            df_cleaned = self.clean_data(df)
-            print(f"After cleaning: {len(df_cleaned)} records")
+            if self.trip_store_current(csv_path):
+                print("Source unchanged, loading cleaned trips from the trip store...")
+                with self.stage('load') as stage:
+                    df_cleaned = self.trip_store.read(columns=self.store_columns())
+                    stage['rows'] = len(df_cleaned)
+                self.progress['rows_read'] = len(df_cleaned)
+                state.observe(csv_path, df_cleaned)
+                state.trips.record(df_cleaned['trip_hash'].to_numpy())
+                # Only cleaned trips are stored, so later outlier filtering follows their spread
+                self.update_coordinate_stats(running, df_cleaned)
+            else:
+                print("Loading NYC taxi dataset...")
+                with self.stage('load') as stage:
+                    df = pd.read_csv(csv_path)
+                    stage['rows'] = len(df)
+                print(f"Original dataset size: {len(df)} records")
+                self.progress['rows_read'] = len(df)
+                state.observe(csv_path, df)
+                self.check_cancelled()
+                
+                # Clean the data
+                self.progress['stage'] = 'cleaning'
+                with self.stage('clean') as stage:
+                    df = state.trips.new_rows(df)
+                    self.progress['duplicates_skipped'] = state.trips.duplicates
+                    df_cleaned = self.add_trip_features(self.clean_data(df, running))
+                    state.trips.record(df_cleaned['trip_hash'].to_numpy())
+                    stage['rows'] = len(df_cleaned)
+                print(f"After cleaning: {len(df_cleaned)} records ({state.trips.duplicates} duplicates removed)")
+                
+                if self.trip_store is not None:
+                    self.trip_store.write([df_cleaned], csv_path)
+            
+            state.advance(csv_path, end)
+            self.progress['rows_cleaned'] = len(df_cleaned)
+            aggregates = self.new_aggregates()
+            self.add_aggregates(aggregates, df_cleaned)
+            self.check_cancelled()
             
             # Create driver profiles from the actual data
-            drivers = self.create_driver_profiles(df_cleaned)
+            self.progress['stage'] = 'profiling'
+            driver_stats = {}
+            with self.stage('profile') as stage:
+                drivers = self.create_driver_profiles(df_cleaned, driver_stats)
+                stage['rows'] = len(drivers)
             print(f"Created {len(drivers)} driver profiles from real data")
+            self.progress['drivers_created'] = len(drivers)
+            self.check_cancelled()
             
             # Store in database
-            self.store_drivers(drivers)
+            self.progress['stage'] = 'storing'
+            with self.stage('store') as stage:
+                self.store_drivers(drivers, statements=self.state_statements(state, driver_stats, drivers, running))
+                stage['rows'] = len(drivers)
+            self.progress['drivers_stored'] = len(drivers)
+            self.store_aggregates(aggregates)
+            self.progress['stage'] = 'done'
             
             return {
                 'success': True,
                 'processed_records': len(df_cleaned),
+                'duplicates_skipped': state.trips.duplicates,
                 'drivers_created': len(drivers),
                 'timestamp': datetime.now().isoformat()
             }
             
         except Exception as e:
-            print(f"Error processing data: {e}")
+            return self.failure(e)
+    
+    def process_nyc_data_streaming(self, csv_path, chunksize=DEFAULT_CHUNKSIZE, output_path=None, cancel_event=None):
+        """Process the NYC taxi dataset in bounded chunks so peak memory stays flat.
+        
+        The first pass gathers the pickup coordinate statistics needed by the
+        3-sigma filter, the second pass cleans each chunk and folds it into
+        per-driver aggregates. Cleaned rows go to the trip store and are
+        appended to output_path if given. When the trip store already holds
+        this exact source, both passes are skipped and it is read instead.
+        Setting cancel_event stops the run at the next chunk boundary.
+        """
+        self.cancel_event = cancel_event
+        try:
+            self.progress = self.new_progress('scanning')
+            self.progress['started_at'] = datetime.now().isoformat()
+            driver_stats = {}
+            aggregates = self.new_aggregates()
+            state = IngestState(self.db, replace=True)
+            running = self.new_coordinate_stats()
+            end = complete_size(csv_path)
+            
+            if self.trip_store_current(csv_path):
+                print("Source unchanged, streaming cleaned trips from the trip store...")
+                self.progress['stage'] = 'cleaning'
+                with self.stage('load') as stage:
+                    for batch in self.trip_store.iter_batches(columns=self.store_columns(), batch_size=chunksize):
+                        self.check_cancelled()
+                        self.accumulate_driver_stats(driver_stats, batch)
+                        self.add_aggregates(aggregates, batch)
+                        state.observe(csv_path, batch)
+                        state.trips.record(batch['trip_hash'].to_numpy())
+                        self.update_coordinate_stats(running, batch)
+                        self.progress['rows_read'] += len(batch)
+                        self.progress['rows_cleaned'] += len(batch)
+                        self.progress['chunks_processed'] += 1
+                    stage['rows'] = self.progress['rows_read']
+                
+                state.advance(csv_path, end)
+                return self.finish_streaming(driver_stats, aggregates, state, running)
+            
+            print(f"Scanning NYC taxi dataset in chunks of {chunksize} rows...")
+            with self.stage('load') as stage:
+                coord_stats = self.scan_coordinate_stats(csv_path, chunksize, running, end=end)
+                stage['rows'] = self.progress['rows_scanned']
+            
+            self.progress['stage'] = 'cleaning'
+            with self.stage('clean') as stage:
+                cleaned_chunks = self.clean_chunks(csv_path, chunksize, coord_stats, driver_stats, output_path,
+                                                   aggregates, state, end=end)
+                if self.trip_store is not None:
+                    self.trip_store.write(cleaned_chunks, csv_path)
+                else:
+                    for _ in cleaned_chunks:
+                        pass
+                stage['rows'] = self.progress['rows_cleaned']
+            state.advance(csv_path, end)
+            
+            print(f"Data cleaning: {self.progress['rows_read']} -> {self.progress['rows_cleaned']} records "
+                  f"({state.trips.duplicates} duplicates removed)")
+            
+            return self.finish_streaming(driver_stats, aggregates, state, running)
+            
+        except Exception as e:
+            return self.failure(e)
+    
+    def process_nyc_data_incremental(self, source_path, chunksize=DEFAULT_CHUNKSIZE, cancel_event=None):
+        """Ingest only the trips added to the source since the last ingest.
+        
+        source_path is a CSV file or a directory of CSV files (one per month,
+        say). Each file is read from its watermark, the byte offset up to which
+        it was ingested, to its last complete line; a file that shrank or whose
+        bytes before the watermark changed is read again from the start, which
+        the trip hashes make safe. Trips seen before are dropped, the outlier
+        filter uses the stored coordinate statistics updated with the new rows,
+        and driver trip sums, rollups and the ETA model get the new trips added.
+        Rows kept by earlier runs are not re-filtered. The database writes
+        commit in one transaction; the trip store is left for full runs.
+        """
+        self.cancel_event = cancel_event
+        try:
+            self.progress = self.new_progress('scanning')
+            self.progress['started_at'] = datetime.now().isoformat()
+            state = IngestState(self.db)
+            running = self.new_coordinate_stats(state.coordinates)
+            ranges = state.pending_ranges(source_path)
+            
+            print(f"Scanning {len(ranges)} new source ranges in chunks of {chunksize} rows...")
+            with self.stage('load') as stage:
+                for path, start, end in ranges:
+                    self.scan_coordinate_stats(path, chunksize, running, start, end)
+                stage['rows'] = self.progress['rows_scanned']
+            coord_stats = self.coordinate_stats(running)
+            
+            self.progress['stage'] = 'cleaning'
+            driver_stats = {}
+            aggregates = self.new_aggregates(resume=True)
+            with self.stage('clean') as stage:
+                for path, start, end in ranges:
+                    for _ in self.clean_chunks(path, chunksize, coord_stats, driver_stats,
+                                               aggregates=aggregates, state=state, start=start, end=end):
+                        pass
+                    state.advance(path, end)
+                stage['rows'] = self.progress['rows_cleaned']
+            print(f"Data cleaning: {self.progress['rows_read']} new -> {self.progress['rows_cleaned']} records "
+                  f"({state.trips.duplicates} duplicates skipped)")
+            self.check_cancelled()
+            
+            self.progress['stage'] = 'profiling'
+            with self.stage('profile') as stage:
+                drivers, updates = self.apply_driver_deltas(state, driver_stats)
+                stage['rows'] = len(drivers) + len(updates)
+            self.progress['drivers_created'] = len(drivers)
+            self.progress['drivers_updated'] = len(updates)
+            self.check_cancelled()
+            
+            self.progress['stage'] = 'storing'
+            rollups = self.aggregate_statements(aggregates, replace=False)
+            statements = [(UPDATE_DRIVER_SQL, updates)] + rollups
+            statements += state.statements(self.coordinate_lists(running))
+            with self.stage('store') as stage:
+                self.store_drivers(drivers, statements=statements)
+                stage['rows'] = len(drivers) + len(updates)
+            self.progress['drivers_stored'] = len(drivers)
+            self.progress['rollup_rows'] = sum(len(rows) for _, rows in rollups)
+            self.save_eta(aggregates)
+            self.progress['stage'] = 'done'
+            
             return {
-                'success': False,
-                'error': str(e)
+                'success': True,
+                'processed_records': self.progress['rows_cleaned'],
+                'duplicates_skipped': state.trips.duplicates,
+                'drivers_created': len(drivers),
+                'drivers_updated': len(updates),
+                'sources': [{'source': path, 'from_offset': start, 'to_offset': end} for path, start, end in ranges],
+                'timestamp': datetime.now().isoformat()
             }
+            
+        except Exception as e:
+            return self.failure(e)
+    
+    def finish_streaming(self, driver_stats, aggregates=None, state=None, running=None):
+        """Build and store profiles (and trip aggregates and ingest state) from the streamed chunks and return the success result"""
+        self.progress['stage'] = 'profiling'
+        with self.stage('profile') as stage:
+            drivers = self.build_driver_profiles(driver_stats)
+            stage['rows'] = len(drivers)
+        self.progress['drivers_created'] = len(drivers)
+        self.check_cancelled()
+        
+        self.progress['stage'] = 'storing'
+        statements = self.state_statements(state, driver_stats, drivers, running) if state is not None else ()
+        with self.stage('store') as stage:
+            self.store_drivers(drivers, statements=statements)
+            stage['rows'] = len(drivers)
+        self.progress['drivers_stored'] = len(drivers)
+        if aggregates is not None:
+            self.store_aggregates(aggregates)
+        self.progress['stage'] = 'done'
+        
+        return {
+            'success': True,
+            'processed_records': self.progress['rows_cleaned'],
+            'duplicates_skipped': self.progress['duplicates_skipped'],
+            'drivers_created': len(drivers),
+            'timestamp': datetime.now().isoformat()
+        }
     
-    def clean_data(self, df):
+    def clean_chunks(self, csv_path, chunksize, coord_stats, driver_stats, output_path=None, aggregates=None,
+                     state=None, start=0, end=None):
+        """Second pass: yield cleaned chunks with derived features, folding each into driver_stats (and aggregates).
+        
+        With an IngestState, trips it has seen are dropped, the kept ones are
+        recorded in its trip index and the chunks are noted for the source's
+        watermark.
+        """
+        write_header = True
+        for chunk in self.read_trip_chunks(csv_path, chunksize, start, end):
+            self.check_cancelled()
+            self.progress['rows_read'] += len(chunk)
+            if state is not None:
+                state.observe(csv_path, chunk)
+                chunk = state.trips.new_rows(chunk)
+                self.progress['duplicates_skipped'] = state.trips.duplicates
+            
+            cleaned = self.add_trip_features(self.filter_outliers(self.filter_trips(chunk), coord_stats))
+            if state is not None:
+                # Kept trips only, the same rows the trip store path records
+                state.trips.record(cleaned['trip_hash'].to_numpy())
+            self.accumulate_driver_stats(driver_stats, cleaned)
+            if aggregates is not None:
+                self.add_aggregates(aggregates, cleaned)
+            
+            if output_path:
+                cleaned.to_csv(output_path, mode='w' if write_header else 'a',
+                               header=write_header, index=False)
+                write_header = False
+            
+            self.progress['rows_cleaned'] += len(cleaned)
+            self.progress['chunks_processed'] += 1
+            yield cleaned
+    
+    def read_trip_chunks(self, csv_path, chunksize=DEFAULT_CHUNKSIZE, start=0, end=None):
+        """Read only the needed trip columns and the trip id, chunksize rows at a time.
+        
+        Given end, only the bytes [start, end) of the file are read; start must
+        be 0 or the beginning of a line.
+        """
+        wanted = set(TRIP_COLUMNS) | set(DATE_COLUMNS) | set(OPTIONAL_TRIP_COLUMNS) | {TRIP_ID_COLUMN}
+        source, options = csv_path, {}
+        if end is not None:
+            source = open_range(csv_path, start, end)
+            if start > 0:
+                # Past the header line, so take the column names from it
+                options = {'names': read_header(csv_path), 'header': None}
+        return pd.read_csv(
+            source,
+            usecols=lambda column: column in wanted,
+            dtype={**TRIP_COLUMNS, **OPTIONAL_TRIP_COLUMNS, TRIP_ID_COLUMN: 'str'},
+            parse_dates=DATE_COLUMNS,
+            chunksize=chunksize,
+            **options
+        )
+    
+    def scan_coordinate_stats(self, csv_path, chunksize=DEFAULT_CHUNKSIZE, running=None, start=0, end=None):
+        """First pass: pickup coordinate mean/std over the bounds and duration filtered rows.
+        
+        running (from new_coordinate_stats) carries statistics over from
+        earlier rows and is updated in place.
+        """
+        running = self.new_coordinate_stats() if running is None else running
+        
+        for chunk in self.read_trip_chunks(csv_path, chunksize, start, end):
+            self.check_cancelled()
+            self.progress['rows_scanned'] += len(chunk)
+            self.update_coordinate_stats(running, self.filter_trips(chunk))
+        
+        return self.coordinate_stats(running)
+    
+    def new_coordinate_stats(self, saved=None):
+        """Running pickup latitude/longitude statistics, resumed from saved lists if given"""
+        saved = saved or {}
+        return {name: RunningStats.from_list(saved.get(name)) for name in ('lat', 'lng')}
+    
+    def update_coordinate_stats(self, running, df):
+        running['lat'].update(df['pickup_latitude'])
+        running['lng'].update(df['pickup_longitude'])
+    
+    def coordinate_stats(self, running):
+        return {
+            'lat_mean': running['lat'].mean, 'lat_std': running['lat'].std(),
+            'lng_mean': running['lng'].mean, 'lng_std': running['lng'].std()
+        }
+    
+    def clean_data(self, df, running=None):
         """Clean and filter the NYC taxi dataset using actual data patterns"""
         original_count = len(df)
         
+        df = self.filter_trips(df)
+        if running is not None:
+            self.update_coordinate_stats(running, df)
+        
+        # Remove unrealistic coordinates (statistical outliers)
+        coord_stats = {
+            'lat_mean': df['pickup_latitude'].mean(), 'lat_std': df['pickup_latitude'].std(),
+            'lng_mean': df['pickup_longitude'].mean(), 'lng_std': df['pickup_longitude'].std()
+        }
+        df = self.filter_outliers(df, coord_stats)
+        
+        print(f"Data cleaning: {original_count} -> {len(df)} records")
+        return df
+    
+    def filter_trips(self, df):
+        """Drop trips with missing coordinates, outside NYC or with unrealistic durations"""
         # Remove records with missing coordinates
         df = df.dropna(subset=[
             'pickup_latitude', 'pickup_longitude',
@@ -50,198 +571,255 @@ class DataProcessor:
         ])
         
         # Filter to realistic NYC area bounds
-        nyc_bounds = {
-            'min_lat': 40.50, 'max_lat': 41.00,
-            'min_lng': -74.30, 'max_lng': -73.70
-        }
-        
         df = df[
-            (df['pickup_latitude'].between(nyc_bounds['min_lat'], nyc_bounds['max_lat'])) &
-            (df['pickup_longitude'].between(nyc_bounds['min_lng'], nyc_bounds['max_lng'])) &
-            (df['dropoff_latitude'].between(nyc_bounds['min_lat'], nyc_bounds['max_lat'])) &
-            (df['dropoff_longitude'].between(nyc_bounds['min_lng'], nyc_bounds['max_lng']))
+            (df['pickup_latitude'].between(NYC_BOUNDS['min_lat'], NYC_BOUNDS['max_lat'])) &
+            (df['pickup_longitude'].between(NYC_BOUNDS['min_lng'], NYC_BOUNDS['max_lng'])) &
+            (df['dropoff_latitude'].between(NYC_BOUNDS['min_lat'], NYC_BOUNDS['max_lat'])) &
+            (df['dropoff_longitude'].between(NYC_BOUNDS['min_lng'], NYC_BOUNDS['max_lng']))
         ]
         
         # Remove unrealistic trip durations (1 minute to 3 hours)
-        df = df[
+        return df[
             (df['trip_duration'] > 60) &  
             (df['trip_duration'] < 10800)  
         ]
+    
+    def filter_outliers(self, df, coord_stats):
+        """Keep pickups within 3 standard deviations of the mean coordinates"""
+        lat_mean, lat_std = coord_stats['lat_mean'], coord_stats['lat_std']
+        lng_mean, lng_std = coord_stats['lng_mean'], coord_stats['lng_std']
         
-        # Remove unrealistic coordinates (statistical outliers)
-        lat_std = df['pickup_latitude'].std()
-        lat_mean = df['pickup_latitude'].mean()
-        lng_std = df['pickup_longitude'].std()
-        lng_mean = df['pickup_longitude'].mean()
-        
-        df = df[
+        return df[
             (df['pickup_latitude'].between(lat_mean - 3*lat_std, lat_mean + 3*lat_std)) &
             (df['pickup_longitude'].between(lng_mean - 3*lng_std, lng_mean + 3*lng_std))
         ]
+    
+    def add_trip_features(self, df):
+        """Add the derived columns the analytics use: distance, speed, fare per km, hour and date"""
+        pickup = pd.to_datetime(df['pickup_datetime'])
+        distance = haversine(
+            df['pickup_latitude'].to_numpy(), df['pickup_longitude'].to_numpy(),
+            df['dropoff_latitude'].to_numpy(), df['dropoff_longitude'].to_numpy()
+        )
+        
+        df = df.assign(
+            pickup_datetime=pickup,
+            distance_km=distance,
+            avg_speed_kmh=distance / (df['trip_duration'].to_numpy() / 3600),
+            trip_hour=pickup.dt.hour.astype('int8'),
+            pickup_date=np.datetime_as_string(pickup.to_numpy().astype('datetime64[D]'))
+        )
+        
+        if 'fare_amount' in df.columns:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                df['fare_per_km'] = np.where(distance > 0, df['fare_amount'].to_numpy() / distance, np.nan)
         
-        print(f"Data cleaning: {original_count} -> {len(df)} records")
         return df
     
-    def create_driver_profiles(self, df):
-        """Create realistic driver profiles from actual trip data"""
+    def create_driver_profiles(self, df, driver_stats=None):
+        """Create realistic driver profiles from actual trip data, filling driver_stats if given"""
         print("Creating driver profiles from real trip data...")
         
-        # Use vendor_id and trip patterns to create unique drivers
-        vendor_trips = df.groupby('vendor_id')
-        
-        drivers = []
-        driver_id = 1
-        
-        first_names = ['Michael', 'Sarah', 'David', 'James', 'Lisa', 'Robert', 'Jennifer', 
-                      'Christopher', 'Maria', 'William', 'Linda', 'Richard', 'Daniel', 
-                      'Susan', 'Joseph', 'Jessica', 'Thomas', 'Karen', 'Charles', 'Nancy']
-        
-        last_names = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller',
-                     'Davis', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez',
-                     'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin']
-        
-        # NYC neighborhoods with coordinates
-        nyc_neighborhoods = [
-            {'name': 'Financial District', 'lat': 40.7075, 'lng': -74.0113},
-            {'name': 'Midtown', 'lat': 40.7549, 'lng': -73.9840},
-            {'name': 'Upper East Side', 'lat': 40.7736, 'lng': -73.9566},
-            {'name': 'Upper West Side', 'lat': 40.7870, 'lng': -73.9754},
-            {'name': 'Chelsea', 'lat': 40.7465, 'lng': -74.0014},
-            {'name': 'Greenwich Village', 'lat': 40.7336, 'lng': -74.0027},
-            {'name': 'SoHo', 'lat': 40.7233, 'lng': -74.0030},
-            {'name': 'Williamsburg', 'lat': 40.7081, 'lng': -73.9571},
-            {'name': 'Astoria', 'lat': 40.7644, 'lng': -73.9235},
-            {'name': 'Harlem', 'lat': 40.8116, 'lng': -73.9465}
-        ]
+        # Use the driver key and trip patterns to create unique drivers
+        stats = parallel_trip_stats(df, self.driver_key, self.workers)
         
-        for vendor_id, vendor_data in vendor_trips:
-            if driver_id > 100:  # Limit to 100 drivers for performance
-                break
-                
-            if len(vendor_data) < 5:  # Skip vendors with very few trips
-                continue
-            
-            # Create driver profile based on actual trip patterns
-            first_name = np.random.choice(first_names)
-            last_name = np.random.choice(last_names)
-            
-            # Determine vehicle type based on trip characteristics
-            avg_passengers = vendor_data['passenger_count'].mean()
-            avg_duration = vendor_data['trip_duration'].mean()
-            avg_distance = self.calculate_avg_distance(vendor_data)
-            
-            vehicle_type = self.determine_vehicle_type(avg_passengers, avg_duration, avg_distance)
-            
-            # Calculate driver rating based on trip patterns (more trips = higher rating)
-            total_trips = len(vendor_data)
-            base_rating = 4.0 + min(total_trips / 1000, 1.0)  # 4.0 to 5.0 based on experience
-            rating = round(base_rating + np.random.uniform(-0.2, 0.2), 1)
-            
-            # Use actual pickup locations from the data
-            recent_trip = vendor_data.iloc[-1]  # Use most recent trip
-            neighborhood = np.random.choice(nyc_neighborhoods)
-            
-            # Add some randomness to location
-            lat_variation = np.random.uniform(-0.005, 0.005)
-            lng_variation = np.random.uniform(-0.005, 0.005)
-            
-            driver = {
-                'driver_id': f"DRV_{driver_id:03d}",
-                'name': f"{first_name} {last_name}",
-                'vehicle_type': vehicle_type,
-                'vehicle_name': self.get_vehicle_name(vehicle_type),
-                'license_plate': f"T{40000 + driver_id}",
-                'rating': max(3.5, min(5.0, rating)),  # Ensure rating between 3.5-5.0
-                'total_trips': total_trips,
-                'latitude': neighborhood['lat'] + lat_variation,
-                'longitude': neighborhood['lng'] + lng_variation,
-                'status': 'available' if np.random.random() > 0.25 else 'unavailable',
-                'eta_minutes': max(2, min(15, int(avg_duration / 60))),  # Based on actual trip patterns
-                'neighborhood': neighborhood['name']
-            }
-            
-            drivers.append(driver)
-            driver_id += 1
+        return self.build_driver_profiles(self.merge_driver_stats({} if driver_stats is None else driver_stats, stats))
+    
+    def accumulate_driver_stats(self, driver_stats, df):
+        """Fold a batch of cleaned trips into running per-driver sums"""
+        return self.merge_driver_stats(driver_stats, aggregate_trip_stats(df, self.driver_key))
+    
+    def merge_driver_stats(self, driver_stats, stats):
+        """Add an aggregate_trip_stats frame into a {driver key: sums} dict"""
+        for key, passengers, duration, distance, total_trips in zip(
+                stats.index, stats['passengers'].tolist(), stats['duration'].tolist(),
+                stats['distance'].tolist(), stats['total_trips'].tolist()):
+            entry = driver_stats.setdefault(key, {
+                'total_trips': 0, 'passengers': 0, 'duration': 0, 'distance': 0.0
+            })
+            entry['total_trips'] += total_trips
+            entry['passengers'] += passengers
+            entry['duration'] += duration
+            entry['distance'] += distance
+        return driver_stats
+    
+    def build_driver_profiles(self, driver_stats, first_id=1, max_drivers=None):
+        """Create driver profiles from per-driver trip aggregates.
+        
+        Drivers are generated in sorted key order from one RNG seeded with
+        self.seed, so a given seed always yields the same fleet. Each profile
+        records its driver key as 'trip_key'. Incremental runs number new
+        drivers from first_id and may create at most max_drivers of them.
+        """
+        limit = self.max_drivers if max_drivers is None else max_drivers
+        keys = [key for key in sorted(driver_stats) if driver_stats[key]['total_trips'] >= 5]  # Skip drivers with very few trips
+        if limit is not None:
+            keys = keys[:limit]
+        
+        total_trips = np.array([driver_stats[key]['total_trips'] for key in keys], dtype=np.int64)
+        trips = np.maximum(total_trips, 1)
+        
+        # Create driver profiles based on actual trip patterns
+        fleet = generate_fleet(
+            len(keys),
+            seed=self.seed if first_id == 1 or self.seed is None else [self.seed, first_id],
+            first_id=first_id,
+            total_trips=total_trips,
+            avg_passengers=np.array([driver_stats[key]['passengers'] for key in keys], dtype=np.float64) / trips,
+            avg_duration=np.array([driver_stats[key]['duration'] for key in keys], dtype=np.float64) / trips,
+            avg_distance=np.array([driver_stats[key]['distance'] for key in keys], dtype=np.float64) / trips
+        )
+        drivers = fleet_records(fleet)
+        for driver, key in zip(drivers, keys):
+            driver['trip_key'] = trip_key_text(key)
         
         print(f"Created {len(drivers)} drivers from real NYC taxi data")
         return drivers
     
-    def calculate_avg_distance(self, trip_data):
-        """Calculate average trip distance using Haversine formula"""
-        distances = []
-        for _, trip in trip_data.iterrows():
-            distance = self.calculate_distance(
-                trip['pickup_latitude'], trip['pickup_longitude'],
-                trip['dropoff_latitude'], trip['dropoff_longitude']
-            )
-            distances.append(distance)
-        
-        return np.mean(distances) if distances else 2.0
-    
-    def determine_vehicle_type(self, avg_passengers, avg_duration, avg_distance):
-        """Determine vehicle type based on trip characteristics"""
-        if avg_passengers > 3:
-            return 'suv'
-        elif avg_duration > 1800 or avg_distance > 10:  # Long trips
-            return 'premium'
-        elif avg_passengers == 1 and avg_duration < 600:  # Short solo trips
-            return 'standard'
-        else:
-            return 'accessible' if np.random.random() < 0.1 else 'standard'
-    
-    def get_vehicle_name(self, vehicle_type):
-        names = {
-            'standard': 'Standard Taxi',
-            'premium': 'Premium Sedan', 
-            'suv': 'SUV',
-            'accessible': 'Accessible Vehicle'
-        }
-        return names.get(vehicle_type, 'Standard Taxi')
+    def apply_driver_deltas(self, state, deltas):
+        """Add per-driver trip deltas to the stored sums.
+        
+        Drivers that already have a profile get their trip count, rating and
+        vehicle type recomputed from the merged sums the way
+        build_driver_profiles derives them, keeping the driver's own rating
+        noise and accessible vehicle. Their ETA is left alone: the trip-based
+        value only seeds a new driver's first position, and later positions
+        carry the ETA their updates report. Keys that now reach the minimum
+        trip count get new profiles, numbered after the existing drivers.
+        Returns (new drivers, (total_trips, rating, vehicle_type, driver_id) updates).
+        """
+        texts = {key: trip_key_text(key) for key in deltas}
+        stored = state.stored_driver_stats(list(texts.values()))
+        merged, driver_ids, profiled = {}, {}, []
+        for key, delta in deltas.items():
+            sums = dict(delta)
+            row = stored.get(texts[key])
+            if row is not None:
+                for name in ('total_trips', 'passengers', 'duration', 'distance'):
+                    sums[name] += row[name]
+                if row['driver_id'] is not None:
+                    driver_ids[texts[key]] = row['driver_id']
+                    if row['rating'] is not None:  # else the profile is gone, nothing to update
+                        profiled.append((sums, row))
+            merged[key] = sums
+        
+        updates = self.profile_updates(profiled)
+        candidates = {key: sums for key, sums in merged.items() if texts[key] not in driver_ids}
+        remaining = None if self.max_drivers is None else max(0, self.max_drivers - state.mapped_drivers())
+        drivers = self.build_driver_profiles(candidates, self.next_driver_number(), remaining) if candidates else []
+        driver_ids.update((driver['trip_key'], driver['driver_id']) for driver in drivers)
+        state.set_driver_stats(merged, driver_ids)
+        return drivers, updates
+    
+    def profile_updates(self, profiled):
+        """(total_trips, rating, vehicle_type, driver_id) rows for (merged sums, stored row) pairs"""
+        if not profiled:
+            return []
+        total_trips = np.array([sums['total_trips'] for sums, _ in profiled], dtype=np.int64)
+        trips = np.maximum(total_trips, 1)
+        previous_trips = np.array([row['total_trips'] for _, row in profiled], dtype=np.int64)
+        rating = np.array([row['rating'] for _, row in profiled], dtype=np.float64)
+        
+        # The stored rating less its experience term is the driver's noise, carried over
+        rating = experience_ratings(total_trips, rating - rating_base(previous_trips))
+        vehicle_type = classify_vehicles(
+            np.array([row['vehicle_type'] == 'accessible' for _, row in profiled]),
+            np.array([sums['passengers'] for sums, _ in profiled], dtype=np.float64) / trips,
+            np.array([sums['duration'] for sums, _ in profiled], dtype=np.float64) / trips,
+            np.array([sums['distance'] for sums, _ in profiled], dtype=np.float64) / trips
+        )
+        return list(zip(total_trips.tolist(), rating.tolist(), vehicle_type.tolist(),
+                        [row['driver_id'] for _, row in profiled]))
+    
+    def next_driver_number(self):
+        rows = self.db.execute_query(
+            "SELECT MAX(CAST(SUBSTR(driver_id, 5) AS INTEGER)) FROM drivers WHERE driver_id LIKE 'DRV!_%' ESCAPE '!'")
+        return (rows[0][0] or 0) + 1
+    
+    def coordinate_lists(self, running):
+        return {name: stats.to_list() for name, stats in running.items()}
+    
+    def state_statements(self, state, driver_stats, drivers, running):
+        """Statements replacing the incremental ingest state after a full run"""
+        state.set_driver_stats(driver_stats, {driver['trip_key']: driver['driver_id'] for driver in drivers})
+        return state.statements(self.coordinate_lists(running))
     
     def calculate_distance(self, lat1, lng1, lat2, lng2):
         """Calculate distance between two coordinates using Haversine formula"""
-        R = 6371  # Earth radius in km
-        
-        lat1, lng1, lat2, lng2 = map(math.radians, [lat1, lng1, lat2, lng2])
-        dlat = lat2 - lat1
-        dlng = lng2 - lng1
-        
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng/2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+        return float(haversine(lat1, lng1, lat2, lng2))
+    
+    def new_aggregates(self, resume=False):
+        """Per-run accumulators built from the cleaned trips alongside driver stats.
         
-        return R * c
+        With resume=True the ETA model continues from the saved one's sums; if
+        it kept none it is left alone rather than rebuilt from the new trips only.
+        """
+        aggregates = {'rollups': TripRollups(), 'tiles': PickupTiles(), 'eta': EtaModelBuilder()}
+        if resume:
+            aggregates['eta'] = EtaModelBuilder.resume(self.eta_path)
+            if aggregates['eta'] is None:
+                del aggregates['eta']
+        return aggregates
     
-    def store_drivers(self, drivers):
-        """Store drivers and their locations in the database"""
+    def add_aggregates(self, aggregates, df):
+        for aggregate in aggregates.values():
+            aggregate.add(df)
+    
+    def aggregate_statements(self, aggregates, replace=True):
+        """bulk_write statements for the aggregates kept in the database (rollups and heatmap tiles)"""
+        statements = []
+        for name in ('rollups', 'tiles'):
+            statements += aggregates[name].statements(replace)
+        return statements
+    
+    def store_aggregates(self, aggregates):
+        """Replace the analytics rollups, heatmap tiles and the ETA model with this run's"""
+        with self.stage('rollup') as stage:
+            statements = self.aggregate_statements(aggregates)
+            self.db.bulk_write(statements)
+            stage['rows'] = sum(len(rows) for query, rows in statements if 'INSERT' in query)
+        self.progress['rollup_rows'] = stage['rows']
+        print(f"Stored {stage['rows']} analytics rollup and heatmap tile rows")
+        self.save_eta(aggregates)
+    
+    def save_eta(self, aggregates):
+        if 'eta' not in aggregates:
+            return
+        with self.stage('eta') as stage:
+            stage['rows'] = aggregates['eta'].save(self.eta_path)
+        print(f"Built the ETA model from {stage['rows']} trips")
+    
+    def store_drivers(self, drivers, batch_size=DEFAULT_BATCH_SIZE, defer_indexes=False, statements=()):
+        """Store drivers and their locations in the database in one transaction, along with any further statements"""
         print(f"Storing {len(drivers)} drivers in database...")
         
-        for driver in drivers:
-            # Insert driver
-            self.db.execute_query("""
-                INSERT OR REPLACE INTO drivers 
-                (driver_id, name, vehicle_type, license_plate, rating, total_trips)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, [
+        last_update = datetime.now().isoformat()
+        driver_rows = (
+            (
                 driver['driver_id'],
                 driver['name'],
                 driver['vehicle_type'],
                 driver['license_plate'],
                 driver['rating'],
                 driver['total_trips']
-            ])
-            
-            # Insert location
-            self.db.execute_query("""
-                INSERT INTO driver_locations 
-                (driver_id, latitude, longitude, is_available, eta_minutes, last_update)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, [
+            )
+            for driver in drivers
+        )
+        location_rows = (
+            (
                 driver['driver_id'],
                 driver['latitude'],
                 driver['longitude'],
                 1 if driver['status'] == 'available' else 0,
                 driver['eta_minutes'],
-                datetime.now().isoformat()
-            ])
+                last_update
+            )
+            for driver in drivers
+        )
+        
+        self.db.bulk_write([
+            (INSERT_DRIVER_SQL, driver_rows),
+            (INSERT_LOCATION_SQL, location_rows)
+        ] + list(statements), batch_size=batch_size, defer_indexes=['driver_locations'] if defer_indexes else ())
         
-        print(f"Successfully stored {len(drivers)} drivers in database")
\ No newline at end of file
+        print(f"Successfully stored {len(drivers)} drivers in database")
@@ -1,15 +1,138 @@
 import sqlite3
 import os
-from datetime import datetime
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import islice
+from Backend import metrics
+
+QUERY_SECONDS = metrics.histogram(
+    'db_query_duration_seconds', 'Time spent executing SQL statements', ['operation'])
+QUERY_ROWS = metrics.counter(
+    'db_query_rows_total', 'Rows returned by reads or written by writes', ['operation'])
+
+# Tuning applied to every new connection
+CONNECTION_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',  # readers don't block the writer and vice versa
+    'PRAGMA synchronous=NORMAL',  # safe with WAL, one fsync per checkpoint instead of per commit
+    'PRAGMA cache_size=-65536',  # 64 MB page cache
+    'PRAGMA mmap_size=268435456',  # 256 MB memory-mapped reads
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=5000'
+]
+
+# Idle connections kept per process and prepared statements cached per connection
+POOL_SIZE = 8
+STATEMENT_CACHE_SIZE = 256
+
+# Location history older than this is pruned by compact_locations
+DEFAULT_RETENTION_HOURS = 24
+
+# Rows handed to each executemany call by the bulk write API
+DEFAULT_BATCH_SIZE = 5000
+
+INSERT_DRIVER_SQL = '''
+    INSERT OR REPLACE INTO drivers
+    (driver_id, name, vehicle_type, license_plate, rating, total_trips)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+INSERT_LOCATION_SQL = '''
+    INSERT INTO driver_locations
+    (driver_id, latitude, longitude, is_available, eta_minutes, last_update)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+class ConnectionPool:
+    """Thread-safe pool of persistent SQLite connections.
+    
+    A connection is only ever used by one thread at a time: it is checked
+    out for the duration of a statement or transaction and returned after.
+    When every pooled connection is busy a new one is opened, and surplus
+    connections are closed on release instead of being kept idle.
+    """
+    def __init__(self, factory, max_idle=POOL_SIZE):
+        self.factory = factory
+        self.idle = queue.LifoQueue(max_idle)
+    
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self.factory()
+    
+    def release(self, conn):
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+    
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+# Schema migrations in order as (description, Database method); PRAGMA
+# user_version holds how many have been applied. Append new steps, never edit
+# applied ones. The first only creates what is missing, so databases made
+# before versioning adopt it unchanged.
+MIGRATIONS = [
+    ('base tables, current-location trigger and trip rollups', 'create_schema'),
+    ('incremental ingest state', 'create_ingest_state'),
+    ('pickup heatmap tiles', 'create_pickup_tiles'),
+    ('drivers change counter', 'create_change_counters'),
+    ('ingest run trip staging', 'create_ingest_run_trips')
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
 
 class Database:
-    def __init__(self, db_path='nyc_taxi.db'):
+    def __init__(self, db_path='nyc_taxi.db', pool_size=POOL_SIZE, migrate=True):
         self.db_path = db_path
-        self.init_database()
+        self.pool_size = pool_size
+        self._pool_lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        if migrate:
+            self.migrate()
     
     def init_database(self):
         """Initialize database with required tables"""
-        conn = self.get_connection()
+        self.migrate()
+    
+    def schema_version(self):
+        with self.connection() as conn:
+            return conn.execute('PRAGMA user_version').fetchone()[0]
+    
+    def migrate(self):
+        """Apply the migrations this database hasn't had yet and return how many ran.
+        
+        An up-to-date database costs one PRAGMA read. Pending steps run in one
+        transaction under the write lock and the version is re-read once it is
+        held, so workers booting together apply each step exactly once.
+        """
+        with self.connection() as conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+                return 0
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                for number, (description, method) in enumerate(MIGRATIONS[version:], version + 1):
+                    getattr(self, method)(conn)
+                    conn.execute(f'PRAGMA user_version = {number}')
+                    print(f"Applied schema migration {number}: {description}")
+                conn.commit()
+                return max(0, SCHEMA_VERSION - version)
+            except Exception as e:
+                conn.rollback()
+                raise e
+    
+    def create_schema(self, conn):
+        """Migration 1: create tables and indexes that don't exist yet"""
         cursor = conn.cursor()
         
         # Drivers table
@@ -50,37 +173,357 @@ class Database:
             ON driver_locations(latitude, longitude)
         ''')
         
-        conn.commit()
-        conn.close()
+        # Latest known position per driver, kept in step with the append-only
+        # driver_locations log so reads scale with fleet size, not history
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS driver_current_locations (
+                driver_id TEXT PRIMARY KEY,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                is_available BOOLEAN DEFAULT 1,
+                eta_minutes INTEGER DEFAULT 5,
+                last_update TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (driver_id) REFERENCES drivers (driver_id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_current_availability 
+            ON driver_current_locations(is_available, last_update)
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_current_coords 
+            ON driver_current_locations(latitude, longitude)
+        ''')
+        
+        # Every appended location replaces the driver's current one, unless a
+        # newer position has already been recorded
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_locations_current
+            AFTER INSERT ON driver_locations
+            BEGIN
+                INSERT INTO driver_current_locations
+                (driver_id, latitude, longitude, is_available, eta_minutes, last_update)
+                VALUES (NEW.driver_id, NEW.latitude, NEW.longitude,
+                        NEW.is_available, NEW.eta_minutes, NEW.last_update)
+                ON CONFLICT(driver_id) DO UPDATE SET
+                    latitude = excluded.latitude,
+                    longitude = excluded.longitude,
+                    is_available = excluded.is_available,
+                    eta_minutes = excluded.eta_minutes,
+                    last_update = excluded.last_update
+                WHERE excluded.last_update >= driver_current_locations.last_update;
+            END
+        ''')
+        
+        # Trip analytics rollups, filled by the ingest (see analytics.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS trip_rollup_hourly (
+                pickup_date TEXT NOT NULL,
+                hour INTEGER NOT NULL,
+                trips INTEGER NOT NULL,
+                duration_sum REAL NOT NULL,
+                distance_sum REAL NOT NULL,
+                fare_sum REAL NOT NULL,
+                fare_distance_sum REAL NOT NULL,
+                PRIMARY KEY (pickup_date, hour)
+            ) WITHOUT ROWID
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS trip_rollup_cells (
+                hour_of_week INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                cell_row INTEGER NOT NULL,
+                cell_col INTEGER NOT NULL,
+                trips INTEGER NOT NULL,
+                duration_sum REAL NOT NULL,
+                distance_sum REAL NOT NULL,
+                fare_sum REAL NOT NULL,
+                fare_distance_sum REAL NOT NULL,
+                PRIMARY KEY (hour_of_week, month, cell_row, cell_col)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Backfill from history recorded before the current-state table existed
+        if cursor.execute('SELECT 1 FROM driver_current_locations LIMIT 1').fetchone() is None:
+            cursor.execute('''
+                INSERT INTO driver_current_locations
+                (driver_id, latitude, longitude, is_available, eta_minutes, last_update)
+                SELECT driver_id, latitude, longitude, is_available, eta_minutes, last_update
+                FROM driver_locations
+                WHERE id IN (SELECT MAX(id) FROM driver_locations GROUP BY driver_id)
+            ''')
+    
+    def create_ingest_state(self, conn):
+        """Migration 2: what incremental ingests continue from (see incremental.py)"""
+        # Hash of every ingested trip; the rowid key keeps the index at ~9 bytes a trip
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ingested_trips (
+                trip_hash INTEGER PRIMARY KEY
+            )
+        ''')
+        
+        # Per source file watermark: bytes ingested so far and a digest of the
+        # bytes just before, to tell an append from a rewrite
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_sources (
+                source TEXT PRIMARY KEY,
+                offset INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                tail_sha256 TEXT NOT NULL,
+                rows INTEGER NOT NULL,
+                last_pickup TEXT,
+                last_trip_id TEXT,
+                updated_at TEXT NOT NULL
+            )
+        ''')
+        
+        # Trip sums per driver key, and the driver profile built from them
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS driver_trip_stats (
+                trip_key TEXT PRIMARY KEY,
+                driver_id TEXT,
+                total_trips INTEGER NOT NULL,
+                passengers INTEGER NOT NULL,
+                duration INTEGER NOT NULL,
+                distance REAL NOT NULL
+            )
+        ''')
+        
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_state (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
+    
+    def create_pickup_tiles(self, conn):
+        """Migration 3: pickup counts per grid cell at every heatmap level (see heatmap.py)"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS pickup_tiles (
+                level INTEGER NOT NULL,
+                cell_row INTEGER NOT NULL,
+                cell_col INTEGER NOT NULL,
+                pickups INTEGER NOT NULL,
+                PRIMARY KEY (level, cell_row, cell_col)
+            ) WITHOUT ROWID
+        ''')
+    
+    def create_change_counters(self, conn):
+        """Migration 4: a counter bumped by every drivers write, so in-memory copies know to reload"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS change_counters (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        ''')
+        conn.execute("INSERT OR IGNORE INTO change_counters (name, version) VALUES ('drivers', 0)")
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_drivers_changed_{event.lower()}
+                AFTER {event} ON drivers
+                BEGIN
+                    UPDATE change_counters SET version = version + 1 WHERE name = 'drivers';
+                END
+            ''')
+    
+    def create_ingest_run_trips(self, conn):
+        """Migration 5: hashes of the trips a running ingest has kept, until it commits into ingested_trips"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_run_trips (
+                trip_hash INTEGER PRIMARY KEY
+            )
+        ''')
+    
+    def drivers_version(self):
+        """Changes whenever a drivers row is inserted, replaced, updated or deleted"""
+        return self.execute_query("SELECT version FROM change_counters WHERE name = 'drivers'")[0][0]
     
     def get_connection(self):
-        """Get database connection"""
-        conn = sqlite3.connect(self.db_path)
+        """Open a new tuned database connection"""
+        # check_same_thread is off because pooled connections move between
+        # threads; the pool guarantees only one thread uses them at a time
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
         conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
         return conn
     
+    def get_pool(self):
+        """Get this process's connection pool"""
+        pid = os.getpid()
+        if self._pool_pid != pid:
+            with self._pool_lock:
+                if self._pool_pid != pid:
+                    # Never reuse connections inherited across a fork (gunicorn
+                    # --preload workers): each process opens its own
+                    self._pool = ConnectionPool(self.get_connection, self.pool_size)
+                    self._pool_pid = pid
+        return self._pool
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection for the duration of a with block"""
+        pool = self.get_pool()
+        conn = pool.acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            pool.release(conn)
+    
+    def close(self):
+        """Close this process's idle pooled connections"""
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.close()
+    
     def execute_query(self, query, params=()):
         """Execute a query and return results"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        operation = query.split(None, 1)[0].lower() if query.strip() else 'empty'
+        start = time.perf_counter()
+        rows = 0
         
-        try:
-            cursor.execute(query, params)
+        with self.connection() as conn:
+            cursor = conn.cursor()
             
-            if query.strip().upper().startswith('SELECT'):
-                result = cursor.fetchall()
-            else:
+            try:
+                cursor.execute(query, params)
+                
+                if query.strip().upper().startswith('SELECT'):
+                    result = cursor.fetchall()
+                    rows = len(result)
+                else:
+                    conn.commit()
+                    result = cursor.lastrowid
+                    rows = max(cursor.rowcount, 0)
+                
+                return result
+            except Exception as e:
+                conn.rollback()
+                raise e
+            finally:
+                QUERY_SECONDS.observe(time.perf_counter() - start, operation=operation)
+                QUERY_ROWS.inc(rows, operation=operation)
+    
+    def bulk_write(self, statements, batch_size=DEFAULT_BATCH_SIZE, defer_indexes=()):
+        """Write many rows with batched executemany calls inside a single transaction.
+        
+        statements is a list of (query, rows) pairs executed in order; rows may be
+        any iterable and is consumed batch_size rows at a time. Indexes on the
+        tables named in defer_indexes are dropped before the load and rebuilt
+        once at the end, which is cheaper than maintaining them row by row on
+        large loads. Returns the total number of rows written.
+        """
+        if isinstance(defer_indexes, str):
+            defer_indexes = [defer_indexes]
+        start = time.perf_counter()
+        total = 0
+        
+        with self.connection() as conn:
+            try:
+                conn.execute('BEGIN')
+                deferred = self.drop_indexes(conn, defer_indexes)
+                
+                for query, rows in statements:
+                    rows = iter(rows)
+                    batch = list(islice(rows, batch_size))
+                    while batch:
+                        conn.executemany(query, batch)
+                        total += len(batch)
+                        batch = list(islice(rows, batch_size))
+                
+                for index_sql in deferred:
+                    conn.execute(index_sql)
                 conn.commit()
-                result = cursor.lastrowid
-            
-            return result
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+                return total
+            except Exception as e:
+                conn.rollback()
+                total = 0
+                raise e
+            finally:
+                QUERY_SECONDS.observe(time.perf_counter() - start, operation='bulk_write')
+                QUERY_ROWS.inc(total, operation='bulk_write')
+    
+    def execute_many(self, query, rows, batch_size=DEFAULT_BATCH_SIZE, defer_indexes=()):
+        """Run one statement for every row in a single batched transaction"""
+        return self.bulk_write([(query, rows)], batch_size, defer_indexes)
+    
+    def drop_indexes(self, conn, tables):
+        """Drop the explicit indexes on tables and return the SQL to rebuild them"""
+        rebuild = []
+        for table in tables:
+            indexes = conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                [table]
+            ).fetchall()
+            for index in indexes:
+                conn.execute(f'DROP INDEX "{index["name"]}"')
+                rebuild.append(index['sql'])
+        return rebuild
+    
+    def insert_locations(self, locations, batch_size=DEFAULT_BATCH_SIZE, defer_indexes=()):
+        """Append location rows (driver_id, latitude, longitude, is_available, eta_minutes, last_update)"""
+        return self.execute_many(INSERT_LOCATION_SQL, locations, batch_size, defer_indexes)
+    
+    def compact_locations(self, retention_hours=DEFAULT_RETENTION_HOURS, archive=False):
+        """Prune location history older than the retention window.
+        
+        Current positions in driver_current_locations are never touched. With
+        archive=True the pruned rows are first copied to driver_locations_archive.
+        Returns the number of history rows removed.
+        """
+        # last_update is local isoformat() text, so the cutoff has to be too
+        cutoff = (datetime.now() - timedelta(hours=float(retention_hours))).isoformat()
+        
+        with self.connection() as conn:
+            try:
+                conn.execute('BEGIN')
+                if archive:
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS driver_locations_archive
+                        AS SELECT * FROM driver_locations WHERE 0
+                    ''')
+                    conn.execute('''
+                        INSERT INTO driver_locations_archive
+                        SELECT * FROM driver_locations WHERE last_update < ?
+                    ''', [cutoff])
+                
+                deleted = conn.execute(
+                    "DELETE FROM driver_locations WHERE last_update < ?",
+                    [cutoff]
+                ).rowcount
+                conn.commit()
+                return deleted
+            except Exception as e:
+                conn.rollback()
+                raise e
     
     def clear_data(self):
         """Clear all existing data"""
         self.execute_query("DELETE FROM drivers")
-        self.execute_query("DELETE FROM driver_locations")
\ No newline at end of file
+        self.execute_query("DELETE FROM driver_locations")
+        self.execute_query("DELETE FROM driver_current_locations")
+        self.execute_query("DELETE FROM trip_rollup_hourly")
+        self.execute_query("DELETE FROM trip_rollup_cells")
+        self.execute_query("DELETE FROM pickup_tiles")
+        self.execute_query("DELETE FROM ingested_trips")
+        self.execute_query("DELETE FROM ingest_run_trips")
+        self.execute_query("DELETE FROM ingest_sources")
+        self.execute_query("DELETE FROM driver_trip_stats")
+        self.execute_query("DELETE FROM ingest_state")
+    
+    def ingest_sources(self):
+        """Watermarks of the source files ingested so far"""
+        rows = self.execute_query('''
+            SELECT source, offset, rows, last_pickup, last_trip_id, updated_at
+            FROM ingest_sources ORDER BY source
+        ''')
+        return [dict(row) for row in rows]
\ No newline at end of file
@@ -0,0 +1,191 @@
+import json
+import os
+import shutil
+import threading
+import numpy as np
+from Backend.geo import NYC_BOUNDS
+
+# Travel-time grid over the NYC bounds: 20 x 24 cells of about 2.5 km
+ETA_CELL_DEGREES = 0.025
+
+# Cell pairs with fewer trips in an hour fall back to the average pace for the hour
+MIN_CELL_TRIPS = 3
+
+DEFAULT_ETA_DIR = 'eta_model'
+
+def grid_shape(bounds=NYC_BOUNDS, cell_degrees=ETA_CELL_DEGREES):
+    rows = int(round((bounds['max_lat'] - bounds['min_lat']) / cell_degrees))
+    cols = int(round((bounds['max_lng'] - bounds['min_lng']) / cell_degrees))
+    return rows, cols
+
+def cell_index(lats, lngs, bounds=NYC_BOUNDS, cell_degrees=ETA_CELL_DEGREES):
+    """Flat grid cell of each point, -1 outside the bounds"""
+    rows, cols = grid_shape(bounds, cell_degrees)
+    row = np.floor((np.asarray(lats, dtype=np.float64) - bounds['min_lat']) / cell_degrees).astype(np.int64)
+    col = np.floor((np.asarray(lngs, dtype=np.float64) - bounds['min_lng']) / cell_degrees).astype(np.int64)
+    inside = (row >= 0) & (row < rows) & (col >= 0) & (col < cols)
+    return np.where(inside, row * cols + col, -1)
+
+class EtaModelBuilder:
+    """Accumulates trip pace (seconds per km) per hour x destination cell x origin cell"""
+    def __init__(self):
+        rows, cols = grid_shape()
+        self.cells = rows * cols
+        size = 24 * self.cells * self.cells
+        self.duration_sum = np.zeros(size, dtype=np.float64)
+        self.distance_sum = np.zeros(size, dtype=np.float64)
+        self.trip_count = np.zeros(size, dtype=np.int32)
+        self.hour_distance = np.zeros(24, dtype=np.float64)
+        self.hour_duration = np.zeros(24, dtype=np.float64)
+
+    @classmethod
+    def resume(cls, path=DEFAULT_ETA_DIR):
+        """A builder holding the sums of the saved model, or None if it didn't keep them"""
+        try:
+            sums = np.load(os.path.join(path, 'sums.npz'))
+        except OSError:
+            return None
+        builder = cls()
+        if sums['cells'] != builder.cells:
+            return None
+        index = sums['index']
+        builder.duration_sum[index] = sums['duration_sum']
+        builder.distance_sum[index] = sums['distance_sum']
+        builder.trip_count[index] = sums['trip_count']
+        builder.hour_distance[:] = sums['hour_distance']
+        builder.hour_duration[:] = sums['hour_duration']
+        return builder
+
+    def add(self, df):
+        """Fold in a frame of cleaned trips with derived features"""
+        if len(df) == 0:
+            return
+        hour = df['pickup_datetime'].dt.hour.to_numpy().astype(np.int64)
+        origin = cell_index(df['pickup_latitude'].to_numpy(), df['pickup_longitude'].to_numpy())
+        destination = cell_index(df['dropoff_latitude'].to_numpy(), df['dropoff_longitude'].to_numpy())
+        duration = df['trip_duration'].to_numpy(dtype=np.float64)
+        distance = df['distance_km'].to_numpy(dtype=np.float64)
+
+        inside = (origin >= 0) & (destination >= 0)
+        # Laid out [hour, destination, origin] so one request reads one contiguous row
+        flat = (hour[inside] * self.cells + destination[inside]) * self.cells + origin[inside]
+        # Sums over just the cells this batch touches, so small batches stay cheap
+        touched, slot = np.unique(flat, return_inverse=True)
+        self.duration_sum[touched] += np.bincount(slot, weights=duration[inside], minlength=len(touched))
+        self.distance_sum[touched] += np.bincount(slot, weights=distance[inside], minlength=len(touched))
+        self.trip_count[touched] += np.bincount(slot, minlength=len(touched)).astype(np.int32)
+
+        self.hour_distance += np.bincount(hour, weights=distance, minlength=24)
+        self.hour_duration += np.bincount(hour, weights=duration, minlength=24)
+
+    def save(self, path=DEFAULT_ETA_DIR):
+        """Write the matrix as a memory-mappable .npy next to its metadata, replacing any previous model"""
+        rows, cols = grid_shape()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Total time over total distance, so long trips weigh in by their length
+            known = (self.trip_count >= MIN_CELL_TRIPS) & (self.distance_sum > 0)
+            matrix = np.where(known, self.duration_sum / self.distance_sum, np.nan)
+            overall_pace = self.hour_duration.sum() / self.hour_distance.sum()
+            hourly_pace = np.where(self.hour_distance > 0, self.hour_duration / self.hour_distance, overall_pace)
+
+        staging = path + '.staging'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        np.save(os.path.join(staging, 'matrix.npy'),
+                matrix.astype(np.float32).reshape(24, self.cells, self.cells))
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump({
+                'bounds': NYC_BOUNDS,
+                'cell_degrees': ETA_CELL_DEGREES,
+                'rows': rows,
+                'cols': cols,
+                'hourly_pace_s_per_km': [float(pace) if np.isfinite(pace) else None for pace in hourly_pace],
+                'trips': int(self.trip_count.sum()),
+                'cell_pairs': int(known.sum())
+            }, f)
+        # The raw sums, only for the cell pairs seen, so an incremental ingest can add to them
+        index = np.flatnonzero(self.trip_count)
+        np.savez(os.path.join(staging, 'sums.npz'), cells=self.cells, index=index,
+                 duration_sum=self.duration_sum[index], distance_sum=self.distance_sum[index],
+                 trip_count=self.trip_count[index], hour_distance=self.hour_distance,
+                 hour_duration=self.hour_duration)
+
+        # Swap directories so readers never see a half-written model
+        previous = path + '.previous'
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.isdir(path):
+            os.replace(path, previous)
+        os.replace(staging, path)
+        shutil.rmtree(previous, ignore_errors=True)
+        return int(self.trip_count.sum())
+
+class EtaModel:
+    """Per-request ETAs from the saved travel-time matrix.
+
+    The matrix is memory-mapped, so only the rows requests touch are paged in,
+    and it is reopened whenever an ingest saves a new one. Each lookup reads a
+    single [hour, rider cell] row of paces and gathers every candidate's origin
+    cell from it, then scales the pace by the candidate's distance. Cell pairs
+    without enough trips use the average pace for that hour.
+    """
+    def __init__(self, path=DEFAULT_ETA_DIR):
+        self.path = path
+        self.lock = threading.Lock()
+        self.matrix = None
+        self.meta = None
+        self.loaded_mtime = None
+
+    def load(self):
+        """The current (matrix, meta), reloading after a rebuild; (None, None) before the first ingest"""
+        meta_path = os.path.join(self.path, 'meta.json')
+        try:
+            mtime = os.stat(meta_path).st_mtime_ns
+        except OSError:
+            return None, None
+        if mtime != self.loaded_mtime:
+            with self.lock:
+                if mtime != self.loaded_mtime:
+                    with open(meta_path) as f:
+                        meta = json.load(f)
+                    self.matrix = np.load(os.path.join(self.path, 'matrix.npy'), mmap_mode='r')
+                    self.meta = meta
+                    self.loaded_mtime = mtime
+        return self.matrix, self.meta
+
+    def version(self):
+        """Identifies the current model for cache validators, None before the first ingest"""
+        self.load()
+        return self.loaded_mtime
+
+    def estimate_minutes(self, lat, lng, driver_lats, driver_lngs, distances_km, hour, stored_minutes=None):
+        """Whole-minute ETA from each driver to (lat, lng) at an hour of day, or None without a model.
+
+        An hour without a pace of its own uses the median of the hourly paces;
+        with no paces at all, drivers keep their stored_minutes (or None is
+        returned when those aren't given).
+        """
+        matrix, meta = self.load()
+        if matrix is None:
+            return None
+        bounds, cell_degrees = meta['bounds'], meta['cell_degrees']
+
+        pace = np.full(len(distances_km), np.nan, dtype=np.float64)
+        destination = int(cell_index([lat], [lng], bounds, cell_degrees)[0])
+        if destination >= 0 and len(distances_km):
+            origin = cell_index(driver_lats, driver_lngs, bounds, cell_degrees)
+            inside = origin >= 0
+            pace[inside] = matrix[hour, destination][origin[inside]]
+        hour_pace = meta['hourly_pace_s_per_km'][hour]
+        if hour_pace is None:
+            paces = [value for value in meta['hourly_pace_s_per_km'] if value is not None]
+            hour_pace = float(np.median(paces)) if paces else np.nan
+        pace[np.isnan(pace)] = hour_pace
+        unknown = np.isnan(pace)
+        if unknown.any() and stored_minutes is None:
+            return None
+
+        seconds = np.asarray(distances_km, dtype=np.float64) * np.where(unknown, 0, pace)
+        minutes = np.maximum(1, np.ceil(seconds / 60)).astype(np.int64)
+        if unknown.any():
+            minutes[unknown] = np.asarray(stored_minutes)[unknown]
+        return minutes
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Synthetic Fleet Generator for NYC Taxi Driver Availability
+Builds N seeded, reproducible drivers with array operations. Run it directly
+to load a large synthetic fleet for load testing.
+"""
+
+import argparse
+import numpy as np
+from datetime import datetime
+from Backend.database import Database, INSERT_DRIVER_SQL, INSERT_LOCATION_SQL, DEFAULT_BATCH_SIZE
+
+FIRST_NAMES = np.array(['Michael', 'Sarah', 'David', 'James', 'Lisa', 'Robert', 'Jennifer',
+                        'Christopher', 'Maria', 'William', 'Linda', 'Richard', 'Daniel',
+                        'Susan', 'Joseph', 'Jessica', 'Thomas', 'Karen', 'Charles', 'Nancy'])
+
+LAST_NAMES = np.array(['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller',
+                       'Davis', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez',
+                       'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin'])
+
+# NYC neighborhoods with coordinates
+NYC_NEIGHBORHOODS = [
+    {'name': 'Financial District', 'lat': 40.7075, 'lng': -74.0113},
+    {'name': 'Midtown', 'lat': 40.7549, 'lng': -73.9840},
+    {'name': 'Upper East Side', 'lat': 40.7736, 'lng': -73.9566},
+    {'name': 'Upper West Side', 'lat': 40.7870, 'lng': -73.9754},
+    {'name': 'Chelsea', 'lat': 40.7465, 'lng': -74.0014},
+    {'name': 'Greenwich Village', 'lat': 40.7336, 'lng': -74.0027},
+    {'name': 'SoHo', 'lat': 40.7233, 'lng': -74.0030},
+    {'name': 'Williamsburg', 'lat': 40.7081, 'lng': -73.9571},
+    {'name': 'Astoria', 'lat': 40.7644, 'lng': -73.9235},
+    {'name': 'Harlem', 'lat': 40.8116, 'lng': -73.9465}
+]
+
+VEHICLE_NAMES = {
+    'standard': 'Standard Taxi',
+    'premium': 'Premium Sedan',
+    'suv': 'SUV',
+    'accessible': 'Accessible Vehicle'
+}
+
+def generate_fleet(count, seed=None, total_trips=None, avg_passengers=None,
+                   avg_duration=None, avg_distance=None, first_id=1, jitter=0.005):
+    """Generate count drivers as a dict of column arrays.
+
+    The trip statistics arrays drive vehicle type, rating and ETA the same way
+    build_driver_profiles always has; when omitted, plausible values are drawn.
+    jitter is the +/- degrees of noise around each driver's neighborhood.
+    The same seed always produces the same fleet.
+    """
+    rng = np.random.default_rng(seed)
+
+    if total_trips is None:
+        total_trips = rng.integers(5, 2000, count)
+    if avg_passengers is None:
+        avg_passengers = rng.uniform(1.0, 4.0, count)
+    if avg_duration is None:
+        avg_duration = rng.uniform(300, 2400, count)
+    if avg_distance is None:
+        avg_distance = rng.uniform(1.0, 12.0, count)
+    total_trips, avg_passengers, avg_duration, avg_distance = (
+        np.asarray(values) for values in (total_trips, avg_passengers, avg_duration, avg_distance)
+    )
+
+    ids = np.arange(first_id, first_id + count)
+    names = np.char.add(np.char.add(rng.choice(FIRST_NAMES, count), ' '), rng.choice(LAST_NAMES, count))
+
+    # Determine vehicle type based on trip characteristics
+    vehicle_type = classify_vehicles(rng.random(count) < 0.1, avg_passengers, avg_duration, avg_distance)
+    rating = experience_ratings(total_trips, rng.uniform(-0.2, 0.2, count))
+
+    neighborhood = rng.integers(len(NYC_NEIGHBORHOODS), size=count)
+    neighborhood_lat = np.array([n['lat'] for n in NYC_NEIGHBORHOODS])
+    neighborhood_lng = np.array([n['lng'] for n in NYC_NEIGHBORHOODS])
+
+    return {
+        'driver_id': np.char.add('DRV_', np.char.zfill(ids.astype(str), 3)),
+        'name': names,
+        'vehicle_type': vehicle_type,
+        'license_plate': np.char.add('T', (40000 + ids).astype(str)),
+        'rating': rating,
+        'total_trips': total_trips,
+        'latitude': neighborhood_lat[neighborhood] + rng.uniform(-jitter, jitter, count),
+        'longitude': neighborhood_lng[neighborhood] + rng.uniform(-jitter, jitter, count),
+        'is_available': rng.random(count) > 0.25,
+        'eta_minutes': trip_eta_minutes(avg_duration),
+        'neighborhood': neighborhood
+    }
+
+def classify_vehicles(accessible, avg_passengers, avg_duration, avg_distance):
+    """Vehicle type for each driver's average trip, for drivers flagged accessible or not"""
+    vehicle_type = np.where(accessible, 'accessible', 'standard')
+    vehicle_type = np.where((avg_passengers == 1) & (avg_duration < 600), 'standard', vehicle_type)  # Short solo trips
+    vehicle_type = np.where((avg_duration > 1800) | (avg_distance > 10), 'premium', vehicle_type)  # Long trips
+    return np.where(avg_passengers > 3, 'suv', vehicle_type)
+
+def rating_base(total_trips):
+    """More trips = higher rating, 4.0 to 5.0 based on experience"""
+    return 4.0 + np.minimum(np.asarray(total_trips) / 1000, 1.0)
+
+def experience_ratings(total_trips, noise):
+    """Ratings from trip counts plus per-driver noise, kept within 3.5-5.0"""
+    return np.clip(np.round(rating_base(total_trips) + noise, 1), 3.5, 5.0)
+
+def trip_eta_minutes(avg_duration):
+    """Starting ETA based on trip patterns"""
+    return np.clip((np.asarray(avg_duration) / 60).astype(int), 2, 15)
+
+def fleet_records(fleet):
+    """Driver dicts in the shape store_drivers and the API have always used"""
+    columns = {name: values.tolist() for name, values in fleet.items()}
+    return [
+        {
+            'driver_id': columns['driver_id'][i],
+            'name': columns['name'][i],
+            'vehicle_type': columns['vehicle_type'][i],
+            'vehicle_name': VEHICLE_NAMES.get(columns['vehicle_type'][i], 'Standard Taxi'),
+            'license_plate': columns['license_plate'][i],
+            'rating': columns['rating'][i],
+            'total_trips': columns['total_trips'][i],
+            'latitude': columns['latitude'][i],
+            'longitude': columns['longitude'][i],
+            'status': 'available' if columns['is_available'][i] else 'unavailable',
+            'eta_minutes': columns['eta_minutes'][i],
+            'neighborhood': NYC_NEIGHBORHOODS[columns['neighborhood'][i]]['name']
+        }
+        for i in range(len(columns['driver_id']))
+    ]
+
+def store_fleet(db, fleet, batch_size=DEFAULT_BATCH_SIZE):
+    """Bulk-load a generated fleet straight from its arrays, without per-driver dicts"""
+    last_update = datetime.now().isoformat()
+    driver_rows = zip(
+        fleet['driver_id'].tolist(), fleet['name'].tolist(), fleet['vehicle_type'].tolist(),
+        fleet['license_plate'].tolist(), fleet['rating'].tolist(), fleet['total_trips'].tolist()
+    )
+    location_rows = zip(
+        fleet['driver_id'].tolist(), fleet['latitude'].tolist(), fleet['longitude'].tolist(),
+        fleet['is_available'].astype(int).tolist(), fleet['eta_minutes'].tolist(),
+        [last_update] * len(fleet['driver_id'])
+    )
+
+    return db.bulk_write([
+        (INSERT_DRIVER_SQL, driver_rows),
+        (INSERT_LOCATION_SQL, location_rows)
+    ], batch_size=batch_size)
+
+def main():
+    parser = argparse.ArgumentParser(description='Load a synthetic driver fleet')
+    parser.add_argument('--db', default='nyc_taxi.db', help='SQLite database path')
+    parser.add_argument('--drivers', type=int, default=100000, help='Number of drivers')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--jitter', type=float, default=0.05,
+                        help='Degrees of noise around each neighborhood')
+    args = parser.parse_args()
+
+    db = Database(args.db)
+
+    print(f"🚕 Generating {args.drivers} drivers (seed {args.seed})...")
+    fleet = generate_fleet(args.drivers, seed=args.seed, jitter=args.jitter)
+    store_fleet(db, fleet)
+    print(f"✅ Stored {args.drivers} synthetic drivers in {args.db}")
+
+if __name__ == '__main__':
+    main()
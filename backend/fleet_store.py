@@ -0,0 +1,272 @@
+import json
+import sys
+import threading
+import numpy as np
+from Backend import metrics
+from Backend.fleet import VEHICLE_NAMES
+from Backend.geo import haversine_one_to_many, bounding_box
+from Backend.stats import window_cutoff
+
+# Catching up on more changed rows than this reloads the whole fleet instead
+MAX_SYNC_ROWS = 200000
+
+INITIAL_CAPACITY = 1024
+
+FLEET_SIZE = metrics.gauge('fleet_store_drivers', 'Drivers held in the in-memory fleet store')
+
+# The NumPy columns of a snapshot
+COLUMNS = ('latitude', 'longitude', 'is_available', 'eta_minutes', 'rating',
+           'total_trips', 'vehicle_type', 'last_update')
+
+# Driver columns read alongside each location row
+FLEET_QUERY = '''
+    SELECT dl.driver_id, dl.latitude, dl.longitude, dl.is_available, dl.eta_minutes, dl.last_update,
+           d.name, d.vehicle_type, d.license_plate, d.rating, d.total_trips
+    FROM {table} dl
+    JOIN drivers d ON d.driver_id = dl.driver_id
+'''
+
+class FleetSnapshot:
+    """Driver positions held in contiguous NumPy columns.
+
+    One row per driver: coordinates, availability, ETA, rating and trip count
+    are numeric arrays, vehicle type is a small-int category, and the string
+    fields are interned and kept pre-encoded as JSON. Searches are vectorized
+    over the arrays and to_json() writes results without building per-driver
+    dicts. A snapshot is filled once and then only read, so a request can
+    hold one and use its row numbers throughout.
+    """
+    def __init__(self, capacity=INITIAL_CAPACITY, generation=None):
+        self.generation = generation  # of the FleetStore this came from, None when standalone
+        self.version = None  # set by FleetStore before publishing
+        self.vehicle_types = list(VEHICLE_NAMES)
+        self.vehicle_codes = {name: code for code, name in enumerate(self.vehicle_types)}
+        self.size = 0
+        self.index = {}  # driver_id -> row
+        self.driver_ids = []
+        self.ids_json = []  # JSON string contents, the same object unless escaping was needed
+        self.names = []  # JSON-encoded, interned
+        self.plates = []  # JSON-encoded
+        self.latitude = np.zeros(capacity, dtype=np.float64)
+        self.longitude = np.zeros(capacity, dtype=np.float64)
+        self.is_available = np.zeros(capacity, dtype=np.bool_)
+        self.eta_minutes = np.zeros(capacity, dtype=np.int16)
+        self.rating = np.zeros(capacity, dtype=np.float32)
+        self.total_trips = np.zeros(capacity, dtype=np.int32)
+        self.vehicle_type = np.zeros(capacity, dtype=np.int8)
+        # Same text as the database so freshness compares exactly like the SQL
+        self.last_update = np.zeros(capacity, dtype='S32')
+
+    @classmethod
+    def from_rows(cls, rows, generation=None):
+        """A snapshot holding the given FLEET_QUERY rows"""
+        snapshot = cls(max(INITIAL_CAPACITY, len(rows)), generation)
+        snapshot.apply_rows(rows)
+        return snapshot
+
+    def copy(self):
+        """An independent copy to apply further rows to; existing rows keep their numbers"""
+        snapshot = FleetSnapshot.__new__(FleetSnapshot)
+        snapshot.__dict__.update(self.__dict__)
+        for name in ('vehicle_types', 'driver_ids', 'ids_json', 'names', 'plates'):
+            setattr(snapshot, name, list(getattr(self, name)))
+        snapshot.vehicle_codes = dict(self.vehicle_codes)
+        snapshot.index = dict(self.index)
+        for name in COLUMNS:
+            setattr(snapshot, name, getattr(self, name).copy())
+        return snapshot
+
+    def apply_rows(self, rows):
+        for row in rows:
+            last_update = str(row['last_update']).encode()
+            driver_id = row['driver_id']
+            i = self.index.get(driver_id)
+            if i is None:
+                i = self.append(row)
+            # Driver columns come from the drivers table as it is now, whatever the position's age
+            self.set_driver(i, row)
+            if last_update < self.last_update[i]:
+                continue  # an older position than the one held
+
+            self.latitude[i] = row['latitude']
+            self.longitude[i] = row['longitude']
+            self.is_available[i] = row['is_available'] == 1
+            self.eta_minutes[i] = row['eta_minutes'] or 0
+            self.last_update[i] = last_update
+
+    def append(self, row):
+        if self.size == len(self.latitude):
+            self.grow()
+        i = self.size
+        self.size += 1
+
+        driver_id = sys.intern(row['driver_id'])
+        self.index[driver_id] = i
+        self.driver_ids.append(driver_id)
+        escaped = json.dumps(driver_id)[1:-1]
+        self.ids_json.append(driver_id if escaped == driver_id else escaped)
+        self.names.append(None)
+        self.plates.append(None)
+        self.last_update[i] = b''
+        return i
+
+    def set_driver(self, i, row):
+        self.names[i] = sys.intern(json.dumps(row['name']))
+        self.plates[i] = json.dumps(row['license_plate'])
+        self.rating[i] = np.nan if row['rating'] is None else row['rating']
+        self.total_trips[i] = row['total_trips'] or 0
+
+        vehicle_type = row['vehicle_type']
+        code = self.vehicle_codes.get(vehicle_type)
+        if code is None:
+            code = self.vehicle_codes[vehicle_type] = len(self.vehicle_types)
+            self.vehicle_types.append(vehicle_type)
+        self.vehicle_type[i] = code
+
+    def grow(self):
+        capacity = max(INITIAL_CAPACITY, len(self.latitude) * 2)
+        for name in COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def search(self, lat, lng, radius_km, vehicle_type='all', since=None):
+        """Live rows (reported in the last 30 minutes, and at or after since) inside the search bounding box"""
+        return self.search_box(bounding_box(lat, lng, radius_km), vehicle_type, since)
+
+    def search_box(self, box, vehicle_type='all', since=None):
+        """Live rows (reported in the last 30 minutes, and at or after since) inside a bounding box"""
+        n = self.size
+        mask = self.in_box(box)
+        mask &= self.last_update[:n] >= window_cutoff().encode()
+        if since is not None:
+            mask &= self.last_update[:n] >= since.encode()
+        if vehicle_type != 'all':
+            code = self.vehicle_codes.get(vehicle_type)
+            if code is None:
+                return np.zeros(0, dtype=np.int64)
+            mask &= self.vehicle_type[:n] == code
+        return np.flatnonzero(mask)
+
+    def available(self, box):
+        """Live rows (reported in the last 30 minutes) of available drivers inside a bounding box"""
+        n = self.size
+        mask = self.in_box(box) & self.is_available[:n]
+        mask &= self.last_update[:n] >= window_cutoff().encode()
+        return np.flatnonzero(mask)
+
+    def in_box(self, box):
+        latitude = self.latitude[:self.size]
+        longitude = self.longitude[:self.size]
+        return ((latitude >= box['min_lat']) & (latitude <= box['max_lat'])
+                & (longitude >= box['min_lng']) & (longitude <= box['max_lng']))
+
+    def nearest(self, lat, lng, radius_km, rows, limit=None):
+        """Of the given rows, those within radius_km nearest first, with their distances"""
+        distances = haversine_one_to_many(lat, lng, self.latitude[rows], self.longitude[rows])
+        within = np.flatnonzero(distances <= radius_km)
+        within = within[np.argsort(distances[within], kind='stable')][:limit]
+        return rows[within], distances[within]
+
+    def to_json(self, rows, distances, eta=None):
+        """JSON array of availability driver objects for rows, straight from the columns.
+
+        eta gives per-row minutes to report instead of the stored eta_minutes.
+        """
+        vehicle_json = [(json.dumps(name), json.dumps(VEHICLE_NAMES.get(name, name)))
+                        for name in self.vehicle_types]
+        columns = zip(
+            rows.tolist(), self.latitude[rows].tolist(), self.longitude[rows].tolist(),
+            self.is_available[rows].tolist(), (self.eta_minutes[rows] if eta is None else eta).tolist(),
+            np.round(self.rating[rows].astype(np.float64), 2).tolist(), self.total_trips[rows].tolist(),
+            self.vehicle_type[rows].tolist(), self.last_update[rows].astype(str).tolist(),
+            np.round(distances, 2).tolist()
+        )
+        return '[' + ','.join(
+            f'{{"id":"{self.ids_json[i]}","name":{self.names[i]},'
+            f'"vehicle_type":{vehicle_json[code][0]},"vehicle_name":{vehicle_json[code][1]},'
+            f'"license_plate":{self.plates[i]},"rating":{"null" if rating != rating else rating!r},"total_trips":{trips},'
+            f'"latitude":{lat!r},"longitude":{lng!r},"last_update":"{last_update}",'
+            f'"status":"{"available" if available else "unavailable"}","eta_minutes":{eta},'
+            f'"distance_km":{distance!r}}}'
+            for i, lat, lng, available, eta, rating, trips, code, last_update, distance in columns
+        ) + ']'
+
+    def columns(self, rows, distances, eta=None):
+        """The to_json() fields as one list per field, for the columnar formats"""
+        vehicle_names = [VEHICLE_NAMES.get(name, name) for name in self.vehicle_types]
+        codes = self.vehicle_type[rows].tolist()
+        rows_list = rows.tolist()
+        return {
+            'id': [self.driver_ids[i] for i in rows_list],
+            # One parse of the pre-encoded strings instead of one per driver
+            'name': json.loads('[' + ','.join([self.names[i] for i in rows_list]) + ']'),
+            'vehicle_type': [self.vehicle_types[code] for code in codes],
+            'vehicle_name': [vehicle_names[code] for code in codes],
+            'license_plate': json.loads('[' + ','.join([self.plates[i] for i in rows_list]) + ']'),
+            'rating': [None if rating != rating else rating
+                       for rating in np.round(self.rating[rows].astype(np.float64), 2).tolist()],
+            'total_trips': self.total_trips[rows].tolist(),
+            'latitude': self.latitude[rows].tolist(),
+            'longitude': self.longitude[rows].tolist(),
+            'last_update': self.last_update[rows].astype(str).tolist(),
+            'status': np.where(self.is_available[rows], 'available', 'unavailable').tolist(),
+            'eta_minutes': (self.eta_minutes[rows] if eta is None else eta).tolist(),
+            'distance_km': np.round(distances, 2).tolist()
+        }
+
+    def ids(self, rows):
+        return [self.driver_ids[i] for i in rows.tolist()]
+
+class FleetStore:
+    """The current fleet, followed from the database as a series of FleetSnapshots.
+
+    The store follows driver_locations by id like the stats aggregator,
+    applying each update the way trg_locations_current does, and reloads
+    when the drivers change counter moves so name, plate and vehicle type
+    edits show up too. Each sync builds its changes into a new snapshot and
+    publishes it with one assignment, so readers never see a half-applied
+    update; callers take the snapshot sync() returns and read only from it.
+    Row numbers stay valid across snapshots of the same generation, which
+    only changes on a reload.
+    """
+    def __init__(self, db=None):
+        self.db = db
+        self.lock = threading.Lock()
+        self.cursor = None
+        self.drivers_version = None
+        self.generation = 0
+        self.snapshot = FleetSnapshot(generation=self.generation)
+
+    def sync(self):
+        """Apply location rows written since the last sync, reloading when far behind or drivers changed.
+
+        Returns the current snapshot.
+        """
+        with self.lock:
+            last_id, drivers_version = self.db.execute_query(
+                "SELECT (SELECT COALESCE(MAX(id), 0) FROM driver_locations), "
+                "(SELECT version FROM change_counters WHERE name = 'drivers')"
+            )[0]
+            if (self.cursor is None or last_id < self.cursor or last_id - self.cursor > MAX_SYNC_ROWS
+                    or drivers_version != self.drivers_version):
+                rows = self.db.execute_query(FLEET_QUERY.format(table='driver_current_locations'))
+                self.generation += 1  # row numbers from before this point mean nothing now
+                snapshot = FleetSnapshot.from_rows(rows, self.generation)
+            elif last_id > self.cursor:
+                rows = self.db.execute_query(
+                    FLEET_QUERY.format(table='driver_locations') + ' WHERE dl.id > ? AND dl.id <= ? ORDER BY dl.id',
+                    [self.cursor, last_id]
+                )
+                snapshot = self.snapshot.copy()
+                snapshot.apply_rows(rows)
+            else:
+                return self.snapshot
+            self.cursor = last_id
+            self.drivers_version = drivers_version
+            # Identifies the data held: changes with every reload, location row and drivers write
+            snapshot.version = (self.generation, self.cursor, self.drivers_version)
+            self.snapshot = snapshot
+            FLEET_SIZE.set(snapshot.size)
+            return snapshot
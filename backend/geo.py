@@ -0,0 +1,66 @@
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371  # Earth radius in km
+
+# Realistic NYC area bounds
+NYC_BOUNDS = {
+    'min_lat': 40.50, 'max_lat': 41.00,
+    'min_lng': -74.30, 'max_lng': -73.70
+}
+
+def haversine(lat1, lng1, lat2, lng2):
+    """Element-wise Haversine distance in km between two sets of coordinates.
+
+    Inputs may be scalars or arrays of matching (or broadcastable) shape.
+    """
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=np.float64))
+                              for v in (lat1, lng1, lat2, lng2))
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def haversine_one_to_many(lat, lng, lats, lngs):
+    """Distance in km from one point to every point in lats/lngs"""
+    return haversine(lat, lng, lats, lngs)
+
+def haversine_matrix(lats1, lngs1, lats2, lngs2):
+    """Distance matrix in km: one row per point in the first set, one column per point in the second"""
+    lats1 = np.asarray(lats1, dtype=np.float64)[:, np.newaxis]
+    lngs1 = np.asarray(lngs1, dtype=np.float64)[:, np.newaxis]
+    return haversine(lats1, lngs1, lats2, lngs2)
+
+def unit_vectors(lats, lngs):
+    """Points as unit vectors on the sphere, one row each.
+
+    The dot product of two rows is the cosine of their central angle, so it
+    orders pairs by distance the same way Haversine does and a whole distance
+    matrix comes from one matrix product.
+    """
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lngs = np.radians(np.asarray(lngs, dtype=np.float64))
+    return np.column_stack([np.cos(lats) * np.cos(lngs), np.cos(lats) * np.sin(lngs), np.sin(lats)])
+
+def bounding_box(lat, lng, radius_km):
+    """Lat/lng box that contains every point within radius_km of (lat, lng).
+
+    Used as a cheap, index-friendly prefilter before the exact Haversine check.
+    """
+    dlat = float(np.degrees(radius_km / EARTH_RADIUS_KM))
+    dlng = dlat / max(float(np.cos(np.radians(lat))), 1e-6)
+    return {
+        'min_lat': lat - dlat, 'max_lat': lat + dlat,
+        'min_lng': lng - dlng, 'max_lng': lng + dlng
+    }
+
+def grid_cell(lat, lng, cell_degrees):
+    """Integer (row, col) of the lat/lng grid cell containing a point"""
+    return (math.floor(lat / cell_degrees), math.floor(lng / cell_degrees))
+
+def cells_covering(box, cell_degrees):
+    """Every grid cell that overlaps a bounding_box"""
+    min_row, min_col = grid_cell(box['min_lat'], box['min_lng'], cell_degrees)
+    max_row, max_col = grid_cell(box['max_lat'], box['max_lng'], cell_degrees)
+    return [(row, col) for row in range(min_row, max_row + 1) for col in range(min_col, max_col + 1)]
@@ -0,0 +1,132 @@
+import numpy as np
+
+# Finest pickup grid (about 140 m); each level up doubles the cell side
+TILE_BASE_DEGREES = 0.00125
+TILE_LEVELS = 7  # 0.00125 to 0.08 degrees
+
+# Grid cells across one 256 px web map tile at the requested zoom (8 px each)
+CELLS_PER_MAP_TILE = 32
+
+# Boxes spanning more cells than this are served from a coarser level
+MAX_TILE_CELLS = 40000
+
+# Cell (row, col) pairs packed into one int64 for sorting and counting
+KEY_OFFSET = 1 << 20
+KEY_SPAN = 1 << 21
+
+UPSERT_TILES_SQL = '''
+    INSERT INTO pickup_tiles (level, cell_row, cell_col, pickups)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(level, cell_row, cell_col) DO UPDATE SET
+        pickups = pickups + excluded.pickups
+'''
+
+def level_degrees(level):
+    return TILE_BASE_DEGREES * 2 ** level
+
+def tile_level(zoom, box):
+    """Finest level at least as coarse as the zoom's cell size whose grid over box stays within MAX_TILE_CELLS"""
+    target = 360.0 / 2 ** zoom / CELLS_PER_MAP_TILE
+    for level in range(TILE_LEVELS):
+        degrees = level_degrees(level)
+        if degrees < target * 0.999:
+            continue
+        rows = (box['max_lat'] - box['min_lat']) / degrees + 1
+        cols = (box['max_lng'] - box['min_lng']) / degrees + 1
+        if rows * cols <= MAX_TILE_CELLS:
+            return level
+    return TILE_LEVELS - 1
+
+def cell_range(box, level):
+    """Inclusive (min_row, max_row, min_col, max_col) of the level's cells touching box"""
+    degrees = level_degrees(level)
+    return (
+        int(np.floor(box['min_lat'] / degrees)), int(np.floor(box['max_lat'] / degrees)),
+        int(np.floor(box['min_lng'] / degrees)), int(np.floor(box['max_lng'] / degrees))
+    )
+
+def cell_box(box, level):
+    """box grown to the outer edges of the level's cells touching it"""
+    degrees = level_degrees(level)
+    min_row, max_row, min_col, max_col = cell_range(box, level)
+    return {
+        'min_lat': min_row * degrees, 'max_lat': (max_row + 1) * degrees,
+        'min_lng': min_col * degrees, 'max_lng': (max_col + 1) * degrees
+    }
+
+def base_cells(lats, lngs):
+    # Level k cells are these shifted right by k: floor(floor(x / d) / 2**k) == floor(x / (d * 2**k))
+    rows = np.floor(np.asarray(lats, dtype=np.float64) / TILE_BASE_DEGREES).astype(np.int64)
+    cols = np.floor(np.asarray(lngs, dtype=np.float64) / TILE_BASE_DEGREES).astype(np.int64)
+    return rows, cols
+
+def encode(rows, cols):
+    return (rows + KEY_OFFSET) * KEY_SPAN + (cols + KEY_OFFSET)
+
+def decode(keys):
+    return keys // KEY_SPAN - KEY_OFFSET, keys % KEY_SPAN - KEY_OFFSET
+
+class PickupTiles:
+    """Pickup counts per cell at every tile level, accumulated across ingest chunks"""
+    def __init__(self):
+        self.keys = [np.zeros(0, dtype=np.int64) for _ in range(TILE_LEVELS)]
+        self.counts = [np.zeros(0, dtype=np.int64) for _ in range(TILE_LEVELS)]
+
+    def add(self, df):
+        if len(df) == 0:
+            return
+        rows, cols = base_cells(df['pickup_latitude'].to_numpy(), df['pickup_longitude'].to_numpy())
+        for level in range(TILE_LEVELS):
+            keys, counts = np.unique(encode(rows >> level, cols >> level), return_counts=True)
+            merged, inverse = np.unique(np.concatenate([self.keys[level], keys]), return_inverse=True)
+            self.counts[level] = np.bincount(
+                inverse, weights=np.concatenate([self.counts[level], counts]), minlength=len(merged)
+            ).astype(np.int64)
+            self.keys[level] = merged
+
+    def rows(self):
+        """(level, cell_row, cell_col, pickups) rows for the upsert statement"""
+        result = []
+        for level in range(TILE_LEVELS):
+            rows, cols = decode(self.keys[level])
+            result += zip([level] * len(rows), rows.tolist(), cols.tolist(), self.counts[level].tolist())
+        return result
+
+    def statements(self, replace=True):
+        """bulk_write statements storing the counts, replacing what is stored unless replace=False"""
+        statements = [('DELETE FROM pickup_tiles', [()])] if replace else []
+        return statements + [(UPSERT_TILES_SQL, self.rows())]
+
+def pickup_counts(db, level, box):
+    """{(cell_row, cell_col): pickups} for the level's cells touching box"""
+    min_row, max_row, min_col, max_col = cell_range(box, level)
+    rows = db.execute_query('''
+        SELECT cell_row, cell_col, pickups FROM pickup_tiles
+        WHERE level = ? AND cell_row BETWEEN ? AND ? AND cell_col BETWEEN ? AND ?
+    ''', [level, min_row, max_row, min_col, max_col])
+    return {(row[0], row[1]): row[2] for row in rows}
+
+def driver_counts(store, rows, level, box):
+    """{(cell_row, cell_col): drivers} over the given fleet snapshot rows, for the level's cells touching box"""
+    min_row, max_row, min_col, max_col = cell_range(box, level)
+    cell_rows, cell_cols = base_cells(store.latitude[rows], store.longitude[rows])
+    cell_rows >>= level
+    cell_cols >>= level
+    inside = (cell_rows >= min_row) & (cell_rows <= max_row) & (cell_cols >= min_col) & (cell_cols <= max_col)
+    keys, counts = np.unique(encode(cell_rows[inside], cell_cols[inside]), return_counts=True)
+    cell_rows, cell_cols = decode(keys)
+    return dict(zip(zip(cell_rows.tolist(), cell_cols.tolist()), counts.tolist()))
+
+def tile_cells(level, pickups, drivers):
+    """Cells with pickups or available drivers, in (row, col) order"""
+    degrees = level_degrees(level)
+    return [
+        {
+            'cell': [row, col],
+            'lat': round((row + 0.5) * degrees, 6),
+            'lng': round((col + 0.5) * degrees, 6),
+            'pickups': pickups.get((row, col), 0),
+            'available_drivers': drivers.get((row, col), 0)
+        }
+        for row, col in sorted(pickups.keys() | drivers.keys())
+    ]
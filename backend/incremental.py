@@ -0,0 +1,293 @@
+import csv
+import glob
+import hashlib
+import io
+import json
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# A trip is identified by its id when the source has one, else by these columns
+TRIP_ID_COLUMN = 'id'
+TRIP_KEY_COLUMNS = [
+    'vendor_id', 'pickup_datetime', 'pickup_longitude', 'pickup_latitude',
+    'dropoff_longitude', 'dropoff_latitude', 'trip_duration'
+]
+
+# Bytes just before a watermark whose digest must match for the file to count as appended to
+TAIL_BYTES = 4096
+
+# Driver keys looked up per query
+LOOKUP_BATCH = 500
+
+UPSERT_SOURCE_SQL = '''
+    INSERT INTO ingest_sources
+    (source, offset, size, mtime_ns, tail_sha256, rows, last_pickup, last_trip_id, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(source) DO UPDATE SET
+        offset = excluded.offset,
+        size = excluded.size,
+        mtime_ns = excluded.mtime_ns,
+        tail_sha256 = excluded.tail_sha256,
+        rows = excluded.rows,
+        last_pickup = excluded.last_pickup,
+        last_trip_id = excluded.last_trip_id,
+        updated_at = excluded.updated_at
+'''
+
+UPSERT_DRIVER_STATS_SQL = '''
+    INSERT INTO driver_trip_stats
+    (trip_key, driver_id, total_trips, passengers, duration, distance)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(trip_key) DO UPDATE SET
+        driver_id = excluded.driver_id,
+        total_trips = excluded.total_trips,
+        passengers = excluded.passengers,
+        duration = excluded.duration,
+        distance = excluded.distance
+'''
+
+UPSERT_STATE_SQL = '''
+    INSERT INTO ingest_state (name, value) VALUES (?, ?)
+    ON CONFLICT(name) DO UPDATE SET value = excluded.value
+'''
+
+def trip_hashes(df):
+    """Signed 64-bit hash of each trip's id, or of its key columns when the source has no ids"""
+    if TRIP_ID_COLUMN in df.columns:
+        keys = df[[TRIP_ID_COLUMN]].astype(str)
+    else:
+        # Same hash whether columns came in parsed and downcast or as read
+        keys = df[[column for column in TRIP_KEY_COLUMNS if column in df.columns]].copy()
+        for column in keys.columns:
+            if column == 'pickup_datetime':
+                keys[column] = pd.to_datetime(keys[column]).astype('datetime64[ns]')
+            else:
+                keys[column] = keys[column].astype('float64')
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy().view(np.int64)
+
+def trip_key_text(key):
+    """Stable text form of a driver key (a scalar or a tuple for multi-column keys)"""
+    values = key if isinstance(key, tuple) else (key,)
+    return json.dumps([value.item() if hasattr(value, 'item') else value for value in values])
+
+def source_files(path):
+    """The CSV files of a source: the file itself, or a directory's *.csv in name order"""
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, '*.csv')))
+    return [path]
+
+def complete_size(path):
+    """Bytes up to and including the last newline, so a line still being appended is left for later"""
+    with open(path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - 65536)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            position = start
+        return 0
+
+def tail_digest(path, offset):
+    with open(path, 'rb') as f:
+        f.seek(max(0, offset - TAIL_BYTES))
+        return hashlib.sha256(f.read(min(offset, TAIL_BYTES))).hexdigest()
+
+def read_header(path):
+    with open(path, newline='') as f:
+        return next(csv.reader(f))
+
+class ByteRange(io.RawIOBase):
+    """Read-only view of bytes [start, end) of a file"""
+    def __init__(self, path, start, end):
+        self.file = open(path, 'rb')
+        self.file.seek(start)
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.remaining)
+        if size <= 0:
+            return 0
+        read = self.file.readinto(memoryview(buffer)[:size])
+        self.remaining -= read
+        return read
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+def open_range(path, start, end):
+    return io.BufferedReader(ByteRange(path, start, end), buffer_size=1024 * 1024)
+
+class TripIndex:
+    """Hashes of the ingested trips, for dropping duplicates.
+
+    The history lives in the ingested_trips table. The trips a run keeps
+    (its cleaned rows, whichever path they came from) are written to the
+    ingest_run_trips table one chunk at a time, so nothing grows in memory,
+    and each chunk is checked against both tables through a temporary table
+    joined on their keys. The run's hashes move into ingested_trips in the
+    transaction that commits the run, so a failed or cancelled run leaves
+    the index as it was. With replace=True (a full re-ingest) the stored
+    hashes are ignored and replaced at that point.
+    """
+    def __init__(self, db, replace=False):
+        self.db = db
+        self.replace = replace
+        self.duplicates = 0
+        self.recorded = 0
+        # Whatever an interrupted run left behind
+        self.db.execute_query('DELETE FROM ingest_run_trips')
+
+    def new_rows(self, df):
+        """Rows of a raw trip chunk not ingested before, first occurrences only, with a trip_hash column.
+
+        Pass the chunk's rows that survive cleaning to record().
+        """
+        hashes = trip_hashes(df)
+        keep = ~pd.Series(hashes).duplicated().to_numpy()
+        keep &= ~self.seen(hashes)
+
+        self.duplicates += int(len(df) - keep.sum())
+        df = df[keep].assign(trip_hash=hashes[keep])
+        return df.drop(columns=[TRIP_ID_COLUMN]) if TRIP_ID_COLUMN in df.columns else df
+
+    def record(self, hashes):
+        """Note kept trips in this run's index, in one transaction per chunk"""
+        # Sorted, so the inserts walk the primary key B-tree in order
+        hashes = np.sort(np.asarray(hashes, dtype=np.int64))
+        if len(hashes):
+            self.db.execute_many('INSERT OR IGNORE INTO ingest_run_trips (trip_hash) VALUES (?)',
+                                 ((value,) for value in hashes.tolist()))
+            self.recorded += len(hashes)
+
+    def seen(self, hashes):
+        """Which hashes this run has kept already, or (unless replacing) an earlier run has"""
+        tables = ['ingest_run_trips'] if self.replace else ['ingest_run_trips', 'ingested_trips']
+        with self.db.connection() as conn:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS chunk_trips (trip_hash INTEGER PRIMARY KEY)')
+            conn.executemany('INSERT OR IGNORE INTO chunk_trips (trip_hash) VALUES (?)',
+                             ((value,) for value in hashes.tolist()))
+            found = [row[0] for table in tables for row in conn.execute(
+                f'SELECT trip_hash FROM chunk_trips JOIN {table} USING (trip_hash)')]
+            # The temp rows go with the rollback when the connection is returned
+        return np.isin(hashes, np.array(found, dtype=np.int64))
+
+    def count(self):
+        return self.recorded
+
+    def statements(self):
+        statements = [('DELETE FROM ingested_trips', [()])] if self.replace else []
+        statements += [
+            ('INSERT OR IGNORE INTO ingested_trips (trip_hash) SELECT trip_hash FROM ingest_run_trips', [()]),
+            ('DELETE FROM ingest_run_trips', [()])
+        ]
+        return statements
+
+class IngestState:
+    """What an ingest leaves for the next incremental run to continue from.
+
+    Holds the trip index, a watermark per source file, the running pickup
+    coordinate statistics behind the outlier filter and the per driver key
+    trip sums behind each profile. A full ingest (replace=True) starts empty
+    and replaces what is stored; an incremental one loads it and adds to it.
+    statements() returns the writes to commit along with the drivers.
+    """
+    def __init__(self, db, replace=False):
+        self.db = db
+        self.replace = replace
+        self.trips = TripIndex(db, replace)
+        self.sources = {} if replace else {
+            row['source']: dict(row) for row in db.execute_query('SELECT * FROM ingest_sources')
+        }
+        self.coordinates = None if replace else self.load_value('coordinates')
+        self.driver_rows = []
+
+    def load_value(self, name):
+        rows = self.db.execute_query('SELECT value FROM ingest_state WHERE name = ?', [name])
+        return json.loads(rows[0]['value']) if rows else None
+
+    def pending_ranges(self, source_path):
+        """(path, start, end) byte ranges of the source not ingested yet"""
+        ranges = []
+        for path in source_files(source_path):
+            end = complete_size(path)
+            mark = self.sources.get(os.path.abspath(path))
+            start = 0
+            if mark is not None:
+                if mark['offset'] <= end and tail_digest(path, mark['offset']) == mark['tail_sha256']:
+                    start = mark['offset']
+                else:
+                    print(f"{path} changed before its watermark, reading it again from the start")
+                    mark['rows'] = 0
+            if end > start:
+                ranges.append((path, start, end))
+        return ranges
+
+    def observe(self, path, chunk):
+        """Note a raw chunk read from path for its watermark"""
+        mark = self.sources.setdefault(os.path.abspath(path), {'rows': 0, 'last_pickup': None, 'last_trip_id': None})
+        mark['rows'] += len(chunk)
+        if len(chunk):
+            last_pickup = str(pd.to_datetime(chunk['pickup_datetime']).max())
+            mark['last_pickup'] = max(last_pickup, mark['last_pickup'] or last_pickup)
+            if TRIP_ID_COLUMN in chunk.columns:
+                mark['last_trip_id'] = str(chunk[TRIP_ID_COLUMN].iloc[-1])
+
+    def advance(self, path, end):
+        """Move path's watermark to end once everything before it has been read"""
+        mark = self.sources.setdefault(os.path.abspath(path), {'rows': 0, 'last_pickup': None, 'last_trip_id': None})
+        stat = os.stat(path)
+        mark.update(offset=end, size=stat.st_size, mtime_ns=stat.st_mtime_ns, tail_sha256=tail_digest(path, end))
+
+    def stored_driver_stats(self, keys):
+        """{trip_key: stored row} for the given driver key texts, with the profile's rating and vehicle type"""
+        stored = {}
+        for i in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[i:i + LOOKUP_BATCH]
+            rows = self.db.execute_query(
+                "SELECT s.*, d.rating, d.vehicle_type FROM driver_trip_stats s "
+                "LEFT JOIN drivers d ON d.driver_id = s.driver_id "
+                f"WHERE s.trip_key IN ({','.join('?' * len(batch))})", batch)
+            stored.update((row['trip_key'], dict(row)) for row in rows)
+        return stored
+
+    def mapped_drivers(self):
+        return self.db.execute_query(
+            'SELECT COUNT(*) FROM driver_trip_stats WHERE driver_id IS NOT NULL')[0][0]
+
+    def set_driver_stats(self, driver_stats, driver_ids):
+        """Rows to store for {driver key: sums}, with driver ids from {key text: driver_id}"""
+        for key, sums in driver_stats.items():
+            text = trip_key_text(key)
+            self.driver_rows.append((
+                text, driver_ids.get(text), sums['total_trips'], sums['passengers'],
+                sums['duration'], sums['distance']
+            ))
+
+    def statements(self, coordinates):
+        now = datetime.now().isoformat()
+        statements = self.trips.statements()
+        if self.replace:
+            statements += [
+                ('DELETE FROM ingest_sources', [()]),
+                ('DELETE FROM driver_trip_stats', [()])
+            ]
+        statements += [
+            (UPSERT_SOURCE_SQL, [
+                (source, mark['offset'], mark['size'], mark['mtime_ns'], mark['tail_sha256'],
+                 mark['rows'], mark['last_pickup'], mark['last_trip_id'], now)
+                for source, mark in self.sources.items() if 'offset' in mark
+            ]),
+            (UPSERT_DRIVER_STATS_SQL, self.driver_rows),
+            (UPSERT_STATE_SQL, [('coordinates', json.dumps(coordinates))])
+        ]
+        return statements
@@ -0,0 +1,183 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: the in-process lock still applies
+    fcntl = None
+
+from Backend import metrics
+
+MAX_FINISHED_JOBS = 20
+
+JOBS_TOTAL = metrics.counter('ingest_jobs_total', 'Finished ingest jobs by outcome', ['status'])
+
+class JobConflict(Exception):
+    """Raised when an ingest is submitted while another one is still running"""
+
+class IngestJob:
+    """One background ingest run and its outcome"""
+    def __init__(self, mode, params):
+        self.id = uuid.uuid4().hex
+        self.mode = mode
+        self.params = params
+        self.status = 'queued'
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.start_time = None
+        self.elapsed = None
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.progress = {}
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    def to_dict(self):
+        if self.elapsed is not None:
+            elapsed = self.elapsed
+        elif self.start_time is not None:
+            elapsed = time.perf_counter() - self.start_time
+        else:
+            elapsed = 0.0
+        progress = dict(self.progress)
+
+        return {
+            'job_id': self.id,
+            'mode': self.mode,
+            'params': self.params,
+            'status': self.status,
+            'cancel_requested': self.cancel_event.is_set(),
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(progress.get('rows_read', 0) / elapsed) if elapsed > 0 else 0,
+            'progress': progress,
+            'result': self.result,
+            'error': self.error
+        }
+
+class JobRunner:
+    """Runs ingests one at a time on a background thread.
+
+    Submitting returns immediately with the job; its progress is read from the
+    processor while it runs. The processor comes from load_processor, called
+    on the first submit so the ingest stack is only imported when needed. A second submit while one is active raises
+    JobConflict. If lock_path is given, an exclusive file lock also keeps
+    other server processes sharing the database from ingesting concurrently.
+    Readers keep seeing the previous data until the ingest commits, because
+    drivers are written in a single WAL transaction.
+    """
+    def __init__(self, load_processor, lock_path=None):
+        self.load_processor = load_processor
+        self.processor = None
+        self.lock_path = lock_path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest')
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+        self.active_job = None
+
+    def submit(self, mode, csv_path, **params):
+        with self.lock:
+            if self.active_job is not None and self.active_job.active:
+                raise JobConflict(f'Ingest {self.active_job.id} is already running')
+            if self.processor is None:
+                self.processor = self.load_processor()
+            lock_file = self.acquire_file_lock()
+
+            job = IngestJob(mode, dict(params, csv_path=csv_path))
+            self.jobs[job.id] = job
+            self.active_job = job
+            self.prune()
+
+        self.executor.submit(self.run, job, csv_path, params, lock_file)
+        return job
+
+    def run(self, job, csv_path, params, lock_file):
+        job.status = 'running'
+        job.started_at = datetime.now().isoformat()
+        job.start_time = time.perf_counter()
+        status, error = 'failed', None
+        try:
+            if job.mode == 'streaming':
+                run = self.processor.process_nyc_data_streaming
+            elif job.mode == 'incremental':
+                run = self.processor.process_nyc_data_incremental
+            else:
+                run = self.processor.process_nyc_data
+            # Progress from the previous run must not show up under this job
+            self.processor.progress = self.processor.new_progress('starting')
+            result = run(csv_path, cancel_event=job.cancel_event, **params)
+            job.progress = self.processor.progress
+
+            job.result = result
+            if result['success']:
+                status = 'succeeded'
+            elif result.get('cancelled'):
+                status = 'cancelled'
+            else:
+                error = result['error']
+        except Exception as e:
+            error = str(e)
+        finally:
+            # The lock goes and the timing is stamped before the job stops
+            # looking active, so whoever waits on it can start the next one
+            self.release_file_lock(lock_file)
+            job.elapsed = time.perf_counter() - job.start_time
+            job.finished_at = datetime.now().isoformat()
+            job.progress = dict(job.progress)
+            job.error = error
+            job.status = status
+            JOBS_TOTAL.inc(status=status)
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None and job is self.active_job and job.status == 'running':
+            job.progress = self.processor.progress
+        return job
+
+    def latest(self):
+        """The running job, or the most recent one if none is running"""
+        return self.get(self.active_job.id) if self.active_job is not None else None
+
+    def cancel(self, job_id):
+        """Ask a job to stop at its next chunk boundary; False if it is unknown or finished"""
+        job = self.jobs.get(job_id)
+        if job is None or not job.active:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def acquire_file_lock(self):
+        if self.lock_path is None or fcntl is None:
+            return None
+        lock_file = open(self.lock_path, 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise JobConflict('An ingest is already running in another process')
+        return lock_file
+
+    def release_file_lock(self, lock_file):
+        if lock_file is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def shutdown(self, cancel=True):
+        if cancel and self.active_job is not None:
+            self.active_job.cancel_event.set()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,177 @@
+import atexit
+import threading
+import time
+from datetime import datetime, timedelta
+from Backend import metrics
+
+# Flush once this many drivers have pending positions...
+DEFAULT_MAX_PENDING = 5000
+
+# ...or once the oldest pending ping has waited this many seconds
+DEFAULT_FLUSH_INTERVAL = 0.5
+
+# Client clocks may run this far ahead of ours; later timestamps are rejected
+MAX_FUTURE_SKEW = timedelta(seconds=60)
+
+PINGS_TOTAL = metrics.counter(
+    'location_pings_total', 'Location pings received by outcome', ['outcome'])
+FLUSH_SECONDS = metrics.histogram(
+    'location_flush_duration_seconds', 'Time spent writing one coalesced batch of locations')
+PENDING_DRIVERS = metrics.gauge(
+    'location_buffer_pending', 'Drivers with a buffered position not yet written')
+
+def normalize_timestamp(value, received_at):
+    """A client timestamp as naive local isoformat() text, like the rest of last_update.
+
+    Offsets (including a trailing Z) are converted to local time, and times
+    more than MAX_FUTURE_SKEW past received_at are rejected, since they would
+    keep a driver live and win every freshness comparison.
+    """
+    text = str(value)
+    if text.endswith(('Z', 'z')):
+        text = text[:-1] + '+00:00'
+    timestamp = datetime.fromisoformat(text)  # rejects malformed client timestamps
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    if timestamp > received_at + MAX_FUTURE_SKEW:
+        raise ValueError(f'Timestamp {value!r} is in the future')
+    return timestamp.isoformat()
+
+def parse_ping(ping, received_at):
+    """Location row from one ping, either a dict or a [driver_id, lat, lng, available, eta] list"""
+    if isinstance(ping, dict):
+        driver_id = ping['driver_id']
+        latitude = ping.get('lat', ping.get('latitude'))
+        longitude = ping.get('lng', ping.get('longitude'))
+        available = ping.get('available', True)
+        eta = ping.get('eta', ping.get('eta_minutes', 5))
+        timestamp = ping.get('timestamp')
+    else:
+        driver_id, latitude, longitude, available, eta = ping[:5]
+        timestamp = ping[5] if len(ping) > 5 else None
+
+    last_update = normalize_timestamp(timestamp, received_at) if timestamp else received_at.isoformat()
+    latitude = float(latitude)
+    longitude = float(longitude)
+    if not driver_id or not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise ValueError(f'Invalid ping for driver {driver_id!r}')
+    return (str(driver_id), latitude, longitude, 1 if available else 0, int(eta), last_update)
+
+class LocationBuffer:
+    """Coalescing write-behind buffer for live driver location pings.
+
+    Only the newest position per driver is kept between flushes, so a driver
+    pinging every second costs one row per flush rather than one per ping.
+    A background thread writes pending positions in a single transaction
+    whenever max_pending drivers are waiting or flush_interval has passed.
+    With WAL, availability readers are never blocked by these writes.
+    """
+    def __init__(self, db, max_pending=DEFAULT_MAX_PENDING, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.db = db
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.pending = {}  # driver_id -> location row
+        self.lock = threading.Lock()
+        self.wake = threading.Condition(self.lock)
+        self.write_lock = threading.Lock()  # one flush at a time keeps rows in order
+        self.thread = None
+        self.stopped = False
+        self.stats = {'received': 0, 'rejected': 0, 'coalesced': 0, 'written': 0, 'flushes': 0}
+
+    def add(self, pings):
+        """Buffer a batch of pings; returns (accepted, rejected) counts"""
+        received_at = datetime.now()
+        rows = []
+        rejected = 0
+        for ping in pings:
+            try:
+                rows.append(parse_ping(ping, received_at))
+            except (KeyError, IndexError, TypeError, ValueError):
+                rejected += 1
+
+        with self.lock:
+            self.start()
+            coalesced = 0
+            for row in rows:
+                previous = self.pending.get(row[0])
+                if previous is not None:
+                    coalesced += 1
+                    if previous[5] > row[5]:
+                        continue  # an out-of-order ping older than what is queued
+                self.pending[row[0]] = row
+            self.stats['received'] += len(rows)
+            self.stats['rejected'] += rejected
+            self.stats['coalesced'] += coalesced
+            PENDING_DRIVERS.set(len(self.pending))
+            if len(self.pending) >= self.max_pending:
+                self.wake.notify()
+
+        PINGS_TOTAL.inc(len(rows) - coalesced, outcome='buffered')
+        PINGS_TOTAL.inc(coalesced, outcome='coalesced')
+        PINGS_TOTAL.inc(rejected, outcome='rejected')
+        return len(rows), rejected
+
+    def flush(self):
+        """Write every pending position now; returns the number of rows written"""
+        with self.write_lock:
+            with self.lock:
+                rows = list(self.pending.values())
+                self.pending = {}
+                PENDING_DRIVERS.set(0)
+            if not rows:
+                return 0
+
+            try:
+                with FLUSH_SECONDS.time():
+                    self.db.insert_locations(rows)
+            except Exception:
+                # Requeue for the next flush unless a newer ping arrived meanwhile
+                with self.lock:
+                    for row in rows:
+                        self.pending.setdefault(row[0], row)
+                    PENDING_DRIVERS.set(len(self.pending))
+                raise
+            with self.lock:
+                self.stats['written'] += len(rows)
+                self.stats['flushes'] += 1
+            return len(rows)
+
+    def start(self):
+        """Start the flusher thread on first use (caller holds self.lock)"""
+        if self.thread is None and not self.stopped:
+            self.thread = threading.Thread(target=self.run, name='location-flusher', daemon=True)
+            self.thread.start()
+            atexit.register(self.stop)
+
+    def run(self):
+        while True:
+            with self.lock:
+                deadline = time.monotonic() + self.flush_interval
+                while not self.stopped and len(self.pending) < self.max_pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.wake.wait(remaining)
+                stopped = self.stopped
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing driver locations: {e}")
+                time.sleep(self.flush_interval)
+            if stopped:
+                return
+
+    def stop(self):
+        """Flush what is left and stop the flusher thread"""
+        with self.lock:
+            self.stopped = True
+            self.wake.notify()
+            thread = self.thread
+        if thread is not None:
+            thread.join()
+        else:
+            self.flush()
+
+    def status(self):
+        with self.lock:
+            return dict(self.stats, pending=len(self.pending))
@@ -0,0 +1,134 @@
+import base64
+import gzip
+import hashlib
+import json
+import time
+from Backend import metrics
+
+# Optional speedups: brotli adds "br" encoding, msgpack the binary format, orjson faster JSON
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FORMATS = ('json', 'columns', 'msgpack')
+
+# Smaller bodies go out as they are
+MIN_COMPRESS_BYTES = 1024
+
+# Fast levels: most of the size win for a fraction of the CPU of the defaults
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+# Conditional requests revalidate at least this often, so drivers aging out
+# of the 30 minute window show up like they do through the availability cache
+ETAG_WINDOW_SECONDS = 30
+
+COMPRESSED_BYTES = metrics.counter(
+    'http_response_bytes_total', 'Response body bytes before and after compression', ['encoding', 'stage'])
+
+def dumps(value):
+    """JSON text of value, through orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, separators=(',', ':'))
+
+def packb(value):
+    if msgpack is None:
+        raise ValueError('format=msgpack needs the msgpack package installed')
+    return msgpack.packb(value)
+
+def check_format(name):
+    if name not in FORMATS:
+        raise ValueError(f"Unknown format '{name}', expected one of {', '.join(FORMATS)}")
+    if name == 'msgpack' and msgpack is None:
+        raise ValueError('format=msgpack needs the msgpack package installed')
+    return name
+
+def encode_cursor(distance, driver_id):
+    """Opaque cursor for the position after (distance, driver_id)"""
+    return base64.urlsafe_b64encode(json.dumps([distance, driver_id]).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        distance, driver_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return float(distance), str(driver_id)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+def page(store, rows, distances, cursor=None, page_size=None):
+    """The page of nearest-first rows after cursor, and the cursor of the next page (None on the last).
+
+    Pages are keyed on (distance, driver_id) rather than an offset, so
+    drivers moving between polls don't shift the pages after them, and any
+    worker can serve the next page.
+    """
+    if cursor is not None:
+        distance, driver_id = decode_cursor(cursor)
+        after = distances > distance
+        ties = distances == distance
+        if ties.any():
+            after[ties] = [other > driver_id for other in store.ids(rows[ties])]
+        rows, distances = rows[after], distances[after]
+    if page_size is None or len(rows) <= page_size:
+        return rows, distances, None
+
+    # Drivers at exactly the same distance are ordered by id, like the cursor
+    end = page_size
+    while end < len(rows) and distances[end] == distances[page_size - 1]:
+        end += 1
+    start = page_size - 1
+    while start > 0 and distances[start - 1] == distances[page_size - 1]:
+        start -= 1
+    if end - start > 1:
+        order = sorted(range(start, end), key=lambda i: store.driver_ids[rows[i]])
+        rows = rows.copy()
+        distances = distances.copy()
+        rows[start:end] = rows[order]
+        distances[start:end] = distances[order]
+
+    last = page_size - 1
+    return rows[:page_size], distances[:page_size], encode_cursor(float(distances[last]), store.driver_ids[rows[last]])
+
+def snapshot_etag(*versions):
+    """Weak ETag over what a response was built from and the current revalidation window"""
+    digest = hashlib.blake2b(digest_size=12)
+    for version in versions + (int(time.time() // ETAG_WINDOW_SECONDS),):
+        digest.update(repr(version).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def compress(response, accept_encodings):
+    """Compress a finished response with the best encoding the client accepts (br, then gzip)"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_BYTES:
+        return response
+
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    encoding = accept_encodings.best_match(encodings)
+    if encoding is None:
+        return response
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+    COMPRESSED_BYTES.inc(len(body), encoding=encoding, stage='in')
+    COMPRESSED_BYTES.inc(len(compressed), encoding=encoding, stage='out')
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
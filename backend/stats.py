@@ -0,0 +1,156 @@
+import heapq
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+# Drivers whose latest position is older than this are not counted as live
+AVAILABILITY_WINDOW_MINUTES = 30
+
+# How old (in seconds) a served summary may be before the aggregator catches up
+DEFAULT_MAX_STALENESS = 2.0
+
+# Rebuild from driver_current_locations this often to pick up deletes
+DEFAULT_RESYNC_INTERVAL = 300.0
+
+# Hours [start, end) covered by each time_range filter of the availability search
+TIME_RANGES = {
+    'all': (0, 24),
+    'morning': (6, 12),
+    'afternoon': (12, 18),
+    'evening': (18, 24),
+    'night': (0, 6)
+}
+
+def time_slot(day='', time_range='all'):
+    """[start, end) last_update strings for a date (YYYY-MM-DD, default today) and time_range"""
+    if time_range not in TIME_RANGES:
+        raise ValueError(f"Unknown time_range '{time_range}', expected one of {', '.join(TIME_RANGES)}")
+    day = date.fromisoformat(day) if day else date.today()
+    start_hour, end_hour = TIME_RANGES[time_range]
+    start = datetime.combine(day, datetime.min.time()) + timedelta(hours=start_hour)
+    end = datetime.combine(day, datetime.min.time()) + timedelta(hours=end_hour)
+    return start.isoformat(), end.isoformat()
+
+def window_cutoff(now=None):
+    """The timestamp string SQLite's datetime('now', '-30 minutes') evaluates to"""
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - timedelta(minutes=AVAILABILITY_WINDOW_MINUTES)
+    return cutoff.strftime('%Y-%m-%d %H:%M:%S')
+
+class StatsAggregator:
+    """Dashboard summary stats kept in memory and maintained incrementally.
+
+    Each refresh reads only the driver_locations rows appended since the
+    previous one (driver_locations.id is a monotonic change log), so it sees
+    writes from every process. Drivers expire from the counts as they age out
+    of the availability window. The returned values match the SQL aggregates
+    over driver_current_locations.
+    """
+    def __init__(self, db, max_staleness=DEFAULT_MAX_STALENESS, resync_interval=DEFAULT_RESYNC_INTERVAL):
+        self.db = db
+        self.max_staleness = max_staleness
+        self.resync_interval = resync_interval
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.entries = {}  # driver_id -> (last_update, is_available, eta_minutes)
+        self.expiry = []  # heap of (last_update, driver_id), stale pairs skipped lazily
+        self.total_drivers = 0
+        self.available_drivers = 0
+        self.eta_sum = 0
+        self.eta_count = 0
+        self.cursor = None
+        self.refreshed_at = None
+        self.synced_at = None
+
+    def summary(self):
+        """Current dashboard stats, at most max_staleness seconds behind the database"""
+        with self.lock:
+            now = time.monotonic()
+            if self.synced_at is None or now - self.synced_at >= self.resync_interval:
+                self.refresh(full=True)
+            elif now - self.refreshed_at >= self.max_staleness:
+                self.refresh()
+            self.expire(window_cutoff())
+
+            total_drivers = self.total_drivers
+            available_drivers = self.available_drivers
+            avg_eta = self.eta_sum / self.eta_count if self.eta_count else None
+
+        return {
+            'total_drivers': total_drivers,
+            'available_drivers': available_drivers,
+            'avg_eta_minutes': round(avg_eta or 6.5, 1),
+            'coverage_percentage': round((available_drivers / total_drivers * 100) if total_drivers > 0 else 0, 1)
+        }
+
+    def refresh(self, full=False):
+        """Apply location rows written since the last refresh (or rebuild with full=True)"""
+        with self.db.connection() as conn:
+            # One read snapshot for the change cursor and the rows behind it
+            conn.execute('BEGIN')
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM driver_locations').fetchone()[0]
+
+            if full or self.cursor is None or last_id < self.cursor:
+                self.reset()
+                rows = conn.execute("""
+                    SELECT driver_id, is_available, eta_minutes, last_update
+                    FROM driver_current_locations
+                    WHERE last_update >= datetime('now', '-30 minutes')
+                """)
+                self.synced_at = time.monotonic()
+            else:
+                rows = conn.execute("""
+                    SELECT driver_id, is_available, eta_minutes, last_update
+                    FROM driver_locations
+                    WHERE id > ?
+                    ORDER BY id
+                """, [self.cursor])
+
+            cutoff = window_cutoff()
+            for row in rows:
+                self.apply(row['driver_id'], row['last_update'], row['is_available'], row['eta_minutes'], cutoff)
+
+            self.total_drivers = conn.execute('SELECT COUNT(*) FROM drivers').fetchone()[0]
+            self.cursor = last_id
+            self.refreshed_at = time.monotonic()
+
+    def apply(self, driver_id, last_update, is_available, eta_minutes, cutoff):
+        """Fold one location update in, mirroring trg_locations_current"""
+        if last_update is None or last_update < cutoff:
+            return
+
+        current = self.entries.get(driver_id)
+        if current is not None:
+            if last_update < current[0]:
+                return
+            self.remove(current)
+
+        entry = (last_update, is_available == 1, eta_minutes)
+        self.entries[driver_id] = entry
+        self.available_drivers += entry[1]
+        if eta_minutes is not None:
+            self.eta_sum += eta_minutes
+            self.eta_count += 1
+        heapq.heappush(self.expiry, (last_update, driver_id))
+
+        # Superseded heap pairs are skipped lazily; rebuild before they pile up
+        if len(self.expiry) > 2 * len(self.entries) + 1024:
+            self.expiry = [(entry[0], key) for key, entry in self.entries.items()]
+            heapq.heapify(self.expiry)
+
+    def remove(self, entry):
+        self.available_drivers -= entry[1]
+        if entry[2] is not None:
+            self.eta_sum -= entry[2]
+            self.eta_count -= 1
+
+    def expire(self, cutoff):
+        """Drop drivers whose latest position fell out of the availability window"""
+        while self.expiry and self.expiry[0][0] < cutoff:
+            last_update, driver_id = heapq.heappop(self.expiry)
+            entry = self.entries.get(driver_id)
+            if entry is not None and entry[0] == last_update:
+                self.remove(entry)
+                del self.entries[driver_id]
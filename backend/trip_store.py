@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import shutil
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+class TripStore:
+    """Cleaned trips persisted as a Parquet dataset partitioned by pickup date.
+
+    The store remembers the size, mtime and SHA-256 of the CSV it was built
+    from, so reprocessing an unchanged source can skip the CSV parse and the
+    cleaning pass entirely. Readers can select just the columns and pickup
+    dates they need.
+    """
+    def __init__(self, root='trip_store'):
+        self.root = root
+        self.data_dir = os.path.join(root, 'data')
+        self.staging_dir = os.path.join(root, 'staging')
+        self.manifest_path = os.path.join(root, 'manifest.json')
+
+    def fingerprint(self, csv_path, with_hash=True):
+        """Identify a source file by size, mtime and (optionally) content hash"""
+        stat = os.stat(csv_path)
+        fingerprint = {
+            'source': os.path.abspath(csv_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns
+        }
+        if with_hash:
+            digest = hashlib.sha256()
+            with open(csv_path, 'rb') as f:
+                for block in iter(lambda: f.read(8 * 1024 * 1024), b''):
+                    digest.update(block)
+            fingerprint['sha256'] = digest.hexdigest()
+        return fingerprint
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_current(self, csv_path):
+        """True if the store was built from exactly this version of csv_path"""
+        manifest = self.load_manifest()
+        if manifest is None or not os.path.isdir(self.data_dir):
+            return False
+
+        # Size and mtime are free to check; only hash the file if they match
+        quick = self.fingerprint(csv_path, with_hash=False)
+        if any(manifest.get(key) != value for key, value in quick.items()):
+            return False
+        return manifest.get('sha256') == self.fingerprint(csv_path)['sha256']
+
+    def write(self, chunks, csv_path):
+        """Replace the store with the cleaned trip chunks built from csv_path.
+
+        Chunks are written to a staging directory as they arrive and swapped in
+        at the end, so readers keep seeing the previous dataset until then.
+        Returns the number of rows written.
+        """
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        os.makedirs(self.staging_dir)
+
+        rows = 0
+        for number, chunk in enumerate(chunks):
+            if len(chunk) == 0:
+                continue
+            chunk.to_parquet(
+                self.staging_dir,
+                partition_cols=['pickup_date'],
+                index=False,
+                basename_template=f'chunk-{number:06d}-{{i}}.parquet'
+            )
+            rows += len(chunk)
+
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+        os.replace(self.staging_dir, self.data_dir)
+
+        manifest = self.fingerprint(csv_path)
+        manifest['rows'] = rows
+        with open(self.manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+        return rows
+
+    def dataset(self):
+        # Memory-map the Parquet files so repeated reads come from the page cache
+        return ds.dataset(
+            self.data_dir,
+            format='parquet',
+            partitioning='hive',
+            filesystem=fs.LocalFileSystem(use_mmap=True)
+        )
+
+    def columns(self):
+        return self.dataset().schema.names
+
+    def date_filter(self, start_date=None, end_date=None):
+        """Partition filter for an inclusive YYYY-MM-DD pickup date range"""
+        condition = None
+        if start_date:
+            condition = ds.field('pickup_date') >= start_date
+        if end_date:
+            upper = ds.field('pickup_date') <= end_date
+            condition = upper if condition is None else condition & upper
+        return condition
+
+    def read(self, columns=None, start_date=None, end_date=None):
+        """Load the requested columns for trips in the pickup date range"""
+        table = self.dataset().to_table(columns=columns, filter=self.date_filter(start_date, end_date))
+        return table.to_pandas()
+
+    def iter_batches(self, columns=None, start_date=None, end_date=None, batch_size=250000):
+        """Yield the requested columns as DataFrames of at most batch_size rows.
+
+        Each date partition is its own small fragment, so record batches are
+        combined up to batch_size rows rather than yielded one per day.
+        """
+        batches = self.dataset().to_batches(
+            columns=columns,
+            filter=self.date_filter(start_date, end_date),
+            batch_size=batch_size
+        )
+        pending, rows = [], 0
+        for batch in batches:
+            while len(batch):
+                part = batch.slice(0, batch_size - rows)
+                batch = batch.slice(len(part))
+                pending.append(part)
+                rows += len(part)
+                if rows == batch_size:
+                    yield pa.Table.from_batches(pending).to_pandas()
+                    pending, rows = [], 0
+        if rows:
+            yield pa.Table.from_batches(pending).to_pandas()